@@ -0,0 +1,122 @@
+"""
+批量生成路由
+一次上传多个文件或ZIP压缩包，以 NDJSON 逐行推送每个文件的结果
+"""
+
+import os
+import json
+import logging
+from typing import AsyncIterator, List
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+from ..core.batch import (
+    BATCH_MAX_BYTES,
+    BATCH_MAX_FILES,
+    BATCH_MAX_MB,
+    BatchItem,
+    expand_archive,
+    remove_files,
+    run_batch,
+)
+from .routes import bind_client_id, _save_upload
+from .upload_limit import BatchUploadSizeLimitRoute
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 请求体按批次总大小限制，而不是单个文件的大小
+router = APIRouter(route_class=BatchUploadSizeLimitRoute, dependencies=[Depends(bind_client_id)])
+
+
+async def _save_batch(files: List[UploadFile]) -> List[BatchItem]:
+    """
+    将上传的文件逐个落盘，ZIP压缩包展开为其中的文件
+
+    Raises:
+        HTTPException: 当文件数或总大小超过限制、压缩包无效或单个文件超过大小限制时
+    """
+    items: List[BatchItem] = []
+    try:
+        for file in files:
+            saved = await _save_upload(file)
+            if os.path.splitext(file.filename)[1].lower() != '.zip':
+                items.append(BatchItem(len(items), file.filename, saved.path, saved.size, saved.upload_hash))
+                continue
+
+            try:
+                members = await run_in_threadpool(expand_archive, saved.path)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"{file.filename}: {e}")
+            finally:
+                os.unlink(saved.path)
+            first_index = len(items)
+            items.extend(member._replace(index=first_index + i) for i, member in enumerate(members))
+
+        if len(items) > BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"文件数超过{BATCH_MAX_FILES}个限制"
+            )
+        if sum(item.size for item in items) > BATCH_MAX_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"批量上传总大小超过{BATCH_MAX_MB}MB限制"
+            )
+        if not items:
+            raise HTTPException(
+                status_code=400,
+                detail="没有可处理的文件"
+            )
+    except BaseException:
+        remove_files(item.path for item in items)
+        raise
+
+    return items
+
+
+@router.post("/generate/batch", summary="批量生成思维导图（NDJSON）")
+async def create_mindmaps_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    combined: bool = Query(False)
+):
+    """
+    上传多个文件（或包含多个文件的ZIP压缩包），在进程池中并行解析，在全局限流下并发生成，
+    每完成一个文件即推送一行 JSON（application/x-ndjson）。
+
+    每行的 event 字段：file（单个文件的结果，status 为 ok 或 error）、
+    combined（combined=true 时的总览导图）、done（汇总）。单个文件失败不影响其他文件。
+
+    Args:
+        request: 请求对象，用于检测客户端断开
+        files: 上传的文件，ZIP压缩包会展开
+        combined: 为true时在全部文件完成后汇总生成一份总览导图
+
+    Raises:
+        HTTPException: 当文件数或总大小超过限制、压缩包无效时
+    """
+    items = await _save_batch(files)
+    logger.info(f"开始批量处理 {len(items)} 个文件")
+    paths = [item.path for item in items]
+
+    async def result_stream() -> AsyncIterator[str]:
+        try:
+            async for result in run_batch(items, combined):
+                if await request.is_disconnected():
+                    logger.info("客户端已断开，停止批量处理")
+                    break
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            remove_files(paths)
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # 流未开始即断开时同样删除临时文件
+        background=BackgroundTask(remove_files, paths)
+    )
@@ -0,0 +1,167 @@
+"""
+响应压缩
+根据 Accept-Encoding 协商 zstd / br / gzip，对较大的 JSON 与文本响应整体压缩；
+SSE / NDJSON 流、分段（206）响应和已编码的响应保持原样
+"""
+
+import os
+import gzip
+import logging
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+    logging.warning("brotli not installed, br response compression disabled")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    logging.warning("zstandard not installed, zstd response compression disabled")
+
+# 小于该字节数的响应不压缩
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+# 超过该字节数时在线程池中压缩，避免阻塞事件循环
+_THREADPOOL_THRESHOLD = 256 * 1024
+
+# 逐条推送的流式响应，缓冲后整体压缩会失去流式效果
+_STREAMING_TYPES = ("text/event-stream", "application/x-ndjson")
+
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+_ZSTD_LEVEL = 3
+
+
+def available_encodings() -> List[str]:
+    """按服务端偏好顺序返回可用的编码"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    根据 Accept-Encoding 选择编码
+
+    取客户端q值最高的可用编码，q值相同时按服务端偏好（zstd > br > gzip）。
+
+    Args:
+        accept_encoding: 请求头 Accept-Encoding 的值
+
+    Returns:
+        选中的编码，客户端不接受任何可用编码时返回None
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """使用指定编码压缩数据"""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=_GZIP_LEVEL)
+
+
+def _is_compressible(status: int, headers: Headers) -> bool:
+    if status == 206 or "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in _STREAMING_TYPES:
+        return False
+    return content_type.startswith("text/") or content_type.endswith("json")
+
+
+class CompressionMiddleware:
+    """
+    协商压缩的ASGI中间件
+
+    缓冲可压缩响应的完整响应体，达到最小大小时压缩并改写 Content-Length，
+    否则原样发送。
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+        chunks = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                if _is_compressible(message["status"], Headers(raw=message["headers"])):
+                    start_message = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+
+            if passthrough or start_message is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                if len(body) > _THREADPOOL_THRESHOLD:
+                    body = await run_in_threadpool(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                # 压缩后的字节与原始表示不同，强校验ETag降级为弱校验
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
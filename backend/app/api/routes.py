@@ -3,25 +3,265 @@ API路由模块
 定义所有的API端点
 """
 
+import os
+import re
+import json
+import hashlib
 import logging
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List
+import tempfile
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Tuple, AsyncIterator, NamedTuple, Optional, Literal, Union
 
 from ..models.schemas import (
     TextInput, 
     MindmapResponse, 
+    MindmapTreeData,
+    MindmapTreeResponse,
     FileUploadResponse, 
+    FileUploadTreeResponse,
     SupportedFormatsResponse,
-    ErrorResponse
+    JobCreatedResponse,
+    JobStatusResponse
 )
-from ..core.ai_processor import generate_mindmap_data
-from ..core.file_parser import parse_file_content, get_supported_formats
+from ..core.ai_processor import stream_mindmap_data
+from ..core.metrics import UPLOAD_READ_SECONDS, metrics_payload, timed
+from ..core.pipeline import PipelineContext, PipelineError, ingest, mindmap_pipeline, validate_text
+from ..core.rate_limiter import current_client_id, gemini_rate_limiter
+from ..core.file_parser import (
+    get_supported_formats,
+    MAX_FILE_SIZE_BYTES,
+    MAX_FILE_SIZE_MB
+)
+from ..core.jobs import job_manager, JobQueueFull, JOB_PENDING
+from ..core.text_store import parsed_text_store, text_store
+from .upload_limit import UploadSizeLimitRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 创建路由器
-router = APIRouter()
+async def bind_client_id(request: Request) -> None:
+    """
+    记录当前请求的客户端标识（优先使用 X-API-Key，其次为客户端IP），
+    Gemini 限流器据此在客户端之间公平排队
+
+    必须是 async 依赖：普通函数依赖在线程池中以上下文副本运行，设置的 ContextVar 不会传回请求处理函数
+    """
+    client_id = request.headers.get("x-api-key")
+    if not client_id:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            client_id = forwarded.split(",")[0].strip()
+        elif request.client is not None:
+            client_id = request.client.host
+    current_client_id.set(client_id or "anonymous")
+
+
+# 创建路由器（请求体超过上传大小限制时在接收过程中即返回413）
+router = APIRouter(route_class=UploadSizeLimitRoute, dependencies=[Depends(bind_client_id)])
+
+# 上传文件落盘时每次读取的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 单一字节范围：bytes=start-end / bytes=start- / bytes=-suffix
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# 上传文件的SHA-256十六进制摘要
+_UPLOAD_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class SavedUpload(NamedTuple):
+    """已落盘的上传文件"""
+    path: str
+    size: int
+    # 上传内容的SHA-256十六进制摘要
+    upload_hash: str
+
+
+def _validate_text_input(text_input: TextInput) -> None:
+    """
+    校验文本输入（提交后台任务时在入队前校验）
+    
+    Raises:
+        HTTPException: 当输入为空或超过长度限制时
+    """
+    try:
+        validate_text(text_input.text)
+    except PipelineError as e:
+        raise _http_error(e)
+
+
+async def _save_upload(file: UploadFile) -> SavedUpload:
+    """
+    分块读取上传内容并写入临时文件，边读边检查大小并计算SHA-256，避免整份文件驻留内存。
+    调用方负责在使用后删除临时文件。
+    
+    Args:
+        file: 上传的文件对象
+        
+    Returns:
+        临时文件路径、文件大小与内容哈希
+        
+    Raises:
+        HTTPException: 当文件名为空或文件超过大小限制时
+    """
+    # 验证文件
+    if not file.filename:
+        raise HTTPException(
+            status_code=400,
+            detail="文件名不能为空"
+        )
+    
+    logger.info(f"开始处理文件: {file.filename}")
+    
+    suffix = os.path.splitext(file.filename)[1].lower()
+    tmp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    hasher = hashlib.sha256()
+    try:
+        file_size = 0
+        with timed("upload", UPLOAD_READ_SECONDS):
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"文件大小超过{MAX_FILE_SIZE_MB}MB限制"
+                    )
+                hasher.update(chunk)
+                tmp_file.write(chunk)
+    except BaseException:
+        tmp_file.close()
+        os.unlink(tmp_file.name)
+        raise
+    
+    tmp_file.close()
+    logger.info(f"文件大小: {file_size} 字节")
+    return SavedUpload(tmp_file.name, file_size, hasher.hexdigest())
+
+
+def _validate_upload_hash(upload_hash: str) -> str:
+    """规范化并校验上传文件哈希（64位十六进制SHA-256）"""
+    upload_hash = upload_hash.strip().lower()
+    if not _UPLOAD_HASH_PATTERN.match(upload_hash):
+        raise HTTPException(
+            status_code=400,
+            detail="upload_hash 必须是64位十六进制的SHA-256摘要"
+        )
+    return upload_hash
+
+
+async def _ingest_upload(ctx: PipelineContext) -> None:
+    """
+    文件接口的 ingest 阶段：上传的文件分块落盘并计算哈希（流水线结束后删除临时文件）；
+    只提交 upload_hash 时校验哈希与文件名，由 parse 阶段查找已存储的解析结果
+    
+    Raises:
+        HTTPException: 当文件超过大小限制、哈希格式无效或缺少文件名时
+    """
+    file = ctx.source
+    if file is not None and file.filename:
+        saved = await _save_upload(file)
+        ctx.add_cleanup(lambda: os.unlink(saved.path))
+        ctx.filename = file.filename
+        ctx.file_path, ctx.file_size, ctx.upload_hash = saved.path, saved.size, saved.upload_hash
+    elif ctx.upload_hash:
+        if not ctx.filename:
+            raise HTTPException(
+                status_code=400,
+                detail="只提供 upload_hash 时必须同时提供 filename"
+            )
+        ctx.upload_hash = _validate_upload_hash(ctx.upload_hash)
+    await ingest(ctx)
+
+
+# 文件接口的流水线：ingest 阶段接收上传文件，其余阶段与文本接口相同
+file_pipeline = mindmap_pipeline.with_stage("ingest", _ingest_upload)
+
+
+def _http_error(e: PipelineError) -> HTTPException:
+    """将流水线错误转换为HTTP错误响应"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers=e.headers
+    )
+
+
+async def _run_pipeline(ctx: PipelineContext, until: Optional[str] = None) -> PipelineContext:
+    """
+    以文本或文件流水线处理请求
+    
+    Raises:
+        HTTPException: 输入无效或生成失败时
+    """
+    pipeline = file_pipeline if ctx.is_file else mindmap_pipeline
+    try:
+        return await pipeline.run(ctx, until=until)
+    except PipelineError as e:
+        raise _http_error(e)
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析 Range 请求头
+    
+    Args:
+        range_header: Range 请求头的值
+        size: 内容总字节数
+        
+    Returns:
+        (起始位置, 结束位置（不含）)；多段范围等不支持的形式返回None（按完整内容响应）
+        
+    Raises:
+        HTTPException: 范围无法满足时（416）
+    """
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    else:
+        start = max(size - int(last), 0)
+        end = size
+    
+    if start >= end:
+        raise HTTPException(
+            status_code=416,
+            detail="请求的范围无效",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+def _format_sse(event: str, data: dict) -> str:
+    """将事件编码为 server-sent events 格式"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(request: Request, ctx: PipelineContext) -> StreamingResponse:
+    """
+    将流式生成结果包装为 SSE 响应，客户端断开时停止读取，
+    stream_mindmap_data 会随之取消上游请求。流水线已执行到 normalize 阶段。
+    """
+    async def event_stream() -> AsyncIterator[str]:
+        async for event, data in stream_mindmap_data(ctx.prepared.text):
+            if await request.is_disconnected():
+                logger.info("客户端已断开，停止推送思维导图片段")
+                break
+            yield _format_sse(event, data)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **ctx.headers}
+    )
 
 
 @router.get("/", summary="服务根路径，用于健康检查")
@@ -30,48 +270,40 @@ def read_root():
     return {"message": "Text2Map Backend is running!", "status": "healthy"}
 
 
-@router.post("/generate", response_model=MindmapResponse, summary="从文本生成思维导图")
-def create_mindmap_from_text(text_input: TextInput):
+@router.post("/generate", response_model=Union[MindmapResponse, MindmapTreeResponse], summary="从文本生成思维导图")
+async def create_mindmap_from_text(
+    text_input: TextInput,
+    response: Response,
+    output_format: Literal["markdown", "tree"] = Query("markdown", alias="format"),
+    incremental: bool = Query(False)
+):
     """
     接收用户提交的文本，调用AI模型生成思维导图，并返回Markdown格式的结果。
     
     Args:
         text_input: 包含文本内容的数据模型
+        response: 响应对象，用于写入缓存命中情况（X-Cache 头）
+        output_format: markdown 返回Markdown文本；tree 返回扁平数组表示的树结构
+        incremental: 为true时按分节增量生成，只重新生成修改过的分节
         
     Returns:
-        生成的思维导图Markdown数据
+        生成的思维导图Markdown数据或树结构
         
     Raises:
         HTTPException: 当输入为空或AI处理失败时
     """
     try:
-        # 验证输入
-        if not text_input.text or text_input.text.isspace():
-            raise HTTPException(
-                status_code=400, 
-                detail="输入的文本不能为空"
-            )
-        
-        # 检查文本长度
-        if len(text_input.text) > 50000:  # 限制为50KB
-            raise HTTPException(
-                status_code=400,
-                detail="文本长度超过50KB限制"
-            )
-        
-        logger.info(f"开始处理文本输入，长度: {len(text_input.text)} 字符")
-        
-        # 调用AI处理
-        result = generate_mindmap_data(text_input.text)
-        
-        if result is None:
-            raise HTTPException(
-                status_code=500, 
-                detail="AI服务处理失败，请稍后再试"
-            )
+        ctx = await _run_pipeline(PipelineContext(
+            text=text_input.text,
+            incremental=incremental,
+            output_format=output_format
+        ))
+        response.headers.update(ctx.headers)
         
         logger.info("文本处理完成，成功生成思维导图")
-        return MindmapResponse(mindmap_data=result)
+        if output_format == "tree":
+            return MindmapTreeResponse(tree=MindmapTreeData(**ctx.tree))
+        return MindmapResponse(mindmap_data=ctx.mindmap)
         
     except HTTPException:
         raise
@@ -83,75 +315,79 @@ def create_mindmap_from_text(text_input: TextInput):
         )
 
 
-@router.post("/generate-from-file", response_model=FileUploadResponse, summary="从文件生成思维导图")
-def create_mindmap_from_file(file: UploadFile = File(...)):
+@router.post(
+    "/generate-from-file",
+    response_model=Union[FileUploadResponse, FileUploadTreeResponse],
+    summary="从文件生成思维导图"
+)
+async def create_mindmap_from_file(
+    response: Response,
+    file: Optional[UploadFile] = File(None),
+    upload_hash: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None),
+    output_format: Literal["markdown", "tree"] = Query("markdown", alias="format"),
+    include_text: bool = Query(False),
+    incremental: bool = Query(False)
+):
     """
     接收上传的文件，解析文件内容，调用AI模型生成思维导图。
     
+    提取的文本默认不随响应返回，只返回其内容哈希，客户端需要时通过
+    GET /texts/{text_hash} 按范围读取。相同内容的文件此前解析过时跳过解析
+    （X-Parse-Cache: HIT）；客户端可先用 HEAD /uploads/{upload_hash} 确认，
+    再只提交 upload_hash 与 filename 而不重新上传文件。
+    
     Args:
-        file: 上传的文件对象
+        response: 响应对象，用于写入缓存命中情况（X-Cache、X-Parse-Cache 头）
+        file: 上传的文件对象（提供 upload_hash 时可省略）
+        upload_hash: 上传文件的SHA-256十六进制摘要
+        filename: 只提交哈希时的原始文件名
+        output_format: markdown 返回Markdown文本；tree 返回扁平数组表示的树结构
+        include_text: 为true时在响应中附带完整的提取文本
+        incremental: 为true时按分节增量生成，只重新生成修改过的分节
         
     Returns:
-        包含思维导图数据、提取的文本、文件名和文件大小的响应
+        包含思维导图数据、提取文本的哈希、文件名和文件大小的响应
         
     Raises:
         HTTPException: 当文件格式不支持、解析失败或AI处理失败时
     """
     try:
-        # 验证文件
-        if not file.filename:
-            raise HTTPException(
-                status_code=400,
-                detail="文件名不能为空"
-            )
-        
-        logger.info(f"开始处理文件: {file.filename}")
-        
-        # 读取文件内容
-        file_content = file.file.read()
-        file_size = len(file_content)
+        ctx = await _run_pipeline(PipelineContext(
+            filename=filename,
+            upload_hash=upload_hash,
+            source=file,
+            incremental=incremental,
+            output_format=output_format
+        ))
+        response.headers.update(ctx.headers)
         
-        logger.info(f"文件大小: {file_size} 字节")
-        
-        # 解析文件内容
-        try:
-            extracted_text = parse_file_content(file.filename, file_content)
-            logger.info(f"文件解析成功，提取文本长度: {len(extracted_text)} 字符")
-        except ValueError as e:
-            raise HTTPException(
-                status_code=400,
-                detail=str(e)
-            )
-        except Exception as e:
-            logger.error(f"文件解析失败: {e}")
-            raise HTTPException(
-                status_code=500,
-                detail="文件解析失败，请检查文件格式是否正确"
-            )
-        
-        # 验证提取的文本
-        if not extracted_text or extracted_text.isspace():
-            raise HTTPException(
-                status_code=400,
-                detail="文件内容为空或无法提取有效文本"
-            )
+        logger.info("文件处理完成，成功生成思维导图")
         
-        # 调用AI处理
-        result = generate_mindmap_data(extracted_text)
+        parsed = ctx.parsed
+        extracted_text = parsed.text if include_text else None
         
-        if result is None:
-            raise HTTPException(
-                status_code=500,
-                detail="AI服务处理失败，请稍后再试"
+        if output_format == "tree":
+            return FileUploadTreeResponse(
+                tree=MindmapTreeData(**ctx.tree),
+                text_hash=ctx.text_hash,
+                text_length=len(parsed.text),
+                filename=ctx.filename,
+                file_size=ctx.file_size,
+                upload_hash=ctx.upload_hash,
+                encoding=parsed.encoding,
+                extracted_text=extracted_text
             )
         
-        logger.info("文件处理完成，成功生成思维导图")
-        
         return FileUploadResponse(
-            mindmap_data=result,
-            extracted_text=extracted_text,
-            filename=file.filename,
-            file_size=file_size
+            mindmap_data=ctx.mindmap,
+            text_hash=ctx.text_hash,
+            text_length=len(parsed.text),
+            filename=ctx.filename,
+            file_size=ctx.file_size,
+            upload_hash=ctx.upload_hash,
+            encoding=parsed.encoding,
+            extracted_text=extracted_text
         )
         
     except HTTPException:
@@ -164,6 +400,208 @@ def create_mindmap_from_file(file: UploadFile = File(...)):
         )
 
 
+@router.post("/generate/stream", summary="从文本流式生成思维导图（SSE）")
+async def stream_mindmap_from_text(text_input: TextInput, request: Request):
+    """
+    以 server-sent events 形式推送思维导图Markdown片段，前端可随到随渲染。
+    
+    事件类型: chunk（Markdown片段）、done（用量统计）、error（错误信息）
+    
+    Args:
+        text_input: 包含文本内容的数据模型
+        request: 请求对象，用于检测客户端断开
+        
+    Raises:
+        HTTPException: 当输入为空、超过长度限制或超过token预算时
+    """
+    ctx = await _run_pipeline(PipelineContext(text=text_input.text), until="normalize")
+    return _sse_response(request, ctx)
+
+
+@router.post("/generate-from-file/stream", summary="从文件流式生成思维导图（SSE）")
+async def stream_mindmap_from_file(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_hash: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None)
+):
+    """
+    解析上传的文件后，以 server-sent events 形式推送思维导图Markdown片段。
+    
+    Args:
+        request: 请求对象，用于检测客户端断开
+        file: 上传的文件对象（提供 upload_hash 时可省略）
+        upload_hash: 上传文件的SHA-256十六进制摘要
+        filename: 只提交哈希时的原始文件名
+        
+    Raises:
+        HTTPException: 当文件格式不支持、哈希未知、解析失败、内容为空或超过token预算时
+    """
+    ctx = await _run_pipeline(
+        PipelineContext(filename=filename, upload_hash=upload_hash, source=file),
+        until="normalize"
+    )
+    return _sse_response(request, ctx)
+
+
+@router.post("/jobs", response_model=JobCreatedResponse, status_code=202, summary="提交后台生成任务")
+async def create_job(text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None)):
+    """
+    提交文本或文件，立即返回任务ID；解析和生成在后台工作池中执行，
+    通过 GET /jobs/{job_id} 查询进度和结果。
+    
+    Args:
+        text: 文本内容（与 file 二选一）
+        file: 上传的文件对象（与 text 二选一）
+        
+    Returns:
+        任务ID和初始状态
+        
+    Raises:
+        HTTPException: 当未提供输入、文本为空、文件超过大小限制或等待处理的任务已达上限时
+    """
+    try:
+        if file is not None and file.filename:
+            saved = await _save_upload(file)
+            job_id = await job_manager.submit_file(file.filename, saved.path, saved.upload_hash)
+        elif text is not None:
+            _validate_text_input(TextInput(text=text))
+            job_id = await job_manager.submit_text(text)
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail="请提供文本或文件"
+            )
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+    
+    logger.info(f"后台任务已创建: {job_id}")
+    return JobCreatedResponse(job_id=job_id, status=JOB_PENDING)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse, summary="查询后台任务状态")
+async def get_job(job_id: str):
+    """
+    查询后台任务的状态、进度和结果
+    
+    Args:
+        job_id: 任务ID
+        
+    Returns:
+        任务状态，成功时包含思维导图Markdown
+        
+    Raises:
+        HTTPException: 当任务不存在时
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="任务不存在"
+        )
+    
+    return JobStatusResponse(
+        job_id=job["id"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        result=job["result"],
+        error=job["error"],
+        filename=job["filename"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"]
+    )
+
+
+@router.head("/uploads/{upload_hash}", summary="检查服务端是否已有该文件的解析结果")
+async def head_upload(upload_hash: str, filename: str = Query(...)):
+    """
+    上传前的预检查：客户端计算文件的SHA-256，服务端已有解析结果时返回200，
+    客户端随后只需提交 upload_hash 与 filename，无需重新上传文件；否则返回404。
+    
+    Args:
+        upload_hash: 上传文件的SHA-256十六进制摘要
+        filename: 原始文件名（扩展名决定解析器）
+        
+    Raises:
+        HTTPException: 哈希格式无效时（400）
+    """
+    upload_hash = _validate_upload_hash(upload_hash)
+    exists = await run_in_threadpool(parsed_text_store.contains, upload_hash, filename)
+    return Response(status_code=200 if exists else 404)
+
+
+@router.get("/texts/{text_hash}", summary="读取上传文件提取的文本")
+def get_extracted_text(text_hash: str, request: Request):
+    """
+    按内容哈希返回提取的文本（UTF-8），支持单一字节范围的 Range 请求以分段读取
+    
+    Args:
+        text_hash: 上传响应中的 text_hash
+        request: 请求对象，用于读取 Range 头
+        
+    Returns:
+        完整文本（200）或指定范围（206）
+        
+    Raises:
+        HTTPException: 文本不存在或已过期（404）、范围无效（416）时
+    """
+    data = text_store.get(text_hash)
+    if data is None:
+        raise HTTPException(
+            status_code=404,
+            detail="文本不存在或已过期"
+        )
+    
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{text_hash}"'}
+    byte_range = _parse_range(request.headers.get("range", ""), len(data))
+    if byte_range is None:
+        return Response(content=data, media_type="text/plain; charset=utf-8", headers=headers)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(data)}"
+    return Response(
+        content=data[start:end],
+        status_code=206,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
+
+@router.get("/rate-limit", summary="查询 Gemini 限流状态")
+def get_rate_limit_stats():
+    """
+    返回 Gemini 出站限流器的排队深度、等待时间与退避次数等统计信息
+    
+    Returns:
+        限流统计信息
+    """
+    return gemini_rate_limiter.stats()
+
+
+@router.get("/metrics", summary="Prometheus 指标")
+def get_metrics():
+    """
+    以 Prometheus 文本格式导出指标：各阶段耗时直方图、错误计数、
+    进行中的生成数、缓存命中率与限流排队深度
+    
+    Raises:
+        HTTPException: 未安装 prometheus-client 时
+    """
+    try:
+        payload, content_type = metrics_payload()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=501,
+            detail=str(e)
+        )
+    return Response(content=payload, media_type=content_type)
+
+
 @router.get("/supported-formats", response_model=SupportedFormatsResponse, summary="获取支持的文件格式")
 def get_supported_file_formats():
     """
@@ -176,7 +614,7 @@ def get_supported_file_formats():
         formats = get_supported_formats()
         return SupportedFormatsResponse(
             formats=formats,
-            max_file_size_mb=50
+            max_file_size_mb=MAX_FILE_SIZE_MB
         )
     except Exception as e:
         logger.error(f"获取支持格式时发生错误: {e}")
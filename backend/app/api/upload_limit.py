@@ -0,0 +1,77 @@
+"""
+上传大小限制
+在请求体到达的过程中累计字节数，超出限制时立即以413中止，而不是读完整个请求体后再判断
+"""
+
+from typing import Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from starlette.types import Message, Receive
+
+from ..core.batch import BATCH_MAX_BYTES, BATCH_MAX_MB
+from ..core.file_parser import MAX_FILE_SIZE_BYTES, MAX_FILE_SIZE_MB
+
+# multipart 边界、字段头等额外开销的余量
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+MAX_REQUEST_BODY_BYTES = MAX_FILE_SIZE_BYTES + _MULTIPART_OVERHEAD_BYTES
+MAX_BATCH_REQUEST_BODY_BYTES = BATCH_MAX_BYTES + _MULTIPART_OVERHEAD_BYTES
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=detail
+    )
+
+
+def _limited_receive(receive: Receive, limit: int, detail: str) -> Receive:
+    """包装 ASGI receive，累计请求体字节数，超出限制时抛出413"""
+    received = 0
+
+    async def receive_with_limit() -> Message:
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise _too_large(detail)
+        return message
+
+    return receive_with_limit
+
+
+class UploadSizeLimitRoute(APIRoute):
+    """
+    限制请求体大小的路由类
+
+    先检查 Content-Length，声明的大小超限时不读取请求体直接返回413；
+    否则在 FastAPI 解析表单（写入临时文件）的同时累计字节数，超限即中止。
+    """
+
+    max_body_bytes = MAX_REQUEST_BODY_BYTES
+    too_large_detail = f"文件大小超过{MAX_FILE_SIZE_MB}MB限制"
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+        limit, detail = self.max_body_bytes, self.too_large_detail
+
+        async def route_handler(request: Request) -> Response:
+            content_length = request.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > limit:
+                raise _too_large(detail)
+
+            limited_request = Request(
+                request.scope,
+                _limited_receive(request.receive, limit, detail)
+            )
+            return await original_route_handler(limited_request)
+
+        return route_handler
+
+
+class BatchUploadSizeLimitRoute(UploadSizeLimitRoute):
+    """批量上传的路由类，按批次总大小限制请求体（单个文件的大小在落盘时检查）"""
+
+    max_body_bytes = MAX_BATCH_REQUEST_BODY_BYTES
+    too_large_detail = f"批量上传总大小超过{BATCH_MAX_MB}MB限制"
@@ -4,33 +4,248 @@ AI处理模块
 """
 
 import os
+import re
+import time
+import asyncio
 import logging
-from typing import Optional
-import google.generativeai as genai
+from typing import Optional, Tuple, AsyncIterator, Dict, Any, List, NamedTuple
+
+from .gemini_client import gemini_client, GEMINI_MODEL
+from .cache import mindmap_cache, build_cache_key, normalize_text
+from .chunking import estimate_tokens, split_into_chunks, split_into_groups, split_into_sections
+from .compaction import PreparedInput, TokenBudgetExceeded, check_token_budget, compact_input
+from .singleflight import SingleFlight
+from .metrics import FIRST_TOKEN_SECONDS, OUTPUT_CHARS, PROMPT_TOKENS, track_gemini_call
+from .rate_limiter import (
+    GeminiUnavailableError,
+    RateLimitTimeout,
+    call_with_retry,
+    classify_error,
+    current_client_id,
+    gemini_rate_limiter,
+    retry_after_seconds,
+    GEMINI_REQUEST_DEADLINE,
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 模型名称与提示词版本（修改提示词时需同步提升版本号，使旧缓存失效）
+MODEL_NAME = GEMINI_MODEL
+PROMPT_VERSION = 'v2'
+
+# 异步路径下同时进行中的 Gemini 调用上限
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "100"))
+_generation_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# 分块生成：单个分块的token上限，以及单个请求内同时生成的分块数
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "30000"))
+CHUNK_CONCURRENCY = int(os.environ.get("CHUNK_CONCURRENCY", "4"))
+# 单个请求最多切分的分块数（0表示不限制），超出时与超过token预算一样返回413
+CHUNK_MAX_COUNT = int(os.environ.get("CHUNK_MAX_COUNT", "16"))
+
+# 增量生成：分节的期望token数（局部修改时只重新生成修改所在的分节）
+INCREMENTAL_SECTION_TOKENS = int(os.environ.get("INCREMENTAL_SECTION_TOKENS", "2000"))
+
+# 分节子导图的提示词版本（修改 SECTION_PROMPT_SUFFIX 时需同步提升）
+SECTION_PROMPT_VERSION = PROMPT_VERSION + '-section-v1'
+
+# 多文档总览导图的提示词版本（修改 COMBINE_PROMPT_TEMPLATE 时需同步提升）
+COMBINE_PROMPT_VERSION = PROMPT_VERSION + '-combine-v1'
+
+# 输入token计数方式：local 使用本地估算，gemini 调用模型的 countTokens 接口（失败时退回本地估算）
+TOKEN_COUNTER = os.environ.get("TOKEN_COUNTER", "local")
+TOKEN_COUNT_TIMEOUT = float(os.environ.get("TOKEN_COUNT_TIMEOUT", "5"))
+
+# 超过该字符数的输入在线程池中压缩，避免阻塞事件循环
+_COMPACTION_THREAD_THRESHOLD = 256 * 1024
+
+# 以缓存键合并进行中的相同生成请求
+_generation_flight = SingleFlight()
+
+PROMPT_TEMPLATE = """
+你是一个顶级的知识架构师和信息分析专家。你的核心任务是将用户提供的复杂、可能结构混乱的原始文本，转换成一份极其详细、高度结构化、完全忠于原文信息的 Markdown 格式思维导图。
+
+**你必须严格遵循以下所有规则：**
+
+1.  **【无损原则】**: 你的首要目标是 **零信息损失**。必须捕捉并包含原文中所有的关键概念、论点、论据、数据、案例和细节。如果原文提到了一个具体的名字、数字或例子，你的导图中也必须体现出来。
+
+2.  **【结构保留原则】**: 尽可能地识别并保留原文的内在逻辑结构和层级关系。如果原文是按"总-分-总"或者"问题-分析-解决"的结构来写的，你的思维导图主干也应该反映出这种结构。
+
+3.  **【逐层深化】**:
+    * 一级标题 (#): 应该是整个文档最核心、最顶层的主题。
+    * 二级标题 (##): 应该是支撑核心主题的关键分支或主要部分。
+    * 三级标题 (###): 应该是对二级分支的进一步展开或子论点。
+    * 列表项 (-): 用于列举具体的细节、例子、数据或步骤。可以使用多级缩进列表来表示更深层次的从属关系。
+
+4.  **【精确提炼，而非泛泛总结】**: 你的输出应该是对原文信息的**结构化呈现**，而不是模糊的概括。
+    * **错误示范**: "作者讨论了几个工具。"
+    * **正确示范**: "- 工具示例: Evernote, Notion"
+
+5.  **【时间戳】**: 如果原文段落以 [时:分:秒] 形式的时间戳开头（例如视频字幕），在每个二级、三级标题和列表项末尾标注其内容最早出现的时间戳，格式与原文一致，例如 "## 模型训练 [00:12:30]"。原文没有时间戳时不要添加。
+
+现在，请基于以上所有规则，处理以下原始文本：
+"""
+
+CHUNK_PROMPT_SUFFIX = """
+（注意：以下内容是一份长文档的第 {index}/{total} 部分，请只针对这一部分生成思维导图。）
+
+"""
+
+SECTION_PROMPT_SUFFIX = """
+（注意：以下内容是一份文档中的一节。请只针对这一节生成思维导图分支：以二级标题 (##) 作为最高层级，不要输出一级标题 (#)，也不要输出任何解释。）
 
-def initialize_gemini():
-    """初始化Gemini API配置"""
+"""
+
+MERGE_PROMPT_TEMPLATE = """
+你是一个顶级的知识架构师。下面是同一份长文档按顺序分段生成的多份 Markdown 思维导图，各份之间用 "---" 分隔。
+
+请将它们合并为一份完整的 Markdown 思维导图，并严格遵循以下规则：
+
+1.  只保留一个一级标题 (#)，概括整个文档的核心主题。
+2.  保留各部分的全部信息，不得删减任何概念、数据、案例和细节。
+3.  按原文顺序组织二级、三级标题，合并重复或高度相似的分支。
+4.  只输出合并后的 Markdown，不要输出任何解释。
+
+以下是需要合并的思维导图：
+"""
+
+COMBINE_PROMPT_TEMPLATE = """
+你是一个顶级的知识架构师。下面是同一批资料中多份文档各自的思维导图大纲，各份之间用 "---" 分隔，每份的第一行注明文件名。
+
+请将它们汇总为一份覆盖全部文档的总览思维导图，并严格遵循以下规则：
+
+1.  只保留一个一级标题 (#)，概括这批资料的整体主题。
+2.  二级标题 (##) 按主题组织，跨文档合并相同或高度相似的主题，而不是简单地按文件罗列。
+3.  在各分支下用列表项注明涉及的文件名。
+4.  只输出汇总后的 Markdown，不要输出任何解释。
+
+以下是各文档的思维导图大纲：
+"""
+
+
+async def _call_gemini_async(prompt: str) -> Optional[str]:
+    """
+    异步调用 Gemini 并返回生成的文本，并发调用数受 GEMINI_MAX_CONCURRENCY 限制。
+    
+    Args:
+        prompt: 完整的提示词
+        
+    Returns:
+        模型输出文本，失败时返回None
+        
+    Raises:
+        GeminiUnavailableError: 配额耗尽或上游暂时不可用，重试后仍未成功
+    """
     try:
-        api_key = os.environ.get("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("未找到 GOOGLE_API_KEY 环境变量")
+        # 借用已初始化的模型（未设置API密钥时为None）
+        model = gemini_client.acquire()
+        if model is None:
+            return None
+        
+        async def _send():
+            async with _generation_semaphore:
+                logger.info("正在异步调用 Gemini API...")
+                try:
+                    with track_gemini_call("async"):
+                        return await model.generate_content_async(prompt, request_options=gemini_client.request_options)
+                except Exception as e:
+                    gemini_client.report_failure(e)
+                    raise
         
-        genai.configure(api_key=api_key)
-        logger.info("Gemini API 配置成功")
-        return True
+        # 经限流器按客户端公平排队放行，配额与临时性错误自动重试
+        prompt_tokens = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(prompt_tokens)
+        response = await call_with_retry(_send, prompt_tokens)
+        
+        logger.info("成功获取API响应")
+        logger.info(f"响应长度: {len(response.text)} 字符")
+        OUTPUT_CHARS.observe(len(response.text))
+        
+        gemini_client.report_success()
+        return response.text
+        
+    except GeminiUnavailableError:
+        raise
+    except Exception as e:
+        logger.error(f"异步调用 Gemini API 时发生错误: {e}")
+        logger.error(f"错误类型: {type(e).__name__}")
+        import traceback
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        return None
+
+
+async def _count_tokens_remote(text_content: str) -> Optional[int]:
+    """调用模型的 countTokens 接口计数，不可用或失败时返回None"""
+    model = gemini_client.acquire()
+    if model is None:
+        return None
+    try:
+        response = await asyncio.wait_for(model.count_tokens_async(text_content), TOKEN_COUNT_TIMEOUT)
+        return response.total_tokens
     except Exception as e:
-        logger.error(f"Gemini API 配置失败: {e}")
-        return False
+        logger.warning(f"token计数接口调用失败，使用本地估算: {e}")
+        return None
 
 
-def generate_mindmap_data(text_content: str) -> Optional[str]:
+def _request_input_tokens(prepared: PreparedInput) -> Tuple[int, int]:
+    """
+    统计生成导图时发送给模型的输入token总数与分块数：超过 CHUNK_MAX_TOKENS 的文本
+    按分块生成时使用相同的切分，每个分块各带一份提示词；合并轮的输入是子导图，不计入
     """
-    调用 Google Gemini API 来处理文本并生成思维导图Markdown。
+    prompt_tokens = estimate_tokens(PROMPT_TEMPLATE)
+    if prepared.tokens <= CHUNK_MAX_TOKENS:
+        return prepared.tokens + prompt_tokens, 1
+    chunks = split_into_chunks(prepared.text, CHUNK_MAX_TOKENS)
+    return prepared.tokens + len(chunks) * (prompt_tokens + estimate_tokens(CHUNK_PROMPT_SUFFIX)), len(chunks)
+
+
+def _prepare_input(text_content: str) -> Tuple[PreparedInput, int, int]:
+    prepared = compact_input(text_content)
+    return (prepared, *_request_input_tokens(prepared))
+
+
+async def prepare_input_async(text_content: str) -> PreparedInput:
+    """
+    调用模型前预处理输入：压缩空白与重复样板，统计token数并检查单个请求的token预算。
+    
+    预算按本次请求发送给模型的输入总量检查：超过 CHUNK_MAX_TOKENS 的文本会分块（map-reduce）生成，
+    总量为压缩后全文的token数加上每个分块各一份提示词；分块数另受 CHUNK_MAX_COUNT 限制。
+    生成时应使用返回的 text；原文仍按原样存储，供增量更新和导出使用。
+    
+    Args:
+        text_content: 解析得到的原始文本
+        
+    Returns:
+        预处理后的输入（压缩后的文本、token数、节省的token数）
+        
+    Raises:
+        TokenBudgetExceeded: 请求的输入总量超过 INPUT_TOKEN_BUDGET，或分块数超过 CHUNK_MAX_COUNT 时
+    """
+    if len(text_content) > _COMPACTION_THREAD_THRESHOLD:
+        prepared, request_tokens, chunk_count = await asyncio.to_thread(_prepare_input, text_content)
+    else:
+        prepared, request_tokens, chunk_count = _prepare_input(text_content)
+    
+    if TOKEN_COUNTER == "gemini":
+        tokens = await _count_tokens_remote(prepared.text)
+        if tokens is not None:
+            request_tokens += tokens - prepared.tokens
+            prepared = prepared._replace(tokens=tokens)
+    
+    if prepared.saved_tokens:
+        logger.info(f"输入预处理节省约 {prepared.saved_tokens} 个token，剩余 {prepared.tokens} 个token")
+    if CHUNK_MAX_COUNT > 0 and chunk_count > CHUNK_MAX_COUNT:
+        raise TokenBudgetExceeded(prepared.tokens, CHUNK_MAX_COUNT * CHUNK_MAX_TOKENS)
+    check_token_budget(request_tokens)
+    return prepared
+
+
+async def generate_mindmap_data_async(text_content: str) -> Optional[str]:
+    """
+    调用 Gemini 生成思维导图，使用 SDK 的 generate_content_async，
+    等待响应期间不占用线程池线程。
     
     Args:
         text_content: 输入的文本内容
@@ -38,51 +253,406 @@ def generate_mindmap_data(text_content: str) -> Optional[str]:
     Returns:
         生成的思维导图Markdown字符串，失败时返回None
     """
-    PROMPT_TEMPLATE = """
-    你是一个顶级的知识架构师和信息分析专家。你的核心任务是将用户提供的复杂、可能结构混乱的原始文本，转换成一份极其详细、高度结构化、完全忠于原文信息的 Markdown 格式思维导图。
+    logger.info(f"输入文本长度: {len(text_content)} 字符")
+    return await _call_gemini_async(PROMPT_TEMPLATE + text_content)
 
-    **你必须严格遵循以下所有规则：**
 
-    1.  **【无损原则】**: 你的首要目标是 **零信息损失**。必须捕捉并包含原文中所有的关键概念、论点、论据、数据、案例和细节。如果原文提到了一个具体的名字、数字或例子，你的导图中也必须体现出来。
+async def generate_mindmap_chunked_async(text_content: str) -> Optional[str]:
+    """
+    分块（map-reduce）生成思维导图，用于超出单次提示词预算的长文档。
+    
+    文本按结构边界切分为不超过 CHUNK_MAX_TOKENS 的分块，各分块并发生成子导图
+    （并发数受 CHUNK_CONCURRENCY 限制），再将子导图合并为一份完整导图。
+    文本未超出预算时等价于 generate_mindmap_data_async。
+    
+    Args:
+        text_content: 输入的文本内容
+        
+    Returns:
+        生成的思维导图Markdown字符串，失败时返回None
+    """
+    chunks = split_into_chunks(text_content, CHUNK_MAX_TOKENS)
+    if len(chunks) <= 1:
+        return await generate_mindmap_data_async(text_content)
+    
+    logger.info(f"文本估算 {estimate_tokens(text_content)} tokens，切分为 {len(chunks)} 个分块生成")
+    chunk_semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    
+    async def _generate_chunk(index: int, chunk: str) -> Optional[str]:
+        async with chunk_semaphore:
+            prompt = PROMPT_TEMPLATE + CHUNK_PROMPT_SUFFIX.format(index=index + 1, total=len(chunks)) + chunk
+            return await _call_gemini_async(prompt)
+    
+    tasks = [asyncio.create_task(_generate_chunk(i, c)) for i, c in enumerate(chunks)]
+    try:
+        submaps = await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一分块最终失败（例如配额耗尽）时，不再继续生成其余分块
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    if any(submap is None for submap in submaps):
+        failed = sum(1 for submap in submaps if submap is None)
+        logger.error(f"{failed}/{len(chunks)} 个分块生成失败")
+        return None
+    
+    return await _merge_submaps(list(submaps))
 
-    2.  **【结构保留原则】**: 尽可能地识别并保留原文的内在逻辑结构和层级关系。如果原文是按"总-分-总"或者"问题-分析-解决"的结构来写的，你的思维导图主干也应该反映出这种结构。
 
-    3.  **【逐层深化】**:
-        * 一级标题 (#): 应该是整个文档最核心、最顶层的主题。
-        * 二级标题 (##): 应该是支撑核心主题的关键分支或主要部分。
-        * 三级标题 (###): 应该是对二级分支的进一步展开或子论点。
-        * 列表项 (-): 用于列举具体的细节、例子、数据或步骤。可以使用多级缩进列表来表示更深层次的从属关系。
+async def _merge_submaps(submaps: List[str], template: str = MERGE_PROMPT_TEMPLATE) -> str:
+    """
+    合并子导图。合并输入超出预算时先分组合并，逐层归约直到只剩一份导图；
+    合并调用失败时退化为本地拼接，保证已生成的内容不丢失。
+    
+    Args:
+        submaps: 按顺序排列的子导图
+        template: 合并提示词
+    """
+    while len(submaps) > 1:
+        groups = split_into_groups(submaps, CHUNK_MAX_TOKENS)
+        if len(groups) == len(submaps) and len(groups) > 1:
+            # 单个子导图已接近预算，无法再两两合并，直接本地拼接
+            logger.warning("子导图过大，无法继续由模型合并，使用本地拼接")
+            return _concat_submaps(submaps)
+        
+        logger.info(f"合并 {len(submaps)} 个子导图，分为 {len(groups)} 组")
+        merged = await asyncio.gather(*(_merge_group(group, template) for group in groups))
+        submaps = list(merged)
+    
+    return submaps[0]
 
-    4.  **【精确提炼，而非泛泛总结】**: 你的输出应该是对原文信息的**结构化呈现**，而不是模糊的概括。
-        * **错误示范**: "作者讨论了几个工具。"
-        * **正确示范**: "- 工具示例: Evernote, Notion"
 
-    现在，请基于以上所有规则，处理以下原始文本：
-    """
+async def _merge_group(group: List[str], template: str) -> str:
+    """调用模型合并一组子导图，失败时本地拼接"""
+    if len(group) == 1:
+        return group[0]
     
+    joined = '\n\n---\n\n'.join(group)
     try:
-        # 检查API密钥
-        if not os.environ.get('GOOGLE_API_KEY'):
-            logger.error("GOOGLE_API_KEY 未设置")
-            return None
+        result = await _call_gemini_async(template + joined)
+    except GeminiUnavailableError:
+        result = None
+    if result is None:
+        logger.warning("子导图合并调用失败，使用本地拼接")
+        return _concat_submaps(group)
+    return result
+
+
+def _concat_submaps(submaps: List[str]) -> str:
+    """本地拼接子导图：将各子导图的标题整体降一级，挂到同一个根节点下"""
+    lines = ['# 文档思维导图']
+    for submap in submaps:
+        for line in submap.strip().splitlines():
+            if line.startswith('#'):
+                line = '#' + line
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+async def generate_mindmap_with_cache_async(text_content: str) -> Tuple[Optional[str], bool]:
+    """
+    带缓存的思维导图生成，相同内容（规范化后）直接返回缓存结果；
+    相同内容的并发请求共享一次生成，所有等待的请求都断开连接时取消该次生成。
+    
+    Args:
+        text_content: 输入的文本内容
         
-        logger.info("正在初始化 Gemini 模型...")
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        logger.info("模型初始化成功")
+    Returns:
+        (思维导图Markdown字符串或None, 是否命中缓存)
+    """
+    cache_key = build_cache_key(text_content, PROMPT_VERSION, MODEL_NAME)
+    
+    cached = await mindmap_cache.get_async(cache_key)
+    if cached is not None:
+        logger.info(f"命中思维导图缓存: {cache_key[:12]}")
+        return cached, True
+    
+    async def _generate() -> Optional[str]:
+        result = await generate_mindmap_chunked_async(text_content)
+        if result is not None:
+            await mindmap_cache.set_async(cache_key, result)
+        return result
+    
+    return await _generation_flight.do(cache_key, _generate), False
+
+
+# 子导图中的标题行
+_FRAGMENT_HEADING = re.compile(r'^(#{1,6})\s')
+
+
+class IncrementalResult(NamedTuple):
+    """增量生成结果"""
+    mindmap: Optional[str]
+    # 分节总数
+    sections: int
+    # 复用缓存子导图的分节数
+    reused: int
+
+
+async def generate_mindmap_incremental_async(text_content: str) -> IncrementalResult:
+    """
+    增量生成思维导图，用于用户修改文档后重新提交。
+    
+    文本按内容确定的边界切分为稳定的分节（见 split_into_sections），每节以内容指纹
+    作为缓存键保存子导图；未修改的分节直接复用缓存，只为修改过的分节调用模型，
+    最后按原文顺序将各节子导图拼接到同一个根节点下。局部修改时延迟和token消耗
+    与修改的大小成正比，而不是整份文档。
+    
+    Args:
+        text_content: 输入的文本内容
         
-        logger.info("正在调用 Gemini API...")
-        full_prompt = PROMPT_TEMPLATE + text_content
-        logger.info(f"输入文本长度: {len(text_content)} 字符")
+    Returns:
+        IncrementalResult（思维导图失败时为None）
         
-        response = model.generate_content(full_prompt)
-        logger.info("成功获取API响应")
-        logger.info(f"响应长度: {len(response.text)} 字符")
+    Raises:
+        GeminiUnavailableError: 配额耗尽或上游暂时不可用，重试后仍未成功
+    """
+    sections = split_into_sections(normalize_text(text_content), INCREMENTAL_SECTION_TOKENS, CHUNK_MAX_TOKENS)
+    if not sections:
+        return IncrementalResult(None, 0, 0)
+    
+    keys = [build_cache_key(section, SECTION_PROMPT_VERSION, MODEL_NAME) for section in sections]
+    fragments = await asyncio.gather(*(mindmap_cache.get_async(key) for key in keys))
+    missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+    reused = len(sections) - len(missing)
+    logger.info(f"增量生成：共 {len(sections)} 节，复用 {reused} 节，重新生成 {len(missing)} 节")
+    
+    section_semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    
+    async def _generate_section(index: int) -> Optional[str]:
+        async def _generate() -> Optional[str]:
+            async with section_semaphore:
+                result = await _call_gemini_async(PROMPT_TEMPLATE + SECTION_PROMPT_SUFFIX + sections[index])
+            if result is not None:
+                result = _normalize_fragment(result)
+                await mindmap_cache.set_async(keys[index], result)
+            return result
         
-        return response.text
+        # 相同内容的分节（包括并发请求中的）共享一次生成
+        return await _generation_flight.do(keys[index], _generate)
+    
+    tasks = [asyncio.create_task(_generate_section(i)) for i in missing]
+    try:
+        generated = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    if any(fragment is None for fragment in generated):
+        failed = sum(1 for fragment in generated if fragment is None)
+        logger.error(f"{failed}/{len(missing)} 个分节生成失败")
+        return IncrementalResult(None, len(sections), reused)
+    
+    for index, fragment in zip(missing, generated):
+        fragments[index] = fragment
+    return IncrementalResult(_splice_fragments(sections[0], fragments), len(sections), reused)
+
+
+def _normalize_fragment(markdown: str) -> str:
+    """将子导图的标题整体平移，使最高层级为二级标题，便于挂到同一个根节点下"""
+    lines = markdown.strip().splitlines()
+    levels = [len(m.group(1)) for m in map(_FRAGMENT_HEADING.match, lines) if m]
+    if not levels:
+        return '\n'.join(lines)
+    
+    shift = 2 - min(levels)
+    normalized = []
+    for line in lines:
+        m = _FRAGMENT_HEADING.match(line)
+        if m:
+            level = min(6, len(m.group(1)) + shift)
+            line = '#' * level + line[len(m.group(1)):]
+        normalized.append(line)
+    return '\n'.join(normalized)
+
+
+def _splice_fragments(first_section: str, fragments: List[str]) -> str:
+    """按顺序拼接各节子导图；文档以一级标题开头时用作根节点，否则使用默认标题"""
+    first_line = first_section.split('\n', 1)[0]
+    title = first_line[2:].strip() if first_line.startswith('# ') else '文档思维导图'
+    return '\n'.join(['# ' + title] + fragments)
+
+
+def _outline(mindmap: str, max_level: int = 3) -> str:
+    """只保留导图中不超过 max_level 级的标题行，作为汇总时的输入"""
+    lines = []
+    for line in mindmap.splitlines():
+        match = _FRAGMENT_HEADING.match(line)
+        if match and len(match.group(1)) <= max_level:
+            lines.append(line.rstrip())
+    return '\n'.join(lines) or mindmap.strip()
+
+
+async def generate_combined_mindmap_async(mindmaps: List[Tuple[str, str]]) -> str:
+    """
+    将多份文档各自的思维导图汇总为一份总览导图（按主题跨文档组织）。
+    
+    只把各导图的前三级标题交给模型，控制提示词大小；大纲总量超出 CHUNK_MAX_TOKENS 时
+    分组汇总后逐层归约，模型调用失败时退化为本地拼接。结果按输入内容缓存。
+    
+    Args:
+        mindmaps: (文件名, 思维导图Markdown) 列表，按提交顺序排列
         
-    except Exception as e:
-        logger.error(f"调用 Gemini API 时发生错误: {e}")
-        logger.error(f"错误类型: {type(e).__name__}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
-        return None 
\ No newline at end of file
+    Returns:
+        总览思维导图Markdown；只有一份导图时原样返回
+    """
+    if len(mindmaps) == 1:
+        return mindmaps[0][1]
+    
+    outlines = [f"文件: {filename}\n{_outline(mindmap)}" for filename, mindmap in mindmaps]
+    cache_key = build_cache_key('\n\n---\n\n'.join(outlines), COMBINE_PROMPT_VERSION, MODEL_NAME)
+    
+    cached = await mindmap_cache.get_async(cache_key)
+    if cached is not None:
+        logger.info(f"命中总览导图缓存: {cache_key[:12]}")
+        return cached
+    
+    async def _generate() -> str:
+        logger.info(f"汇总 {len(mindmaps)} 份思维导图")
+        result = await _merge_submaps(outlines, COMBINE_PROMPT_TEMPLATE)
+        await mindmap_cache.set_async(cache_key, result)
+        return result
+    
+    return await _generation_flight.do(cache_key, _generate)
+
+
+async def stream_mindmap_data(text_content: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    以流式模式调用 Gemini，边生成边产出思维导图Markdown片段。
+    
+    上游流在独立任务中消费；调用方提前退出（例如客户端断开连接）时，
+    该任务会被取消，从而取消正在进行的 Gemini 流式请求。
+    
+    Args:
+        text_content: 输入的文本内容
+        
+    Yields:
+        (事件类型, 数据) 元组，事件类型为:
+        - "chunk": {"text": Markdown片段}
+        - "done": 用量统计（token数、首片段耗时、总耗时等）
+        - "error": {"detail": 错误信息}
+    """
+    start_time = time.perf_counter()
+    cache_key = build_cache_key(text_content, PROMPT_VERSION, MODEL_NAME)
+    
+    cached = await mindmap_cache.get_async(cache_key)
+    if cached is not None:
+        logger.info(f"命中思维导图缓存: {cache_key[:12]}")
+        yield "chunk", {"text": cached}
+        yield "done", {
+            "cached": True,
+            "output_chars": len(cached),
+            "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+        }
+        return
+    
+    model = gemini_client.acquire()
+    if model is None:
+        yield "error", {"detail": "AI服务未配置"}
+        return
+    
+    if estimate_tokens(text_content) > CHUNK_MAX_TOKENS:
+        # 超长文本走分块生成，合并完成后一次性推送
+        try:
+            result = await generate_mindmap_chunked_async(text_content)
+        except GeminiUnavailableError as e:
+            yield "error", {"detail": str(e), "status_code": e.status_code, "retry_after": e.retry_after}
+            return
+        if result is None:
+            yield "error", {"detail": "AI服务处理失败，请稍后再试"}
+            return
+        await mindmap_cache.set_async(cache_key, result)
+        yield "chunk", {"text": result}
+        yield "done", {
+            "cached": False,
+            "chunked": True,
+            "output_chars": len(result),
+            "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+        }
+        return
+    
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def _pump():
+        parts = []
+        first_chunk_ms = None
+        try:
+            full_prompt = PROMPT_TEMPLATE + text_content
+            logger.info(f"输入文本长度: {len(text_content)} 字符，开始流式生成")
+            
+            # 流式输出一旦开始便无法透明重试，这里只经限流器放行
+            prompt_tokens = estimate_tokens(full_prompt)
+            PROMPT_TOKENS.observe(prompt_tokens)
+            await gemini_rate_limiter.acquire(
+                prompt_tokens, current_client_id.get(), time.monotonic() + GEMINI_REQUEST_DEADLINE
+            )
+            async with _generation_semaphore:
+                with track_gemini_call("stream"):
+                    response = await model.generate_content_async(
+                        full_prompt, stream=True, request_options=gemini_client.request_options
+                    )
+                    async for chunk in response:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # 被安全策略拦截等情况下片段没有文本
+                            continue
+                        if not text:
+                            continue
+                        if first_chunk_ms is None:
+                            first_chunk_ms = round((time.perf_counter() - start_time) * 1000, 1)
+                            FIRST_TOKEN_SECONDS.observe(first_chunk_ms / 1000)
+                        parts.append(text)
+                        await queue.put(("chunk", {"text": text}))
+            
+            result = ''.join(parts)
+            OUTPUT_CHARS.observe(len(result))
+            if result:
+                await mindmap_cache.set_async(cache_key, result)
+            
+            usage = getattr(response, "usage_metadata", None)
+            await queue.put(("done", {
+                "cached": False,
+                "prompt_tokens": getattr(usage, "prompt_token_count", None),
+                "output_tokens": getattr(usage, "candidates_token_count", None),
+                "total_tokens": getattr(usage, "total_token_count", None),
+                "output_chars": len(result),
+                "first_chunk_ms": first_chunk_ms,
+                "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+            }))
+            gemini_client.report_success()
+            logger.info(f"流式生成完成，响应长度: {len(result)} 字符")
+        except asyncio.CancelledError:
+            raise
+        except RateLimitTimeout:
+            await queue.put(("error", {"detail": "AI服务请求过于频繁，请稍后再试", "status_code": 429}))
+        except Exception as e:
+            gemini_client.report_failure(e)
+            logger.error(f"流式调用 Gemini API 时发生错误: {e}")
+            logger.error(f"错误类型: {type(e).__name__}")
+            kind = classify_error(e)
+            if kind == "quota":
+                gemini_rate_limiter.penalize(retry_after_seconds(e))
+                await queue.put(("error", {"detail": "AI服务请求过于频繁，请稍后再试", "status_code": 429}))
+            elif kind == "transient":
+                await queue.put(("error", {"detail": "AI服务暂时不可用，请稍后再试", "status_code": 503}))
+            else:
+                await queue.put(("error", {"detail": "AI服务处理失败，请稍后再试"}))
+    
+    task = asyncio.create_task(_pump())
+    try:
+        while True:
+            event, data = await queue.get()
+            yield event, data
+            if event != "chunk":
+                break
+    finally:
+        if not task.done():
+            logger.info("客户端已断开，取消上游 Gemini 流式请求")
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,227 @@
+"""
+批量生成模块
+一次提交多个文件（或ZIP压缩包）：在进程池中并行解析，在全局限流下并发生成，
+按完成顺序逐个产出每个文件的结果，可选地再汇总为一份覆盖全部文件的总览导图
+"""
+
+import os
+import shutil
+import asyncio
+import logging
+import posixpath
+import tempfile
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from . import file_parser
+from .ai_processor import generate_combined_mindmap_async
+from .file_parser import MAX_FILE_SIZE_BYTES, MAX_FILE_SIZE_MB, ParseResult, parse_file_path
+from .pipeline import PipelineContext, PipelineError, make_parse_stage, mindmap_pipeline
+from .process_pool import LazyProcessPool
+from .text_store import file_hash
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 单次批量提交的文件数上限（ZIP按其中的文件计）与总大小上限
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "100"))
+BATCH_MAX_MB = int(os.environ.get("BATCH_MAX_MB", "500"))
+BATCH_MAX_BYTES = BATCH_MAX_MB * 1024 * 1024
+
+# 解析进程池大小，以及单个批次内同时进行的生成数（另受全局限流器约束）
+BATCH_PARSE_WORKERS = int(os.environ.get("BATCH_PARSE_WORKERS", str(os.cpu_count() or 2)))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+
+class BatchItem(NamedTuple):
+    """批次中的一个文件"""
+    index: int
+    filename: str
+    # 已落盘的临时文件路径
+    path: str
+    size: int
+    # 上传内容的SHA-256（ZIP中的文件在处理时计算）
+    upload_hash: Optional[str] = None
+
+
+def _is_ignored_member(name: str) -> bool:
+    """ZIP中的目录、macOS资源分支和隐藏文件不参与处理"""
+    basename = posixpath.basename(name)
+    return not basename or basename.startswith('.') or name.startswith('__MACOSX/')
+
+
+def expand_archive(archive_path: str) -> List[BatchItem]:
+    """
+    将ZIP中的文件逐个解压到临时文件（index 从0开始，由调用方重新编号）
+
+    解压前按中央目录中声明的大小检查文件数、单个文件大小和总大小，不解压超限的压缩包。
+
+    Args:
+        archive_path: 磁盘上的ZIP文件路径
+
+    Returns:
+        解压出的文件列表，调用方负责删除临时文件
+
+    Raises:
+        ValueError: 压缩包无效或超过限制时
+    """
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile:
+        raise ValueError("ZIP文件无效")
+
+    items: List[BatchItem] = []
+    with archive:
+        members = [m for m in archive.infolist() if not m.is_dir() and not _is_ignored_member(m.filename)]
+        if len(members) > BATCH_MAX_FILES:
+            raise ValueError(f"压缩包中的文件数超过{BATCH_MAX_FILES}个限制")
+        if sum(m.file_size for m in members) > BATCH_MAX_BYTES:
+            raise ValueError(f"压缩包解压后的大小超过{BATCH_MAX_MB}MB限制")
+        oversized = [m.filename for m in members if m.file_size > MAX_FILE_SIZE_BYTES]
+        if oversized:
+            raise ValueError(f"文件 {oversized[0]} 大小超过{MAX_FILE_SIZE_MB}MB限制")
+
+        try:
+            for index, member in enumerate(members):
+                suffix = os.path.splitext(member.filename)[1].lower()
+                with archive.open(member) as source, tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as target:
+                    items.append(BatchItem(index, member.filename, target.name, member.file_size))
+                    shutil.copyfileobj(source, target)
+        except BaseException:
+            remove_files(item.path for item in items)
+            raise
+    return items
+
+
+def remove_files(paths) -> None:
+    """删除临时文件，忽略已删除的文件"""
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _init_parse_worker() -> None:
+    # 批次内已按文件并行，单个PDF不再另开进程池
+    file_parser.PDF_PARALLEL_PAGE_THRESHOLD = 0
+
+
+# 批量解析进程池
+_parse_pool = LazyProcessPool(BATCH_PARSE_WORKERS, initializer=_init_parse_worker)
+
+
+async def parse_in_pool(filename: str, file_path: str) -> ParseResult:
+    """
+    在进程池中解析文件；进程池不可用时退回线程池
+
+    Raises:
+        ValueError: 当文件格式不支持或解析失败时
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_parse_pool.get(), parse_file_path, filename, file_path)
+    except BrokenProcessPool:
+        _parse_pool.discard()
+        logger.warning(f"解析进程池不可用，改为在线程池中解析: {filename}")
+        return await asyncio.to_thread(parse_file_path, filename, file_path)
+
+
+def _file_error(item: BatchItem, status_code: int, error: str) -> Dict[str, Any]:
+    return {
+        "event": "file",
+        "index": item.index,
+        "filename": item.filename,
+        "status": "error",
+        "status_code": status_code,
+        "error": error,
+    }
+
+
+async def _parse_context_in_pool(ctx: PipelineContext) -> ParseResult:
+    return await parse_in_pool(ctx.filename, ctx.file_path)
+
+
+# 批量接口的流水线：文件在进程池中解析，其余阶段与单文件接口相同
+batch_pipeline = mindmap_pipeline.with_stage("parse", make_parse_stage(_parse_context_in_pool))
+
+
+async def _process_item(item: BatchItem, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """解析并生成单个文件，任何错误都作为该文件的结果返回，不影响批次中的其他文件"""
+    ctx = PipelineContext(
+        filename=item.filename,
+        file_path=item.path,
+        file_size=item.size,
+        upload_hash=item.upload_hash,
+    )
+    try:
+        ctx.upload_hash = ctx.upload_hash or await asyncio.to_thread(file_hash, item.path)
+        await batch_pipeline.run(ctx, until="normalize")
+        # 批次内同时进行的生成数受 semaphore 限制，解析与预处理不受限制
+        async with semaphore:
+            await batch_pipeline.run(ctx, start="generate", until="generate")
+        await batch_pipeline.run(ctx, start="postprocess")
+    except PipelineError as e:
+        return _file_error(item, e.status_code, str(e))
+    except Exception as e:
+        logger.error(f"批量处理文件 {item.filename} 发生未知错误: {type(e).__name__}: {e}")
+        return _file_error(item, 500, "服务器内部错误，请稍后再试")
+
+    return {
+        "event": "file",
+        "index": item.index,
+        "filename": item.filename,
+        "status": "ok",
+        "mindmap_data": ctx.mindmap,
+        "cache": "HIT" if ctx.cache_hit else "MISS",
+        "text_hash": ctx.text_hash,
+        "text_length": len(ctx.text),
+        "file_size": item.size,
+        "input_tokens": ctx.prepared.tokens,
+        "tokens_saved": ctx.prepared.saved_tokens,
+        "encoding": ctx.parsed.encoding,
+    }
+
+
+async def run_batch(items: List[BatchItem], combined: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    并发处理批次中的全部文件，按完成顺序产出结果
+
+    产出的事件：
+        file: 单个文件的结果（status 为 ok 时含 mindmap_data，为 error 时含 status_code 与 error）
+        combined: 总览导图（combined 为true且至少一个文件成功时）
+        done: 汇总（文件数、成功数、失败数）
+
+    迭代提前结束（例如客户端断开）时取消尚未完成的文件。
+
+    Args:
+        items: 批次中的文件
+        combined: 是否在全部文件完成后生成总览导图
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.create_task(_process_item(item, semaphore)) for item in items]
+    succeeded: List[Dict[str, Any]] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["status"] == "ok":
+                succeeded.append(result)
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if combined and succeeded:
+        succeeded.sort(key=lambda result: result["index"])
+        mindmap = await generate_combined_mindmap_async(
+            [(result["filename"], result["mindmap_data"]) for result in succeeded]
+        )
+        yield {"event": "combined", "status": "ok", "files": len(succeeded), "mindmap_data": mindmap}
+
+    yield {
+        "event": "done",
+        "files": len(items),
+        "succeeded": len(succeeded),
+        "failed": len(items) - len(succeeded),
+    }
@@ -0,0 +1,246 @@
+"""
+缓存模块
+基于内容哈希的思维导图结果缓存，包含内存LRU层、可选的SQLite磁盘层和多工作进程共享层
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from typing import Optional
+
+from cachetools import TTLCache
+
+from .shared_state import SharedState, shared_state
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化文本，使内容相同但换行符、行尾空白不同的输入得到相同的缓存键
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        规范化后的文本
+    """
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [line.rstrip() for line in text.split('\n')]
+    return '\n'.join(lines).strip()
+
+
+def build_cache_key(text: str, prompt_version: str, model_name: str) -> str:
+    """
+    根据规范化文本、提示词版本和模型名称计算缓存键
+
+    Args:
+        text: 输入文本
+        prompt_version: 提示词模板版本
+        model_name: 模型名称
+
+    Returns:
+        SHA-256 十六进制摘要
+    """
+    hasher = hashlib.sha256()
+    hasher.update(prompt_version.encode('utf-8'))
+    hasher.update(b'\0')
+    hasher.update(model_name.encode('utf-8'))
+    hasher.update(b'\0')
+    hasher.update(normalize_text(text).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class MindmapCache:
+    """
+    思维导图结果缓存（内存LRU + 可选磁盘层 + 可选共享层）
+
+    磁盘层与共享层的读写是阻塞的数据库操作，异步代码应使用 get_async / set_async，
+    内存层直接在事件循环中查询，只有回落到磁盘层或共享层时才进入线程池。
+    内存层与磁盘层各用一把锁，访问数据库时不持有内存层的锁。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl_seconds: float = 3600,
+        disk_path: Optional[str] = None,
+        disk_ttl_seconds: float = 7 * 24 * 3600,
+        state: Optional[SharedState] = None,
+    ):
+        """
+        Args:
+            max_size: 内存层最多缓存的条目数，超出后按LRU淘汰
+            ttl_seconds: 内存层条目的存活时间（秒）
+            disk_path: SQLite 数据库文件路径，为空时不启用磁盘层
+            disk_ttl_seconds: 磁盘层条目的存活时间（秒），小于等于0表示永不过期，共享层沿用
+            state: 进程间共享的状态后端，其他工作进程生成的结果也能命中；进程内后端不启用共享层
+        """
+        self._memory = TTLCache(maxsize=max_size, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._disk_ttl = disk_ttl_seconds
+        self._db = None
+        self._state = state if state is not None and state.shared else None
+        self.hits = 0
+        self.misses = 0
+
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS mindmap_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+                logger.info(f"思维导图磁盘缓存已启用: {disk_path}")
+            except sqlite3.Error as e:
+                logger.error(f"磁盘缓存初始化失败，仅使用内存缓存: {e}")
+                self._db = None
+
+    @classmethod
+    def from_env(cls) -> "MindmapCache":
+        """根据环境变量创建缓存实例"""
+        return cls(
+            max_size=int(os.environ.get("MINDMAP_CACHE_SIZE", "256")),
+            ttl_seconds=float(os.environ.get("MINDMAP_CACHE_TTL", "3600")),
+            disk_path=os.environ.get("MINDMAP_CACHE_DB") or None,
+            disk_ttl_seconds=float(os.environ.get("MINDMAP_CACHE_DISK_TTL", str(7 * 24 * 3600))),
+            state=shared_state,
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存，内存未命中时依次回落到磁盘层和共享层并回填内存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的思维导图Markdown，未命中时返回None
+        """
+        value = self._memory_get(key)
+        if value is None and self._has_slow_layers():
+            value = self._slow_get(key)
+        return self._count(value)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get 的异步版本，回落到磁盘层和共享层时在线程池中查询"""
+        value = self._memory_get(key)
+        if value is None and self._has_slow_layers():
+            value = await asyncio.to_thread(self._slow_get, key)
+        return self._count(value)
+
+    def set(self, key: str, value: str) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 思维导图Markdown
+        """
+        with self._lock:
+            self._memory[key] = value
+        if self._has_slow_layers():
+            self._slow_set(key, value)
+
+    async def set_async(self, key: str, value: str) -> None:
+        """set 的异步版本，写入磁盘层和共享层在线程池中进行"""
+        with self._lock:
+            self._memory[key] = value
+        if self._has_slow_layers():
+            await asyncio.to_thread(self._slow_set, key, value)
+
+    def _has_slow_layers(self) -> bool:
+        return self._db is not None or self._state is not None
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._memory.get(key)
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _slow_get(self, key: str) -> Optional[str]:
+        """依次查询磁盘层和共享层，命中时回填内存"""
+        value = None
+        if self._db is not None:
+            value = self._disk_get(key)
+        if value is None and self._state is not None:
+            value = self._shared_get(key)
+        if value is not None:
+            with self._lock:
+                self._memory[key] = value
+        return value
+
+    def _slow_set(self, key: str, value: str) -> None:
+        if self._db is not None:
+            with self._db_lock:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO mindmap_cache (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, value, time.time())
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"写入磁盘缓存失败: {e}")
+        if self._state is not None:
+            try:
+                self._state.set("mindmap", key, value, ttl=self._disk_ttl if self._disk_ttl > 0 else None)
+            except Exception as e:
+                logger.warning(f"写入共享缓存失败: {e}")
+
+    def clear(self) -> None:
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM mindmap_cache")
+                self._db.commit()
+
+    def _shared_get(self, key: str) -> Optional[str]:
+        """从共享层读取条目，共享状态不可用时视为未命中"""
+        try:
+            return self._state.get("mindmap", key)
+        except Exception as e:
+            logger.warning(f"读取共享缓存失败: {e}")
+            return None
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        """从磁盘层读取条目，过期条目会被删除"""
+        with self._db_lock:
+            try:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM mindmap_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                value, created_at = row
+                if self._disk_ttl > 0 and time.time() - created_at > self._disk_ttl:
+                    self._db.execute("DELETE FROM mindmap_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    return None
+                return value
+            except sqlite3.Error as e:
+                logger.warning(f"读取磁盘缓存失败: {e}")
+                return None
+
+
+# 全局缓存实例
+mindmap_cache = MindmapCache.from_env()
@@ -0,0 +1,217 @@
+"""
+文本分块模块
+将超长文本按结构边界切分为不超过token预算的分块，供分块生成（map-reduce）使用；
+以及按内容确定边界的稳定分节，供增量生成使用
+"""
+
+import re
+import hashlib
+from typing import List, Tuple
+
+# 结构边界及合并片段时使用的连接符，按优先级从高到低依次尝试：
+# Markdown标题、分页符、空行（段落/PDF页）、换行（SRT字幕条）
+_SEPARATORS = [
+    (re.compile(r'\n(?=#{1,6} )'), '\n'),
+    (re.compile(r'\f'), '\n\n'),
+    (re.compile(r'\n\s*\n'), '\n\n'),
+    (re.compile(r'\n'), '\n'),
+]
+
+# 标题行（分节时总是作为新单元的开头）
+_HEADING_LINE = re.compile(r'^#{1,6} ')
+
+# 中日韩字符，大致按一个字符一个token估算
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的token数，无需调用模型接口
+
+    中日韩字符按每字符1个token计，其余字符按每4个字符1个token计。
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        估算的token数
+    """
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    按结构边界将文本切分为若干分块，每块估算token数不超过max_tokens
+
+    优先在标题处切分，其次是分页符、段落、单行；单行仍超出预算时按字符硬切。
+
+    Args:
+        text: 输入文本
+        max_tokens: 每个分块的token上限
+
+    Returns:
+        分块列表（保持原文顺序）
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    return _split_recursive(text, max_tokens, 0)
+
+
+def _split_recursive(text: str, max_tokens: int, level: int) -> List[str]:
+    """使用第level级分隔符切分文本，并将片段贪心合并为不超预算的分块"""
+    if level >= len(_SEPARATORS):
+        return _hard_split(text, max_tokens)
+
+    separator, joiner = _SEPARATORS[level]
+    pieces = [p for p in separator.split(text) if p.strip()]
+    if len(pieces) <= 1:
+        return _split_recursive(text, max_tokens, level + 1)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+
+        if piece_tokens > max_tokens:
+            if current:
+                chunks.append(joiner.join(current).strip())
+                current, current_tokens = [], 0
+            chunks.extend(_split_recursive(piece, max_tokens, level + 1))
+            continue
+
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(joiner.join(current).strip())
+            current, current_tokens = [], 0
+
+        current.append(piece)
+        current_tokens += piece_tokens
+
+    if current:
+        chunks.append(joiner.join(current).strip())
+
+    return [chunk for chunk in chunks if chunk]
+
+
+def _hard_split(text: str, max_tokens: int) -> List[str]:
+    """没有可用的结构边界时按估算token数硬切"""
+    chunks = []
+    step = max(1, max_tokens // 4)
+    start = 0
+    while start < len(text):
+        # 先按最保守的每字符1个token取一段，再在预算内尽量延长
+        end = min(len(text), start + max(1, max_tokens))
+        while end < len(text) and estimate_tokens(text[start:end + step]) <= max_tokens:
+            end = min(len(text), end + step)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def split_into_groups(texts: List[str], max_tokens: int) -> List[List[str]]:
+    """
+    按顺序将多段文本贪心分组，使每组的估算token数之和不超过max_tokens
+
+    单段文本本身超出预算时独占一组。
+
+    Args:
+        texts: 文本列表
+        max_tokens: 每组的token上限
+
+    Returns:
+        分组后的文本列表
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_into_sections(text: str, target_tokens: int, max_tokens: int) -> List[str]:
+    """
+    将文本切分为稳定的分节，供增量生成按节复用结果
+
+    文本先拆为单元（段落；没有空行的文本如SRT字幕按行），再按内容确定的边界
+    （content-defined chunking）聚合成约 target_tokens 的分节：单元在累计达到
+    下限后，是否作为节尾只取决于它自身内容的哈希，标题行在达到下限后总是开启新节。
+    因此局部修改只会影响附近一两个分节的边界，其余分节的文本保持不变。
+
+    Args:
+        text: 输入文本
+        target_tokens: 分节的期望token数
+        max_tokens: 单个分节的token上限
+
+    Returns:
+        分节列表（保持原文顺序）
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    units, joiner = _split_units(text)
+    min_tokens = target_tokens // 4
+    span = max(1, target_tokens - min_tokens)
+
+    sections = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        pieces = split_into_chunks(unit, max_tokens) if estimate_tokens(unit) > max_tokens else [unit]
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            starts_heading = _HEADING_LINE.match(piece) is not None
+            if current and (current_tokens + tokens > max_tokens
+                            or (starts_heading and current_tokens >= min_tokens)):
+                sections.append(joiner.join(current))
+                current, current_tokens = [], 0
+
+            current.append(piece)
+            current_tokens += tokens
+            if current_tokens >= min_tokens and _is_boundary(piece, tokens, span):
+                sections.append(joiner.join(current))
+                current, current_tokens = [], 0
+
+    if current:
+        sections.append(joiner.join(current))
+    return sections
+
+
+def _split_units(text: str) -> Tuple[List[str], str]:
+    """按空行拆分段落（标题行单独开启新段落）；文本没有空行时按行拆分"""
+    lines = text.split('\n')
+    if all(line.strip() for line in lines):
+        return lines, '\n'
+
+    units = []
+    current = []
+    for line in lines:
+        if not line.strip() or _HEADING_LINE.match(line):
+            if current:
+                units.append('\n'.join(current))
+                current = []
+            if not line.strip():
+                continue
+        current.append(line)
+    if current:
+        units.append('\n'.join(current))
+    return units, '\n\n'
+
+
+def _is_boundary(unit: str, tokens: int, span: int) -> bool:
+    """以与单元大小成正比的概率（由内容哈希决定）将该单元作为节尾，使分节的期望大小与单元粒度无关"""
+    digest = hashlib.blake2b(unit.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') < min(1.0, tokens / span) * 2 ** 64
@@ -0,0 +1,170 @@
+"""
+输入预处理模块
+调用模型之前压缩输入文本：合并多余空白、去掉每页重复的页眉页脚和滚动字幕产生的重复行，
+统计压缩前后的token数，并按单个请求的token预算拒绝过大的输入
+"""
+
+import os
+import re
+import math
+from collections import Counter
+from typing import List, NamedTuple, Optional
+
+from .chunking import estimate_tokens
+from .metrics import INPUT_TOKENS_SAVED
+
+# 是否在调用模型前压缩输入
+PROMPT_COMPACTION = os.environ.get("PROMPT_COMPACTION", "1") == "1"
+
+# 单个请求发送给模型的输入token预算（0表示不限制）；长文档分块生成时按全部分块（各带一份提示词）的总量计算
+INPUT_TOKEN_BUDGET = int(os.environ.get("INPUT_TOKEN_BUDGET", "200000"))
+
+# 同一行出现在至少这么多个文本块（PDF页、段落）的首尾，且不少于文本块总数的一定比例时，视为页眉页脚
+BOILERPLATE_MIN_REPEATS = 3
+_BOILERPLATE_MIN_RATIO = 0.3
+# 页眉页脚通常较短，较长的行不视为样板
+_BOILERPLATE_MAX_CHARS = 120
+# 每个文本块首尾各检查的行数
+_BOILERPLATE_EDGE_LINES = 2
+# 去掉的样板超过全文的该比例时视为误判
+_BOILERPLATE_MAX_REMOVED_RATIO = 0.5
+
+_ZERO_WIDTH = re.compile('[\u200b\u200c\u200d\u2060\ufeff]')
+_INLINE_WHITESPACE = re.compile('[ \t\u00a0\u3000]+')
+_BLOCK_SEPARATOR = re.compile(r'\n{2,}')
+_DIGITS = re.compile(r'\d+')
+
+
+class TokenBudgetExceeded(ValueError):
+    """请求发送给模型的输入超过token预算"""
+
+    def __init__(self, tokens: int, budget: int):
+        super().__init__(f"输入文本约{tokens}个token，超过单个请求{budget}个token的预算")
+        self.tokens = tokens
+        self.budget = budget
+
+
+class PreparedInput(NamedTuple):
+    """预处理后的模型输入"""
+    text: str
+    # 压缩后的token数
+    tokens: int
+    # 压缩节省的token数（本地估算）
+    saved_tokens: int
+
+
+def _collapse_line(line: str) -> str:
+    """合并行内连续空白，保留行首缩进（Markdown列表层级依赖缩进）"""
+    body = line.lstrip(' \t')
+    if not body:
+        return ''
+    indent = line[:len(line) - len(body)]
+    return indent + _INLINE_WHITESPACE.sub(' ', body).rstrip()
+
+
+def _drop_repeated_lines(lines: List[str]) -> List[str]:
+    """去掉与上一行完全相同的行（滚动字幕每条都会重复上一条的内容）"""
+    kept = []
+    previous = None
+    for line in lines:
+        if line and line == previous:
+            continue
+        kept.append(line)
+        previous = line
+    return kept
+
+
+def _boilerplate_key(line: str) -> Optional[str]:
+    """页眉页脚的比较键：忽略数字（页码），标题行和过长的行不参与比较"""
+    line = line.strip()
+    if not line or line.startswith('#') or len(line) > _BOILERPLATE_MAX_CHARS:
+        return None
+    return _DIGITS.sub('#', line)
+
+
+def _strip_boilerplate(text: str) -> str:
+    """去掉反复出现在文本块首尾的行（PDF每页的页眉、页脚和页码）"""
+    blocks = _BLOCK_SEPARATOR.split(text)
+    if len(blocks) < BOILERPLATE_MIN_REPEATS:
+        return text
+
+    # 页眉只在块首、页脚只在块尾，分别计数
+    edge_counts = Counter()
+    for block in blocks:
+        lines = block.split('\n')
+        edges = {('head', key) for key in map(_boilerplate_key, lines[:_BOILERPLATE_EDGE_LINES]) if key is not None}
+        edges |= {('tail', key) for key in map(_boilerplate_key, lines[-_BOILERPLATE_EDGE_LINES:]) if key is not None}
+        edge_counts.update(edges)
+
+    threshold = max(BOILERPLATE_MIN_REPEATS, math.ceil(len(blocks) * _BOILERPLATE_MIN_RATIO))
+    boilerplate = {edge for edge, count in edge_counts.items() if count >= threshold}
+    if not boilerplate:
+        return text
+
+    kept_blocks = []
+    for block in blocks:
+        lines = block.split('\n')
+        start, end = 0, len(lines)
+        while start < min(end, _BOILERPLATE_EDGE_LINES) and ('head', _boilerplate_key(lines[start])) in boilerplate:
+            start += 1
+        while end > max(start, len(lines) - _BOILERPLATE_EDGE_LINES) and ('tail', _boilerplate_key(lines[end - 1])) in boilerplate:
+            end -= 1
+        if start < end:
+            kept_blocks.append('\n'.join(lines[start:end]))
+    stripped = '\n\n'.join(kept_blocks)
+
+    # 页眉页脚只占很小一部分，去掉过半内容说明误判了（例如格式整齐的短段落），保留原文
+    if len(text) - len(stripped) > len(text) * _BOILERPLATE_MAX_REMOVED_RATIO:
+        return text
+    return stripped
+
+
+def compact_text(text: str) -> str:
+    """
+    压缩输入文本，不改变其内容
+
+    依次：去掉零宽字符、统一换行符、合并行内空白、去掉连续重复的行、
+    去掉反复出现在文本块首尾的页眉页脚、将多个空行合并为一个。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        压缩后的文本
+    """
+    text = _ZERO_WIDTH.sub('', text).replace('\r\n', '\n').replace('\r', '\n')
+    lines = _drop_repeated_lines([_collapse_line(line) for line in text.split('\n')])
+    text = _BLOCK_SEPARATOR.sub('\n\n', '\n'.join(lines).strip())
+    return _strip_boilerplate(text)
+
+
+def compact_input(text: str) -> PreparedInput:
+    """
+    压缩输入文本并用本地估算统计token数（PROMPT_COMPACTION=0 时只统计）
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        预处理后的输入
+    """
+    original_tokens = estimate_tokens(text)
+    if not PROMPT_COMPACTION:
+        return PreparedInput(text, original_tokens, 0)
+
+    compacted = compact_text(text)
+    tokens = estimate_tokens(compacted)
+    saved_tokens = max(original_tokens - tokens, 0)
+    INPUT_TOKENS_SAVED.inc(saved_tokens)
+    return PreparedInput(compacted, tokens, saved_tokens)
+
+
+def check_token_budget(tokens: int) -> None:
+    """
+    检查请求发送给模型的输入是否超过token预算
+
+    Raises:
+        TokenBudgetExceeded: 超过 INPUT_TOKEN_BUDGET 时
+    """
+    if INPUT_TOKEN_BUDGET > 0 and tokens > INPUT_TOKEN_BUDGET:
+        raise TokenBudgetExceeded(tokens, INPUT_TOKEN_BUDGET)
@@ -0,0 +1,156 @@
+"""
+编码检测模块
+通过BOM嗅探和有限样本的统计推测确定文本编码，整份内容只解码一次
+"""
+
+import codecs
+import logging
+from typing import Tuple
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+    logging.warning("charset-normalizer not installed, falling back to utf-8/gb18030/latin-1 detection")
+
+# 参与统计推测的样本大小
+SAMPLE_SIZE = 16 * 1024
+
+# 样本过短时统计结果不可靠，优先按简体中文（GB18030）处理
+_SHORT_SAMPLE_SIZE = 1024
+
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# 限定统计推测的候选编码，避免把常见编码误判为冷门代码页
+_CANDIDATE_ENCODINGS = [
+    'utf_8', 'gb18030', 'big5', 'utf_16', 'utf_16_le', 'utf_16_be', 'cp932', 'euc_kr', 'cp1252', 'latin_1'
+]
+
+# UTF-8 解码出错后重新推测编码时，窗口起点相对出错位置的回退字节数
+_RETRY_LOOKBEHIND = 1024
+
+# GBK/GB2312 均为 GB18030 的子集，统一使用 GB18030 解码
+_ENCODING_ALIASES = {
+    'gbk': 'gb18030',
+    'gb2312': 'gb18030',
+}
+
+
+def _is_utf8(sample: bytes) -> bool:
+    """判断样本是否为合法UTF-8（允许样本末尾截断半个字符）"""
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _can_decode(sample: bytes, encoding: str) -> bool:
+    """判断样本能否按指定编码解码（允许样本末尾截断半个字符）"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _normalize_encoding(encoding: str) -> str:
+    """统一编码名称，例如 utf_8 -> utf-8、gbk -> gb18030"""
+    name = codecs.lookup(encoding).name
+    return _ENCODING_ALIASES.get(name, name)
+
+
+def detect_encoding(data: bytes) -> str:
+    """
+    检测字节内容的编码
+
+    依次使用：BOM嗅探、样本UTF-8校验、短样本GB18030校验、charset-normalizer统计推测，
+    均无结果时返回 latin-1。只检查前 SAMPLE_SIZE 字节。
+
+    Args:
+        data: 文件字节内容
+
+    Returns:
+        Python 编解码器名称
+    """
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding
+
+    return _detect_sample_encoding(data[:SAMPLE_SIZE], at_end=len(data) <= SAMPLE_SIZE)
+
+
+def _detect_sample_encoding(sample: bytes, at_end: bool) -> str:
+    """对不含BOM的样本推测编码"""
+    if _is_utf8(sample):
+        return 'utf-8'
+
+    if not at_end:
+        # 在最后一个换行处截断，避免样本末尾残留半个多字节字符干扰统计推测
+        # （GBK/Big5/Shift_JIS 的尾字节都不会是 0x0A）
+        cut = sample.rfind(b'\n')
+        if cut > 0:
+            # UTF-16LE 的换行为 0A 00，保留后面的 00 使样本长度为偶数
+            if cut + 1 < len(sample) and sample[cut + 1] == 0:
+                cut += 1
+            sample = sample[:cut + 1]
+
+    if len(sample) < _SHORT_SAMPLE_SIZE and _can_decode(sample, 'gb18030'):
+        return 'gb18030'
+
+    if from_bytes is not None:
+        best = from_bytes(sample, cp_isolation=_CANDIDATE_ENCODINGS).best()
+        if best is not None:
+            return _normalize_encoding(best.encoding)
+
+    # 统计推测无结果时按常见程度依次尝试
+    for encoding in ('gb18030', 'big5', 'cp932'):
+        if _can_decode(sample, encoding):
+            return encoding
+
+    return 'latin-1'
+
+
+def decode_text(data: bytes) -> Tuple[str, str]:
+    """
+    检测编码并对整份内容只解码一次
+
+    样本全为ASCII而之后出现非ASCII内容时，以该处内容重新推测一次编码；
+    其余情况下出现个别非法字节时以替换字符代替，而不是换一种编码重新解码。
+
+    Args:
+        data: 文件字节内容
+
+    Returns:
+        (解码后的文本, 检测到的编码)
+    """
+    encoding = detect_encoding(data)
+    if encoding != 'utf-8':
+        return _decode_with_replacement(data, encoding), encoding
+    
+    try:
+        return data.decode(encoding), encoding
+    except UnicodeDecodeError as e:
+        # 出错位置之前少量字节可能恰好构成合法UTF-8序列，窗口从稍早的位置开始
+        start = max(0, e.start - _RETRY_LOOKBEHIND)
+        if start < SAMPLE_SIZE or not data[:start].isascii():
+            return _decode_with_replacement(data, encoding), encoding
+
+    # 样本全是ASCII、非ASCII内容出现在样本之后：以出错位置附近的内容重新推测一次
+    window = data[start:start + SAMPLE_SIZE]
+    encoding = _detect_sample_encoding(window, at_end=start + SAMPLE_SIZE >= len(data))
+    return _decode_with_replacement(data, encoding), encoding
+
+
+def _decode_with_replacement(data: bytes, encoding: str) -> str:
+    """单次解码，个别非法字节以替换字符代替"""
+    text = data.decode(encoding, errors='replace')
+    if '\ufffd' in text:
+        logging.warning(f"按 {encoding} 解码时遇到非法字节，已替换为占位字符")
+    return text
@@ -1,261 +1,873 @@
 """
 文件解析模块
 支持多种文件格式的文本提取功能
+
+每种格式由一个注册的解析器类描述：扩展名、可嗅探的文件头（magic bytes）和所需的第三方库。
+解析器以迭代器的形式逐块提取文本（PDF按页、DOCX按段落、SRT按时间段），限制解析过程中的内存占用；
+parse_file 等函数将文本块拼接为完整文本，下游阶段都基于完整文本处理。
 """
 
 import io
 import os
-from typing import Optional
+import sys
+import codecs
+import mmap
+import tempfile
+import zipfile
+import importlib
+import importlib.util
+from abc import ABC, abstractmethod
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Iterable, Iterator, Optional, List, Tuple, NamedTuple, Dict
 import logging
 
-# 导入必要的库
-try:
-    from docx import Document
-except ImportError:
-    Document = None
-    logging.warning("python-docx not installed, .docx files will not be supported")
+from .encoding import decode_text
+from .metrics import ERRORS, PARSE_SECONDS, timed
+from .process_pool import LazyProcessPool
+from .subtitles import Cue, format_timestamp, merge_rolling_captions, segment_cues
+
+
+class ParserDependency(NamedTuple):
+    """解析某种格式所需的第三方库"""
+    module: str
+    package: str
+
+
+class TextBlocks(NamedTuple):
+    """
+    解析器输出的文本块流
+
+    生成流水线在 parse 阶段即拼接为完整文本：压缩、token预算、缓存键和分块都基于完整文本，
+    逐块产出只用于限制解析过程中的内存占用（PDF逐页、DOCX逐段），不让下游提前开始处理。
+    """
+    blocks: Iterator[str]
+    # 拼接完整文本时块之间的分隔符
+    separator: str
+    # 文本类格式（TXT/MD/SRT）检测到的编码，PDF/DOCX 为 None
+    encoding: Optional[str] = None
+
+    def join(self) -> str:
+        """消费全部文本块，拼接为完整文本"""
+        return self.separator.join(self.blocks)
+
+
+class ParseResult(NamedTuple):
+    """文件解析结果"""
+    text: str
+    # 文本类格式（TXT/MD/SRT）检测到的编码，PDF/DOCX 为 None
+    encoding: Optional[str] = None
+
+
+# 上传文件大小限制
+MAX_FILE_SIZE_MB = 50
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+
+# 内容嗅探读取的文件头字节数
+SNIFF_SIZE = 1024
+
+# PDF并行解析：页数达到阈值时启用（0表示禁用），以及进程池大小
+PDF_PARALLEL_PAGE_THRESHOLD = int(os.environ.get("PDF_PARALLEL_PAGE_THRESHOLD", "64"))
+PDF_PARALLEL_WORKERS = int(os.environ.get("PDF_PARALLEL_WORKERS", str(os.cpu_count() or 2)))
+_pdf_pool = LazyProcessPool(PDF_PARALLEL_WORKERS)
+
+# DOCX使用流式XML解析（1）或 python-docx 对象模型（0）
+DOCX_FAST_PATH = os.environ.get("DOCX_FAST_PATH", "1") == "1"
+
+# SRT按时间窗口分段的时长（秒），0表示不分段、逐条输出字幕
+SRT_SEGMENT_SECONDS = float(os.environ.get("SRT_SEGMENT_SECONDS", "60"))
+
+# 解析输出格式的版本号：修改任一解析器的输出时提升，使已存储的解析结果失效
+PARSER_VERSION = 2
+
+
+class FileParser(ABC):
+    """
+    解析器基类
+
+    子类声明扩展名、文件头和依赖库，并实现 open_bytes；
+    能直接读取磁盘文件的解析器同时覆盖 open_path。
+    第三方库在首次解析该格式时才导入，避免拖慢冷启动。
+    """
+
+    # 格式名称，用于指标标签
+    name: str = ""
+    # 错误信息中显示的格式名称
+    label: str = ""
+    extensions: Tuple[str, ...] = ()
+    # 文件头前缀，用于识别扩展名不符的文件
+    magic: Tuple[bytes, ...] = ()
+    dependency: Optional[ParserDependency] = None
+    # 拼接完整文本时块之间的分隔符
+    separator: str = '\n'
+
+    def load(self) -> Optional[ModuleType]:
+        """
+        导入解析该格式所需的第三方库
+
+        Raises:
+            ValueError: 库未安装时
+        """
+        if self.dependency is None:
+            return None
+        try:
+            return importlib.import_module(self.dependency.module)
+        except ImportError:
+            raise ValueError(f"{self.dependency.package}库未安装，无法解析{self.label}文件")
+
+    def is_installed(self) -> bool:
+        """判断所需的第三方库是否可用（不实际导入）"""
+        return self.dependency is None or _is_installed(self.dependency.module)
+
+    def sniff(self, head: bytes) -> bool:
+        """根据文件开头的字节判断内容是否为该格式"""
+        return any(head.startswith(magic) for magic in self.magic)
+
+    @abstractmethod
+    def open_bytes(self, file_bytes: bytes) -> TextBlocks:
+        """
+        解析内存中的文件内容
+
+        Args:
+            file_bytes: 文件字节内容
+
+        Returns:
+            文本块流；文本块在迭代时才逐块提取
+
+        Raises:
+            ValueError: 依赖库未安装、解码失败，或迭代过程中解析失败时
+        """
+
+    def open_path(self, file_path: str) -> TextBlocks:
+        """解析磁盘上的文件，默认读入内存后交给 open_bytes"""
+        with open(file_path, 'rb') as f:
+            return self.open_bytes(f.read())
+
+    def parse(self, file_bytes: bytes) -> ParseResult:
+        """解析文件内容并拼接为完整文本"""
+        stream = self.open_bytes(file_bytes)
+        return ParseResult(stream.join(), stream.encoding)
+
+    def _guard(self, blocks: Iterable[str]) -> Iterator[str]:
+        """将迭代过程中的解析异常统一转换为 ValueError"""
+        try:
+            yield from blocks
+        except Exception as e:
+            raise ValueError(f"{self.label}文件解析失败: {str(e)}") from e
+
+
+class TextParser(FileParser):
+    """纯文本解析器：检测编码后整体解码，按空行分隔的段落输出"""
+
+    name = "txt"
+    label = "TXT"
+    extensions = ('.txt',)
+    separator = '\n\n'
+
+    def open_bytes(self, file_bytes: bytes) -> TextBlocks:
+        self.load()
+        # 检测编码后只解码一次
+        try:
+            content, encoding = decode_text(file_bytes)
+        except Exception as e:
+            raise ValueError(f"文件解码失败: {str(e)}")
+        return TextBlocks(self._guard(self._iter_text(content)), self.separator, encoding)
+
+    def _iter_text(self, content: str) -> Iterator[str]:
+        """按空行切分段落，以 separator 拼接后与原文（去除首尾空白）一致"""
+        content = content.strip()
+        start = 0
+        while True:
+            end = content.find('\n\n', start)
+            if end == -1:
+                yield content[start:]
+                return
+            yield content[start:end]
+            start = end + 2
+
+
+class MarkdownParser(TextParser):
+    """Markdown解析器：保留Markdown格式"""
+
+    name = "md"
+    label = "Markdown"
+    extensions = ('.md',)
+
+
+class SrtParser(TextParser):
+    """
+    SRT字幕解析器
+
+    逐条读取字幕（不缓存整个字幕列表），合并自动字幕的滚动重复后按时间窗口分段，
+    每段以 [HH:MM:SS] 起始时间戳开头；segment_seconds 为0时逐条输出去重后的字幕文本。
+    """
+
+    name = "srt"
+    label = "SRT"
+    extensions = ('.srt',)
+    dependency = ParserDependency('srt', 'srt')
+    separator = '\n'
+
+    def __init__(self, segment_seconds: float = SRT_SEGMENT_SECONDS):
+        """
+        Args:
+            segment_seconds: 每段覆盖的时长（秒），0表示不分段
+        """
+        self.segment_seconds = segment_seconds
+        if segment_seconds > 0:
+            self.separator = '\n\n'
+
+    def _iter_text(self, content: str) -> Iterator[str]:
+        srt = self.load()
+        subtitles = srt.parse(content)
+        cues = merge_rolling_captions(
+            Cue(subtitle.start.total_seconds(), subtitle.end.total_seconds(), subtitle.content)
+            for subtitle in subtitles
+        )
+        if self.segment_seconds <= 0:
+            for cue in cues:
+                yield cue.text
+            return
+
+        for segment in segment_cues(cues, self.segment_seconds):
+            yield f"[{format_timestamp(segment.start)}] {segment.text}"
+
+
+class DocxParser(FileParser):
+    """
+    DOCX解析器
+
+    默认直接从ZIP中流式解析 word/document.xml（lxml.iterparse），按文档顺序输出段落和表格单元格文本，
+    合并单元格只输出一次，已处理的元素随即释放，内存占用与文档大小无关；
+    fast_path=False 时使用 python-docx 对象模型，先输出全部段落，再输出表格单元格文本。
+    """
+
+    name = "docx"
+    label = "DOCX"
+    extensions = ('.docx',)
+    # DOCX 是 ZIP 容器
+    magic = (b'PK\x03\x04',)
+    separator = '\n'
+
+    def __init__(self, fast_path: bool = True):
+        """
+        Args:
+            fast_path: 是否使用流式XML解析
+        """
+        self.fast_path = fast_path
+
+    @property
+    def dependency(self) -> ParserDependency:
+        if self.fast_path:
+            return ParserDependency('lxml.etree', 'lxml')
+        return ParserDependency('docx', 'python-docx')
+
+    def open_bytes(self, file_bytes: bytes) -> TextBlocks:
+        return self._open(io.BytesIO(file_bytes))
+
+    def open_path(self, file_path: str) -> TextBlocks:
+        # 直接从磁盘解析，不将整个文件复制到内存
+        return self._open(file_path)
+
+    def _open(self, source) -> TextBlocks:
+        module = self.load()
+        extract = _iter_docx_xml if self.fast_path else _iter_docx_object_model
+        return TextBlocks(self._guard(extract(module, source)), self.separator)
+
 
-try:
-    import PyPDF2
-except ImportError:
-    PyPDF2 = None
-    logging.warning("PyPDF2 not installed, .pdf files will not be supported")
+def _iter_docx_object_model(docx: ModuleType, source) -> Iterator[str]:
+    """通过 python-docx 对象模型提取段落和表格文本"""
+    doc = docx.Document(source)
 
-try:
-    import srt
-except ImportError:
-    srt = None
-    logging.warning("srt not installed, .srt files will not be supported")
+    # 提取所有段落的文本
+    for paragraph in doc.paragraphs:
+        text = paragraph.text.strip()
+        if text:  # 只输出非空段落
+            yield text
+
+    # 提取表格中的文本
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                text = cell.text.strip()
+                if text:
+                    yield text
+
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_BODY = _W + 'body'
+_W_SDT_CONTENT = _W + 'sdtContent'
+_W_P = _W + 'p'
+_W_TC = _W + 'tc'
+_W_R = _W + 'r'
+_W_HYPERLINK = _W + 'hyperlink'
+_W_T = _W + 't'
+_W_BR = _W + 'br'
+_W_TYPE = _W + 'type'
+_W_VAL = _W + 'val'
+
+# 与 python-docx 的 Run.text 一致：制表符、换行和不间断连字符转换为对应字符
+_RUN_CHARACTERS = {
+    _W + 'tab': '\t',
+    _W + 'ptab': '\t',
+    _W + 'cr': '\n',
+    _W + 'noBreakHyphen': '-',
+}
+
+# 段落的直接父元素为这些元素时才是正文或单元格段落（排除文本框等嵌套段落）
+_BLOCK_CONTAINERS = (_W_BODY, _W_SDT_CONTENT, _W_TC)
+
+
+def _docx_paragraph_text(paragraph) -> str:
+    """提取段落中直接包含的文本（含超链接），与 python-docx 的 Paragraph.text 一致"""
+    parts = []
+    for child in paragraph:
+        if child.tag == _W_R:
+            runs = (child,)
+        elif child.tag == _W_HYPERLINK:
+            runs = child.iterchildren(_W_R)
+        else:
+            continue
+        for run in runs:
+            for item in run:
+                if item.tag == _W_T:
+                    parts.append(item.text or '')
+                elif item.tag == _W_BR:
+                    # 分页符和分栏符不产生文本
+                    if item.get(_W_TYPE, 'textWrapping') == 'textWrapping':
+                        parts.append('\n')
+                else:
+                    parts.append(_RUN_CHARACTERS.get(item.tag, ''))
+    return ''.join(parts)
+
+
+def _is_merge_continuation(cell) -> bool:
+    """判断单元格是否为纵向或（旧式）横向合并的延续部分，其内容已由合并起始单元格输出"""
+    properties = cell.find(_W + 'tcPr')
+    if properties is None:
+        return False
+    for tag in (_W + 'vMerge', _W + 'hMerge'):
+        merge = properties.find(tag)
+        if merge is not None and merge.get(_W_VAL, 'continue') == 'continue':
+            return True
+    return False
+
+
+def _drop_preceding_siblings(element) -> None:
+    """删除已处理完的前序兄弟元素，使解析树的大小保持有界"""
+    parent = element.getparent()
+    while element.getprevious() is not None:
+        del parent[0]
+
+
+def _iter_docx_xml(etree: ModuleType, source) -> Iterator[str]:
+    """
+    从ZIP中流式解析 word/document.xml，按文档顺序产出段落文本和表格单元格文本
+
+    单元格内的段落以换行拼接为一个文本块（嵌套表格并入外层单元格）；
+    横向合并（gridSpan）本身只有一个单元格，纵向合并的延续单元格跳过。
+
+    Args:
+        etree: lxml.etree 模块
+        source: DOCX文件路径或文件对象
+    """
+    with zipfile.ZipFile(source) as archive:
+        with archive.open('word/document.xml') as document:
+            # 正在解析的（可能嵌套的）单元格中已提取的段落文本
+            cells: List[List[str]] = []
+            events = etree.iterparse(
+                document, events=('start', 'end'), tag=(_W_P, _W_TC),
+                resolve_entities=False, no_network=True,
+            )
+            for event, element in events:
+                if element.tag == _W_TC:
+                    if event == 'start':
+                        cells.append([])
+                        continue
+                    text = '\n'.join(cells.pop()).strip()
+                    if text and not _is_merge_continuation(element):
+                        if cells:
+                            cells[-1].append(text)
+                        else:
+                            yield text
+                    if not cells:
+                        # 顶层单元格处理完后释放它与之前的行
+                        element.clear()
+                        _drop_preceding_siblings(element)
+                        _drop_preceding_siblings(element.getparent())
+                    continue
+
+                if event == 'start' or element.getparent().tag not in _BLOCK_CONTAINERS:
+                    continue
+                text = _docx_paragraph_text(element)
+                if cells:
+                    cells[-1].append(text)
+                    continue
+                text = text.strip()
+                if text:
+                    yield text
+                element.clear()
+                _drop_preceding_siblings(element)
+
+
+class PdfParser(FileParser):
+    """
+    PDF解析器：逐页输出文本
+
+    页数达到 PDF_PARALLEL_PAGE_THRESHOLD 且文件在磁盘上时，使用进程池并行提取，
+    各进程以内存映射方式共享同一个文件；按页码顺序输出，已完成的页码区间先行产出。
+    """
+
+    name = "pdf"
+    label = "PDF"
+    extensions = ('.pdf',)
+    magic = (b'%PDF-',)
+    dependency = ParserDependency('PyPDF2', 'PyPDF2')
+    separator = '\n\n'
+
+    def sniff(self, head: bytes) -> bool:
+        # PDF规范允许文件头之前有少量其他字节
+        return head.find(self.magic[0], 0, SNIFF_SIZE) != -1
+
+    def open_bytes(self, file_bytes: bytes) -> TextBlocks:
+        PyPDF2 = self.load()
+        return TextBlocks(self._guard(self._iter_bytes(PyPDF2, file_bytes)), self.separator)
+
+    def open_path(self, file_path: str) -> TextBlocks:
+        PyPDF2 = self.load()
+        return TextBlocks(self._guard(self._iter_file(PyPDF2, file_path)), self.separator)
+
+    def _iter_bytes(self, PyPDF2: ModuleType, file_bytes: bytes) -> Iterator[str]:
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+        if not _should_parse_pdf_in_parallel(len(pdf_reader.pages)):
+            yield from _iter_pdf_text(pdf_reader, None)
+            return
+
+        # 并行解析需要各进程共享的磁盘文件
+        tmp_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        try:
+            tmp_file.write(file_bytes)
+            tmp_file.close()
+            yield from self._iter_file(PyPDF2, tmp_file.name)
+        finally:
+            os.unlink(tmp_file.name)
+
+    @staticmethod
+    def _iter_file(PyPDF2: ModuleType, pdf_path: str) -> Iterator[str]:
+        # 以内存映射方式读取，不将整个文件复制到内存
+        with open(pdf_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+                pdf_reader = PyPDF2.PdfReader(pdf_map)
+                yield from _iter_pdf_text(pdf_reader, pdf_path)
+
+
+TXT_PARSER = TextParser()
+PDF_PARSER = PdfParser()
+
+# 已注册的解析器，内容嗅探按此顺序进行
+PARSERS: List[FileParser] = [TXT_PARSER, MarkdownParser(), DocxParser(DOCX_FAST_PATH), PDF_PARSER, SrtParser()]
+
+# 解析器注册表：扩展名 -> 解析器
+PARSER_REGISTRY: Dict[str, FileParser] = {
+    file_extension: parser
+    for parser in PARSERS
+    for file_extension in parser.extensions
+}
+
+
+def _is_installed(module: str) -> bool:
+    """判断第三方库是否可用（不实际导入）"""
+    return module in sys.modules or importlib.util.find_spec(module) is not None
+
+
+def preload_parsers() -> List[str]:
+    """
+    预先导入所有已安装的解析库，供服务启动时在后台预热
+
+    Returns:
+        可以解析的格式列表
+    """
+    loaded = []
+    for file_extension, parser in PARSER_REGISTRY.items():
+        try:
+            parser.load()
+        except ValueError as e:
+            logging.warning(str(e))
+            continue
+        loaded.append(file_extension)
+    return loaded
+
+
+def sniff_format(head: bytes) -> Optional[FileParser]:
+    """
+    根据文件开头的字节识别有固定文件头的格式（PDF、DOCX）
+
+    Args:
+        head: 文件开头的字节（至少 SNIFF_SIZE 字节，文件更短时为整个文件）
+
+    Returns:
+        匹配的解析器，没有匹配时返回None
+    """
+    for parser in PARSERS:
+        if parser.magic and parser.sniff(head):
+            return parser
+    return None
+
+
+def _looks_like_text(head: bytes) -> bool:
+    """带BOM或不含NUL字节的内容视为文本"""
+    return head.startswith((codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)) or b'\x00' not in head
+
+
+def resolve_parser(filename: str, head: bytes) -> FileParser:
+    """
+    根据扩展名和文件头选择解析器
+
+    文件头与扩展名不符时以文件头为准（例如扩展名为 .txt 的PDF）；
+    扩展名为PDF/DOCX但内容是文本时按TXT解析。只检查文件头，不做完整解析。
+
+    Args:
+        filename: 文件名（包含扩展名）
+        head: 文件开头的字节
+
+    Returns:
+        解析器
+
+    Raises:
+        ValueError: 当文件格式不支持，或内容与扩展名声明的二进制格式不符时
+    """
+    file_extension = os.path.splitext(filename)[1].lower()
+    labeled = PARSER_REGISTRY.get(file_extension)
+
+    sniffed = sniff_format(head)
+    if sniffed is not None:
+        if sniffed is not labeled:
+            logging.warning(f"文件 {filename} 的内容为{sniffed.label}格式，与扩展名不符，按{sniffed.label}解析")
+        return sniffed
+
+    if labeled is None:
+        supported_formats = list(PARSER_REGISTRY)
+        raise ValueError(f"不支持的文件格式: {file_extension}。支持格式: {', '.join(supported_formats)}")
+
+    if labeled.magic:
+        # 声明为二进制格式却没有对应的文件头
+        if _looks_like_text(head):
+            logging.warning(f"文件 {filename} 的内容不是{labeled.label}格式，按文本解析")
+            return TXT_PARSER
+        raise ValueError(f"文件内容不是有效的{labeled.label}文件")
+
+    return labeled
+
+
+def _resolve_parser(filename: str, head: bytes) -> FileParser:
+    """选择解析器，并将无法解析的文件计入解析错误数"""
+    try:
+        return resolve_parser(filename, head)
+    except ValueError as e:
+        ERRORS.labels("parse", type(e).__name__).inc()
+        raise
+
+
+def _read_head(file_path: str) -> bytes:
+    with open(file_path, 'rb') as f:
+        return f.read(SNIFF_SIZE)
+
+
+def iter_file_blocks(filename: str, file_bytes: bytes) -> TextBlocks:
+    """
+    按内容选择解析器，返回逐块提取的文本流
+
+    Args:
+        filename: 文件名（包含扩展名）
+        file_bytes: 文件字节内容
+
+    Returns:
+        文本块流
+
+    Raises:
+        ValueError: 当文件格式不支持或解析失败时（迭代过程中同样可能抛出）
+    """
+    _check_size(len(file_bytes))
+    return _resolve_parser(filename, file_bytes[:SNIFF_SIZE]).open_bytes(file_bytes)
+
+
+def _check_size(file_size: int) -> None:
+    # 检查文件大小（限制为50MB）
+    if file_size > MAX_FILE_SIZE_BYTES:
+        raise ValueError(f"文件大小超过{MAX_FILE_SIZE_MB}MB限制")
 
 
 def parse_txt_content(file_bytes: bytes) -> str:
     """
     解析TXT文件内容
-    
+
     Args:
         file_bytes: 文件字节内容
-        
+
     Returns:
         提取的文本内容
     """
-    try:
-        # 尝试多种编码格式
-        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']
-        
-        for encoding in encodings:
-            try:
-                content = file_bytes.decode(encoding)
-                return content.strip()
-            except UnicodeDecodeError:
-                continue
-        
-        # 如果所有编码都失败，使用latin-1作为最后手段
-        return file_bytes.decode('latin-1', errors='ignore').strip()
-        
-    except Exception as e:
-        raise ValueError(f"TXT文件解析失败: {str(e)}")
+    return PARSER_REGISTRY['.txt'].parse(file_bytes).text
 
 
 def parse_md_content(file_bytes: bytes) -> str:
     """
     解析Markdown文件内容
-    
+
     Args:
         file_bytes: 文件字节内容
-        
+
     Returns:
         提取的文本内容（保留Markdown格式）
     """
-    try:
-        # Markdown文件通常使用UTF-8编码
-        content = file_bytes.decode('utf-8')
-        return content.strip()
-        
-    except UnicodeDecodeError:
-        # 如果UTF-8失败，尝试其他编码
-        return parse_txt_content(file_bytes)
-    except Exception as e:
-        raise ValueError(f"Markdown文件解析失败: {str(e)}")
+    return PARSER_REGISTRY['.md'].parse(file_bytes).text
 
 
 def parse_docx_content(file_bytes: bytes) -> str:
     """
     解析DOCX文件内容
-    
+
     Args:
         file_bytes: 文件字节内容
-        
+
     Returns:
         提取的文本内容
     """
-    if Document is None:
-        raise ValueError("python-docx库未安装，无法解析DOCX文件")
-    
+    return PARSER_REGISTRY['.docx'].parse(file_bytes).text
+
+
+def _iter_pdf_pages(pdf_reader, page_numbers: Iterable[int]) -> Iterator[Tuple[int, str]]:
+    """
+    逐页提取PDF文本，单页失败时记录警告并跳过
+
+    Args:
+        pdf_reader: PyPDF2.PdfReader 对象
+        page_numbers: 需要提取的页码（从0开始）
+
+    Yields:
+        (页码, 文本)，只包含非空页面
+    """
+    for page_num in page_numbers:
+        try:
+            page = pdf_reader.pages[page_num]
+            text = page.extract_text()
+            if text.strip():
+                yield page_num, text.strip()
+        except Exception as e:
+            logging.warning(f"PDF第{page_num + 1}页解析失败: {str(e)}")
+            continue
+
+
+def _extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    进程池工作函数：以内存映射方式打开共享的临时PDF文件，提取[start, end)页的文本
+    """
+    with open(pdf_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+            pdf_reader = PDF_PARSER.load().PdfReader(pdf_map)
+            return list(_iter_pdf_pages(pdf_reader, range(start, end)))
+
+
+def _iter_pdf_ranges_parallel(pdf_path: str, page_count: int) -> Iterator[Tuple[int, List[Tuple[int, str]]]]:
+    """
+    将页码区间分发到进程池并行提取，各进程以内存映射方式共享同一个PDF文件
+
+    Args:
+        pdf_path: 磁盘上的PDF文件路径
+        page_count: 总页数
+
+    Yields:
+        按页码顺序的 (区间结束页码, 该区间的 (页码, 文本) 列表)
+    """
+    # 每个进程分到若干个区间，避免单个区间过大导致负载不均
+    range_count = PDF_PARALLEL_WORKERS * 4
+    range_size = max(1, -(-page_count // range_count))
+    pool = _pdf_pool.get()
+    futures = []
+    for start in range(0, page_count, range_size):
+        end = min(start + range_size, page_count)
+        futures.append((end, pool.submit(_extract_pdf_page_range, pdf_path, start, end)))
+
     try:
-        # 创建内存文件对象
-        doc_stream = io.BytesIO(file_bytes)
-        doc = Document(doc_stream)
-        
-        # 提取所有段落的文本
-        paragraphs = []
-        for paragraph in doc.paragraphs:
-            text = paragraph.text.strip()
-            if text:  # 只添加非空段落
-                paragraphs.append(text)
-        
-        # 提取表格中的文本
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text = cell.text.strip()
-                    if text:
-                        paragraphs.append(text)
-        
-        return '\n'.join(paragraphs)
-        
-    except Exception as e:
-        raise ValueError(f"DOCX文件解析失败: {str(e)}")
+        for end, future in futures:
+            yield end, future.result()
+    except BrokenProcessPool:
+        _pdf_pool.discard()
+        raise
+    finally:
+        # 下游提前停止读取或出错时，取消尚未开始的区间
+        for _, future in futures:
+            future.cancel()
+
+
+def _should_parse_pdf_in_parallel(page_count: int) -> bool:
+    """页数达到阈值时使用进程池并行提取"""
+    return PDF_PARALLEL_PAGE_THRESHOLD > 0 and page_count >= PDF_PARALLEL_PAGE_THRESHOLD
+
+
+def _iter_pdf_text(pdf_reader, pdf_path: Optional[str]) -> Iterator[str]:
+    """
+    逐页产出PDF文本；页数较多且文件在磁盘上时并行提取，
+    并行提取失败则从尚未产出的页码起改为串行
+    """
+    page_count = len(pdf_reader.pages)
+
+    next_page = 0
+    if pdf_path is not None and _should_parse_pdf_in_parallel(page_count):
+        try:
+            for end, pages in _iter_pdf_ranges_parallel(pdf_path, page_count):
+                for _, text in pages:
+                    yield text
+                next_page = end
+        except Exception as e:
+            logging.warning(f"PDF并行解析失败，从第{next_page + 1}页起改为串行解析: {str(e)}")
+
+    for _, text in _iter_pdf_pages(pdf_reader, range(next_page, page_count)):
+        yield text
 
 
 def parse_pdf_content(file_bytes: bytes) -> str:
     """
     解析PDF文件内容
-    
+
+    页数达到 PDF_PARALLEL_PAGE_THRESHOLD 时写入临时文件后使用进程池并行提取，
+    否则在当前线程串行提取。
+
     Args:
         file_bytes: 文件字节内容
-        
+
     Returns:
         提取的文本内容
     """
-    if PyPDF2 is None:
-        raise ValueError("PyPDF2库未安装，无法解析PDF文件")
-    
-    try:
-        # 创建内存文件对象
-        pdf_stream = io.BytesIO(file_bytes)
-        pdf_reader = PyPDF2.PdfReader(pdf_stream)
-        
-        # 提取所有页面的文本
-        text_parts = []
-        for page_num in range(len(pdf_reader.pages)):
-            try:
-                page = pdf_reader.pages[page_num]
-                text = page.extract_text()
-                if text.strip():
-                    text_parts.append(text.strip())
-            except Exception as e:
-                logging.warning(f"PDF第{page_num + 1}页解析失败: {str(e)}")
-                continue
-        
-        return '\n\n'.join(text_parts)
-        
-    except Exception as e:
-        raise ValueError(f"PDF文件解析失败: {str(e)}")
+    return PDF_PARSER.parse(file_bytes).text
 
 
 def parse_srt_content(file_bytes: bytes) -> str:
     """
     解析SRT字幕文件内容
-    
+
+    合并自动字幕的滚动重复后按 SRT_SEGMENT_SECONDS 的时间窗口分段，
+    段落之间以空行分隔；SRT_SEGMENT_SECONDS=0 时不分段，每行一条去重后的字幕文本。
+
     Args:
         file_bytes: 文件字节内容
-        
+
     Returns:
-        提取的文本内容（只包含字幕文本，不包含时间码）
+        提取的文本内容，每段以 [HH:MM:SS] 起始时间戳开头，不包含原始的SRT序号与时间码行
     """
-    if srt is None:
-        raise ValueError("srt库未安装，无法解析SRT文件")
-    
-    try:
-        # 解码文件内容
-        content = file_bytes.decode('utf-8')
-        
-        # 解析SRT内容
-        subtitle_generator = srt.parse(content)
-        subtitles = list(subtitle_generator)
-        
-        # 提取所有字幕文本
-        texts = []
-        for subtitle in subtitles:
-            text = subtitle.content.strip()
-            if text:
-                texts.append(text)
-        
-        return '\n'.join(texts)
-        
-    except UnicodeDecodeError:
-        # 如果UTF-8失败，尝试其他编码
-        try:
-            content = file_bytes.decode('gbk')
-            subtitle_generator = srt.parse(content)
-            subtitles = list(subtitle_generator)
-            
-            texts = []
-            for subtitle in subtitles:
-                text = subtitle.content.strip()
-                if text:
-                    texts.append(text)
-            
-            return '\n'.join(texts)
-        except Exception:
-            raise ValueError("SRT文件编码不支持")
-    except Exception as e:
-        raise ValueError(f"SRT文件解析失败: {str(e)}")
+    return PARSER_REGISTRY['.srt'].parse(file_bytes).text
+
+
+def parse_file(filename: str, file_bytes: bytes) -> ParseResult:
+    """
+    根据文件头和扩展名选择解析器，并返回文本类格式检测到的编码
+
+    Args:
+        filename: 文件名（包含扩展名）
+        file_bytes: 文件字节内容
+
+    Returns:
+        解析结果（提取的文本和编码）
+
+    Raises:
+        ValueError: 当文件格式不支持或解析失败时
+    """
+    _check_size(len(file_bytes))
+    parser = _resolve_parser(filename, file_bytes[:SNIFF_SIZE])
+    with _parse_metrics(parser):
+        stream = parser.open_bytes(file_bytes)
+        return ParseResult(stream.join(), stream.encoding)
 
 
 def parse_file_content(filename: str, file_bytes: bytes) -> str:
     """
-    根据文件扩展名自动选择解析函数
-    
+    根据文件头和扩展名选择解析器
+
     Args:
         filename: 文件名（包含扩展名）
         file_bytes: 文件字节内容
-        
+
     Returns:
         提取的文本内容
-        
+
     Raises:
         ValueError: 当文件格式不支持或解析失败时
     """
-    # 获取文件扩展名（小写）
-    file_extension = os.path.splitext(filename)[1].lower()
-    
-    # 检查文件大小（限制为50MB）
-    if len(file_bytes) > 50 * 1024 * 1024:
-        raise ValueError("文件大小超过50MB限制")
-    
-    # 根据扩展名选择解析函数
-    if file_extension == '.txt':
-        return parse_txt_content(file_bytes)
-    elif file_extension == '.md':
-        return parse_md_content(file_bytes)
-    elif file_extension == '.docx':
-        return parse_docx_content(file_bytes)
-    elif file_extension == '.pdf':
-        return parse_pdf_content(file_bytes)
-    elif file_extension == '.srt':
-        return parse_srt_content(file_bytes)
-    else:
-        supported_formats = ['.txt', '.md', '.docx', '.pdf', '.srt']
-        raise ValueError(f"不支持的文件格式: {file_extension}。支持格式: {', '.join(supported_formats)}")
+    return parse_file(filename, file_bytes).text
+
+
+def parse_file_path(filename: str, file_path: str) -> ParseResult:
+    """
+    解析已落盘的上传文件。PDF和DOCX直接从文件读取，不再在内存中保留整份副本；
+    其余文本类格式读入后解析。
+
+    Args:
+        filename: 原始文件名（用于判断格式）
+        file_path: 磁盘上的文件路径
+
+    Returns:
+        解析结果（提取的文本和编码）
+
+    Raises:
+        ValueError: 当文件格式不支持或解析失败时
+    """
+    return parse_path_with(detect_path_parser(filename, file_path), file_path)
+
+
+def detect_path_parser(filename: str, file_path: str) -> FileParser:
+    """
+    检查磁盘上文件的大小，并根据扩展名和文件头选择解析器（只读取文件头）
+
+    Raises:
+        ValueError: 当文件超过大小限制或格式不支持时
+    """
+    _check_size(os.path.getsize(file_path))
+    return _resolve_parser(filename, _read_head(file_path))
+
+
+def parse_path_with(parser: FileParser, file_path: str) -> ParseResult:
+    """
+    用已选定的解析器解析磁盘上的文件
+
+    Raises:
+        ValueError: 当解析失败时
+    """
+    with _parse_metrics(parser):
+        stream = parser.open_path(file_path)
+        return ParseResult(stream.join(), stream.encoding)
+
+
+@contextmanager
+def _parse_metrics(parser: FileParser) -> Iterator[None]:
+    """记录按格式区分的解析耗时与解析错误数"""
+    try:
+        with timed("parse", PARSE_SECONDS.labels(parser.name), parser.name):
+            yield
+    except Exception as e:
+        ERRORS.labels("parse", type(e).__name__).inc()
+        raise
+
+
+def parser_version_tag() -> str:
+    """
+    解析结果的版本标记：版本号与影响解析输出的选项，用于解析结果存储的键
+
+    Returns:
+        例如 "v2;docx-fast=1;srt-segment=60"
+    """
+    return f"v{PARSER_VERSION};docx-fast={int(DOCX_FAST_PATH)};srt-segment={SRT_SEGMENT_SECONDS:g}"
 
 
 def get_supported_formats() -> list:
     """
-    获取支持的文件格式列表
-    
+    获取支持的文件格式列表（只检查依赖库是否已安装，不导入）
+
     Returns:
         支持的文件格式列表
     """
-    formats = ['.txt', '.md']
-    
-    if Document is not None:
-        formats.append('.docx')
-    
-    if PyPDF2 is not None:
-        formats.append('.pdf')
-    
-    if srt is not None:
-        formats.append('.srt')
-    
-    return formats 
\ No newline at end of file
+    return [
+        file_extension
+        for file_extension, parser in PARSER_REGISTRY.items()
+        if parser.is_installed()
+    ]
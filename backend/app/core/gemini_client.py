@@ -0,0 +1,329 @@
+"""
+Gemini 客户端模块
+在进程内统一管理 GenerativeModel 与底层 gRPC 通道：启动时创建一次并预热，
+请求处理时直接借用，连接异常时重建
+"""
+
+import os
+import asyncio
+import inspect
+import logging
+import itertools
+import threading
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 模型名称
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash-latest")
+
+# 单次调用的超时时间（秒）
+GEMINI_REQUEST_TIMEOUT = float(os.environ.get("GEMINI_REQUEST_TIMEOUT", "300"))
+
+# 异步调用使用的 gRPC 通道数量，请求按轮询方式分摊到各通道
+GEMINI_CHANNEL_POOL_SIZE = int(os.environ.get("GEMINI_CHANNEL_POOL_SIZE", "2"))
+
+# 可选：自定义 API 地址与传输方式（grpc / rest），例如指向本地的模拟服务进行基准测试
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+GEMINI_TRANSPORT = os.environ.get("GEMINI_TRANSPORT")
+
+# 健康检查间隔（秒），0 表示只在启动时预热一次
+GEMINI_HEALTHCHECK_INTERVAL = float(os.environ.get("GEMINI_HEALTHCHECK_INTERVAL", "60"))
+
+# 健康检查与预热调用的超时时间（秒）
+GEMINI_HEALTHCHECK_TIMEOUT = float(os.environ.get("GEMINI_HEALTHCHECK_TIMEOUT", "10"))
+
+# 连续出现连接类错误达到该次数时重建通道
+GEMINI_RECONNECT_AFTER_FAILURES = int(os.environ.get("GEMINI_RECONNECT_AFTER_FAILURES", "3"))
+
+
+def _generation_config_from_env() -> Dict[str, Any]:
+    """读取可选的生成参数，未设置的参数使用模型默认值"""
+    config: Dict[str, Any] = {}
+    if os.environ.get("GEMINI_TEMPERATURE"):
+        config["temperature"] = float(os.environ["GEMINI_TEMPERATURE"])
+    if os.environ.get("GEMINI_TOP_P"):
+        config["top_p"] = float(os.environ["GEMINI_TOP_P"])
+    if os.environ.get("GEMINI_MAX_OUTPUT_TOKENS"):
+        config["max_output_tokens"] = int(os.environ["GEMINI_MAX_OUTPUT_TOKENS"])
+    return config
+
+
+def _import_sdk():
+    """
+    按需导入 google-generativeai。SDK 连带导入 grpc、protobuf 等，耗时约1秒，
+    放到首次使用（或启动后的后台预热）时再导入，避免拖慢冷启动
+    """
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+    return genai, genai_client
+
+
+# 已验证过内部接口（client._client_manager.make_client 与 GenerativeModel._async_client）的 SDK 版本前缀
+_PRIVATE_API_VERSIONS = ("0.7.", "0.8.")
+
+
+def _make_dedicated_client(genai, genai_client):
+    """
+    为单个模型创建独立的异步客户端（SDK 默认所有模型共用一个）。
+    这依赖 SDK 的内部接口，只在已验证的版本上使用；其他版本或接口不存在时返回 None，
+    调用方退回到公开的 GenerativeModel（共用 SDK 的默认客户端，不再按通道分摊请求；
+    SDK 的异步接口只支持 gRPC，回退后 REST 传输不可用）
+    """
+    version = getattr(genai, "__version__", "")
+    manager = getattr(genai_client, "_client_manager", None)
+    if not version.startswith(_PRIVATE_API_VERSIONS) or not hasattr(manager, "make_client"):
+        return None
+    try:
+        if GEMINI_TRANSPORT == "rest":
+            return _RestAsyncClient(manager.make_client("generative"))
+        return manager.make_client("generative_async")
+    except Exception as e:
+        logger.warning(f"创建独立的 Gemini 通道失败，使用 SDK 默认客户端: {e}")
+        return None
+
+
+async def _close_clients(clients: List[Any]) -> None:
+    """关闭由 _make_dedicated_client 创建的异步客户端的通道"""
+    for client in clients:
+        try:
+            closed = client.transport.close()
+            if inspect.isawaitable(closed):
+                await closed
+        except Exception as e:
+            logger.warning(f"关闭 Gemini 通道失败: {e}")
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """判断异常是否由连接/通道问题引起（而非请求内容本身的问题）"""
+    try:
+        from google.api_core import exceptions as core_exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (
+        core_exceptions.ServiceUnavailable,
+        core_exceptions.DeadlineExceeded,
+        core_exceptions.RetryError,
+    ))
+
+
+class _RestAsyncClient:
+    """
+    SDK 的异步客户端只支持 gRPC；使用 REST 传输时，
+    以线程池执行同步 REST 客户端的调用，对外提供相同的异步接口
+    """
+
+    def __init__(self, sync_client):
+        self._client = sync_client
+        self.transport = sync_client.transport
+
+    async def generate_content(self, request, **kwargs):
+        return await asyncio.to_thread(self._client.generate_content, request, **kwargs)
+
+    async def count_tokens(self, request, **kwargs):
+        return await asyncio.to_thread(self._client.count_tokens, request, **kwargs)
+
+    async def stream_generate_content(self, request, **kwargs):
+        iterator = await asyncio.to_thread(self._client.stream_generate_content, request, **kwargs)
+        return self._iterate(iterator)
+
+    async def _iterate(self, iterator):
+        done = object()
+        while True:
+            item = await asyncio.to_thread(next, iterator, done)
+            if item is done:
+                return
+            yield item
+
+
+class GeminiClient:
+    """
+    Gemini 客户端管理器
+
+    start() 调用 genai.configure 并创建 GEMINI_CHANNEL_POOL_SIZE 个 GenerativeModel，
+    每个模型绑定独立的异步 gRPC 客户端；acquire() 按轮询返回其中一个。
+    重建时被替换下的客户端在事件循环中关闭（没有运行中的事件循环时推迟到下次健康检查或 close()）。
+    未调用 start() 时首次 acquire() 会自动初始化，便于脚本和测试直接使用。
+    """
+
+    def __init__(
+        self,
+        model_name: str = GEMINI_MODEL,
+        generation_config: Optional[Dict[str, Any]] = None,
+        request_timeout: float = GEMINI_REQUEST_TIMEOUT,
+        pool_size: int = GEMINI_CHANNEL_POOL_SIZE,
+    ):
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.request_timeout = request_timeout
+        self.pool_size = max(1, pool_size)
+        self.healthy = False
+        self._models: List["genai.GenerativeModel"] = []
+        # 本客户端创建的异步客户端（需要关闭），以及重建后等待关闭的旧客户端
+        self._clients: List[Any] = []
+        self._retired: List[Any] = []
+        self._round_robin = None
+        self._close_task: Optional[asyncio.Task] = None
+        self._configured = False
+        self._consecutive_failures = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "GeminiClient":
+        """根据环境变量创建客户端"""
+        return cls(generation_config=_generation_config_from_env())
+
+    @property
+    def request_options(self) -> Dict[str, Any]:
+        """传给 generate_content 的请求参数"""
+        return {"timeout": self.request_timeout}
+
+    def preload(self) -> None:
+        """导入 SDK 而不创建通道，可在后台线程中调用以预热"""
+        _import_sdk()
+
+    def start(self) -> bool:
+        """
+        配置 API 密钥并创建模型池
+
+        Returns:
+            是否初始化成功（未设置 GOOGLE_API_KEY 时返回 False）
+        """
+        with self._lock:
+            if self._configured:
+                return True
+
+            api_key = os.environ.get("GOOGLE_API_KEY")
+            if not api_key:
+                logger.error("GOOGLE_API_KEY 未设置")
+                return False
+
+            genai, _ = _import_sdk()
+            client_options = {"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None
+            genai.configure(api_key=api_key, transport=GEMINI_TRANSPORT, client_options=client_options)
+            self._build_pool()
+            self._configured = True
+            logger.info(f"Gemini 客户端已初始化，模型: {self.model_name}，通道数: {self.pool_size}")
+            return True
+
+    def _build_pool(self) -> None:
+        """创建模型池；旧池的客户端移入待关闭列表"""
+        genai, genai_client = _import_sdk()
+        models, clients = [], []
+        for _ in range(self.pool_size):
+            model = genai.GenerativeModel(self.model_name, generation_config=self.generation_config or None)
+            # 为每个模型单独创建异步客户端，使请求分摊到多条通道
+            client = _make_dedicated_client(genai, genai_client)
+            if client is not None:
+                model._async_client = client
+                clients.append(client)
+            models.append(model)
+        if len(clients) < len(models):
+            logger.warning(
+                f"google-generativeai {getattr(genai, '__version__', '未知版本')} 上无法创建独立的异步通道"
+                f"（已验证: {'/'.join(v + 'x' for v in _PRIVATE_API_VERSIONS)}），"
+                f"{len(models) - len(clients)} 个模型改用 SDK 共用的默认客户端，请求不再按通道分摊"
+            )
+        self._retired.extend(self._clients)
+        self._models, self._clients = models, clients
+        self._round_robin = itertools.cycle(models)
+
+    def acquire(self) -> Optional["genai.GenerativeModel"]:
+        """
+        借用一个已初始化的模型
+
+        Returns:
+            GenerativeModel 实例，未配置 API 密钥时返回 None
+        """
+        if not self._configured and not self.start():
+            return None
+        with self._lock:
+            return next(self._round_robin)
+
+    def reconnect(self) -> None:
+        """重建模型池并关闭旧通道（旧通道上进行中的请求会失败，由调用方重试）"""
+        with self._lock:
+            if not self._configured:
+                return
+            self._build_pool()
+            self._consecutive_failures = 0
+        logger.warning("Gemini 通道已重建")
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 在工作线程中调用：旧通道属于事件循环，推迟到下次健康检查或 close() 时关闭
+            return
+        # 保留任务引用，避免关闭完成前被回收
+        self._close_task = loop.create_task(self._close_retired())
+
+    async def _close_retired(self) -> None:
+        with self._lock:
+            retired, self._retired = self._retired, []
+        await _close_clients(retired)
+
+    def report_success(self) -> None:
+        """记录一次成功调用"""
+        self._consecutive_failures = 0
+        self.healthy = True
+
+    def report_failure(self, error: BaseException) -> None:
+        """记录一次失败调用，连续出现连接类错误时重建通道"""
+        if not _is_connection_error(error):
+            return
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= GEMINI_RECONNECT_AFTER_FAILURES:
+            self.healthy = False
+            self.reconnect()
+
+    async def health_check(self) -> bool:
+        """
+        对池中每个通道发起一次 count_tokens 调用（不消耗生成配额），
+        任一通道失败时重建模型池
+
+        Returns:
+            所有通道是否可用
+        """
+        if not self._configured and not self.start():
+            self.healthy = False
+            return False
+
+        await self._close_retired()
+        try:
+            await asyncio.gather(*(
+                asyncio.wait_for(model.count_tokens_async("ping"), GEMINI_HEALTHCHECK_TIMEOUT)
+                for model in list(self._models)
+            ))
+            self.healthy = True
+        except Exception as e:
+            logger.warning(f"Gemini 健康检查失败: {type(e).__name__}: {e}")
+            self.healthy = False
+            self.reconnect()
+        return self.healthy
+
+    async def run_health_checks(self, interval: float = GEMINI_HEALTHCHECK_INTERVAL) -> None:
+        """启动后立即预热各通道，此后按固定间隔进行健康检查"""
+        while True:
+            await self.health_check()
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        """关闭所有异步通道"""
+        with self._lock:
+            clients = self._retired + self._clients
+            self._models, self._clients, self._retired = [], [], []
+            self._round_robin = None
+            self._configured = False
+            self.healthy = False
+
+        await _close_clients(clients)
+
+
+# 全局客户端
+gemini_client = GeminiClient.from_env()
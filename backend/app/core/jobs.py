@@ -0,0 +1,384 @@
+"""
+后台任务模块
+将文件解析和思维导图生成放到有界的后台工作池中执行，任务状态保存在可替换的存储中
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any
+
+from starlette.concurrency import run_in_threadpool
+
+from .rate_limiter import current_client_id
+from .metrics import JOB_QUEUE_SIZE
+from .pipeline import PipelineContext, PipelineError, mindmap_pipeline
+from .shared_state import SharedState, import_sqlalchemy, shared_state
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# 后台工作协程数量（同时处理的任务数上限）
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+
+# 等待处理的任务数上限，队列已满时拒绝新任务
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "1000"))
+
+# 保存在共享状态中的任务记录的存活时间（秒）
+JOB_TTL = float(os.environ.get("JOB_TTL", str(24 * 3600)))
+
+# 工作进程定期刷新本进程等待中/进行中任务的 updated_at；超过 JOB_ORPHAN_SECONDS 未刷新的任务
+# 视为所在进程已退出（重启或崩溃），标记为失败
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_ORPHAN_SECONDS = float(os.environ.get("JOB_ORPHAN_SECONDS", "120"))
+
+_ORPHANED_ERROR = "任务所在的服务进程已退出，请重新提交"
+
+
+class JobQueueFull(Exception):
+    """等待处理的任务已达上限（接口层返回503）"""
+
+
+def _new_job(filename: Optional[str]) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "status": JOB_PENDING,
+        "stage": "queued",
+        "progress": 0.0,
+        "result": None,
+        "error": None,
+        "filename": filename,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class JobStore(ABC):
+    """任务存储接口"""
+
+    @abstractmethod
+    def create(self, job: Dict[str, Any]) -> None:
+        """写入新任务"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务，不存在时返回None"""
+
+    @abstractmethod
+    def update(self, job_id: str, **fields) -> None:
+        """更新任务字段并刷新 updated_at，任务不存在时忽略"""
+
+    def fail_orphaned(self, before: float) -> int:
+        """
+        将 updated_at 早于 before 的等待中/进行中任务标记为失败
+
+        Returns:
+            标记的任务数；不能枚举任务的存储返回0，由查询时逐个判断
+        """
+        return 0
+
+
+class InMemoryJobStore(JobStore):
+    """进程内任务存储，超出容量时丢弃最早创建的已结束任务"""
+
+    def __init__(self, max_jobs: int = 10000):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._max_jobs = max_jobs
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._jobs) >= self._max_jobs:
+                self._evict_finished()
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def _evict_finished(self) -> None:
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in (JOB_SUCCEEDED, JOB_FAILED)
+        ]
+        for job_id in finished[:max(1, len(finished) // 2)]:
+            del self._jobs[job_id]
+
+
+class SQLAlchemyJobStore(JobStore):
+    """基于 SQLAlchemy 的任务存储，支持 SQLite 和 PostgreSQL，多个进程可共享任务状态"""
+
+    def __init__(self, url: str):
+        sa = import_sqlalchemy("数据库任务存储")
+
+        self._engine = sa.create_engine(url, pool_pre_ping=True)
+        metadata = sa.MetaData()
+        self._table = sa.Table(
+            "mindmap_jobs", metadata,
+            sa.Column("id", sa.String(32), primary_key=True),
+            sa.Column("status", sa.String(16), nullable=False),
+            sa.Column("stage", sa.String(32), nullable=False),
+            sa.Column("progress", sa.Float, nullable=False),
+            sa.Column("result", sa.Text),
+            sa.Column("error", sa.Text),
+            sa.Column("filename", sa.Text),
+            sa.Column("created_at", sa.Float, nullable=False),
+            sa.Column("updated_at", sa.Float, nullable=False),
+        )
+        metadata.create_all(self._engine)
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(self._table.insert().values(**job))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._engine.connect() as conn:
+            row = conn.execute(self._table.select().where(self._table.c.id == job_id)).mappings().first()
+            return dict(row) if row is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        with self._engine.begin() as conn:
+            conn.execute(self._table.update().where(self._table.c.id == job_id).values(**fields))
+
+    def fail_orphaned(self, before: float) -> int:
+        table = self._table
+        with self._engine.begin() as conn:
+            result = conn.execute(
+                table.update()
+                .where(table.c.status.in_((JOB_PENDING, JOB_RUNNING)), table.c.updated_at < before)
+                .values(status=JOB_FAILED, stage="failed", error=_ORPHANED_ERROR, updated_at=time.time())
+            )
+            return result.rowcount
+
+
+class SharedStateJobStore(JobStore):
+    """
+    保存在共享状态中的任务存储（JSON），多工作进程部署时任意进程都能查询任务状态
+
+    更新在共享状态的单个事务中读改写，多个进程同时更新同一任务时不会互相覆盖；记录在 JOB_TTL 后过期。
+    """
+
+    def __init__(self, state: SharedState, ttl_seconds: float = JOB_TTL):
+        self._state = state
+        self._ttl = ttl_seconds
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._state.set("jobs", job["id"], json.dumps(job, ensure_ascii=False), ttl=self._ttl)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        value = self._state.get("jobs", job_id)
+        return json.loads(value) if value is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        def apply(value: str) -> str:
+            job = json.loads(value)
+            job.update(fields, updated_at=time.time())
+            return json.dumps(job, ensure_ascii=False)
+
+        self._state.update("jobs", job_id, apply, ttl=self._ttl)
+
+
+def create_job_store_from_env() -> JobStore:
+    """根据 JOB_STORE_URL 创建任务存储，未设置时使用共享状态（多进程部署）或进程内存储"""
+    url = os.environ.get("JOB_STORE_URL")
+    if not url:
+        if shared_state.shared:
+            return SharedStateJobStore(shared_state)
+        return InMemoryJobStore()
+
+    logger.info(f"使用数据库任务存储: {url.split('://')[0]}")
+    return SQLAlchemyJobStore(url)
+
+
+class JobManager:
+    """
+    后台任务管理器
+
+    任务先写入存储再放入队列，由固定数量的工作协程依次取出处理：
+    文件解析在线程池中执行，思维导图生成走异步路径，任务之间互不阻塞。
+
+    队列和工作协程都在进程内，进程退出时未完成的任务随之丢失：本进程的任务由心跳定期刷新 updated_at，
+    启动时以及查询时把超过 JOB_ORPHAN_SECONDS 未刷新的等待中/进行中任务标记为失败。
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX):
+        self.store = store
+        self._workers = workers
+        self._max_queued = max_queued
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        # 本进程等待中与进行中的任务ID
+        self._active = set()
+
+    async def start(self) -> None:
+        """启动工作池，并将此前退出的进程遗留的任务标记为失败"""
+        self._ensure_started()
+        count = await run_in_threadpool(self.store.fail_orphaned, time.time() - JOB_ORPHAN_SECONDS)
+        if count:
+            logger.warning(f"{count} 个后台任务所在的进程已退出，已标记为失败")
+
+    async def submit_text(self, text: str) -> str:
+        """
+        提交文本任务
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            任务ID
+
+        Raises:
+            JobQueueFull: 等待处理的任务已达上限
+        """
+        return await self._submit(_new_job(None), {"text": text, "client_id": current_client_id.get()})
+
+    async def submit_file(self, filename: str, file_path: str, upload_hash: Optional[str] = None) -> str:
+        """
+        提交文件任务，任务结束后删除 file_path
+
+        Args:
+            filename: 原始文件名
+            file_path: 已落盘的上传文件路径
+            upload_hash: 上传内容的SHA-256，用于复用已存储的解析结果
+
+        Returns:
+            任务ID
+
+        Raises:
+            JobQueueFull: 等待处理的任务已达上限（此时 file_path 已被删除）
+        """
+        try:
+            return await self._submit(_new_job(filename), {
+                "filename": filename,
+                "file_path": file_path,
+                "upload_hash": upload_hash,
+                "client_id": current_client_id.get(),
+            })
+        except BaseException:
+            # 任务未进入队列，不会有工作协程删除上传文件
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+            raise
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态，所在进程已退出的未完成任务标记为失败后返回"""
+        job = await run_in_threadpool(self.store.get, job_id)
+        if (
+            job is not None
+            and job["status"] in (JOB_PENDING, JOB_RUNNING)
+            and job_id not in self._active
+            and job["updated_at"] < time.time() - JOB_ORPHAN_SECONDS
+        ):
+            fields = {"status": JOB_FAILED, "stage": "failed", "error": _ORPHANED_ERROR}
+            await self._update(job_id, **fields)
+            job.update(fields)
+        return job
+
+    def queue_size(self) -> int:
+        """等待处理的任务数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queued)
+            self._worker_tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self._workers)
+            ]
+            self._worker_tasks.append(asyncio.create_task(self._heartbeat()))
+            logger.info(f"后台任务工作池已启动，工作协程数: {self._workers}，队列上限: {self._max_queued}")
+        return self._queue
+
+    async def _submit(self, job: Dict[str, Any], payload: Dict[str, Any]) -> str:
+        """写入任务记录并放入队列；队列已满时不创建任务"""
+        queue = self._ensure_started()
+        if queue.full():
+            raise JobQueueFull("后台任务过多，请稍后再试")
+        await run_in_threadpool(self.store.create, job)
+        try:
+            queue.put_nowait((job["id"], payload))
+            self._active.add(job["id"])
+        except asyncio.QueueFull:
+            # 写入存储期间队列被其他请求占满
+            await self._update(job["id"], status=JOB_FAILED, stage="failed", error="后台任务过多，请稍后再试")
+            raise JobQueueFull("后台任务过多，请稍后再试")
+        return job["id"]
+
+    async def _update(self, job_id: str, **fields) -> None:
+        await run_in_threadpool(self.store.update, job_id, **fields)
+
+    async def _heartbeat(self) -> None:
+        """定期刷新本进程未完成任务的 updated_at，表明所在进程仍在运行"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            for job_id in list(self._active):
+                try:
+                    await self._update(job_id)
+                except Exception as e:
+                    logger.warning(f"刷新后台任务 {job_id} 心跳失败: {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, payload = await self._queue.get()
+            try:
+                await self._run_job(job_id, payload)
+            except Exception as e:
+                logger.error(f"后台任务 {job_id} 发生未知错误: {e}")
+                await self._update(job_id, status=JOB_FAILED, stage="failed", error="服务器内部错误，请稍后再试")
+            finally:
+                self._active.discard(job_id)
+                file_path = payload.get("file_path")
+                if file_path and os.path.exists(file_path):
+                    os.unlink(file_path)
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str, payload: Dict[str, Any]) -> None:
+        # 工作协程长期存在，按任务提交方设置客户端标识，使限流器公平排队
+        current_client_id.set(payload.get("client_id", "anonymous"))
+
+        async def report_progress(stage: str, seconds: float, ctx: PipelineContext) -> None:
+            # 阶段完成后更新任务进度：接收输入后开始解析，预处理完成后开始生成
+            if stage == "ingest" and ctx.is_file:
+                await self._update(job_id, status=JOB_RUNNING, stage="parsing", progress=0.1)
+            elif stage == "normalize":
+                await self._update(job_id, status=JOB_RUNNING, stage="generating", progress=0.4)
+
+        file_path = payload.get("file_path")
+        ctx = PipelineContext(
+            text=payload.get("text"),
+            filename=payload.get("filename"),
+            file_path=file_path,
+            file_size=os.path.getsize(file_path) if file_path else 0,
+            upload_hash=payload.get("upload_hash"),
+        )
+        try:
+            await mindmap_pipeline.run(ctx, hooks=[report_progress])
+        except PipelineError as e:
+            await self._update(job_id, status=JOB_FAILED, stage="failed", error=str(e))
+            return
+
+        await self._update(job_id, status=JOB_SUCCEEDED, stage="done", progress=1.0, result=ctx.mindmap)
+        logger.info(f"后台任务 {job_id} 完成")
+
+
+# 全局任务管理器
+job_manager = JobManager(create_job_store_from_env())
+JOB_QUEUE_SIZE.set_function(job_manager.queue_size)
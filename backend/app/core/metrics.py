@@ -0,0 +1,285 @@
+"""
+指标模块
+Prometheus 指标定义，以及按请求收集各阶段耗时、写入 Server-Timing 响应头的工具
+
+多进程部署（serve.py --workers N）时设置 PROMETHEUS_MULTIPROC_DIR，各工作进程把计数器与直方图写入该目录，
+/metrics 汇总所有工作进程；抓取时计算的仪表盘指标（缓存命中率、限流队列、任务队列）只反映应答的工作进程
+"""
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    generate_latest = None
+    logging.warning("prometheus-client not installed, /metrics will be unavailable")
+
+from .cache import mindmap_cache
+from .rate_limiter import gemini_rate_limiter
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 多进程指标目录（由 serve.py 在启动工作进程前设置，必须在导入 prometheus-client 之前存在）
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+
+# 秒级耗时的分桶（覆盖毫秒级解析到数分钟的长文档生成）
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# token数/字符数的分桶
+_SIZE_BUCKETS = (100, 500, 1000, 5000, 10000, 30000, 100000, 300000, 1000000)
+
+
+class _NoopMetric:
+    """未安装 prometheus-client 时的占位指标，所有操作均为空操作"""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set_function(self, func: Callable[[], float]) -> None:
+        pass
+
+
+class _ScrapeGauge:
+    """
+    抓取时调用函数取值的仪表盘指标
+
+    多进程模式下 Gauge.set_function 的取值不会写入共享目录，因此以独立的收集器导出，
+    只反映应答抓取的工作进程
+    """
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._func: Optional[Callable[[], float]] = None
+
+    def set_function(self, func: Callable[[], float]) -> None:
+        self._func = func
+
+    def collect(self):
+        if self._func is None:
+            return []
+        return [GaugeMetricFamily(self.name, self.documentation, value=float(self._func()))]
+
+
+if generate_latest is not None:
+    UPLOAD_READ_SECONDS = Histogram(
+        "text2map_upload_read_seconds", "上传文件读取并落盘的耗时", buckets=_LATENCY_BUCKETS
+    )
+    PARSE_SECONDS = Histogram(
+        "text2map_parse_seconds", "文件解析耗时", ["format"], buckets=_LATENCY_BUCKETS
+    )
+    PROMPT_TOKENS = Histogram(
+        "text2map_prompt_tokens", "提示词估算token数", buckets=_SIZE_BUCKETS
+    )
+    INPUT_TOKENS_SAVED = Counter(
+        "text2map_input_tokens_saved_total", "输入预处理（空白与重复样板压缩）节省的token数"
+    )
+    GEMINI_SECONDS = Histogram(
+        "text2map_gemini_seconds", "单次 Gemini 调用耗时", ["mode"], buckets=_LATENCY_BUCKETS
+    )
+    FIRST_TOKEN_SECONDS = Histogram(
+        "text2map_time_to_first_token_seconds", "流式生成首个片段的耗时", buckets=_LATENCY_BUCKETS
+    )
+    OUTPUT_CHARS = Histogram(
+        "text2map_output_chars", "生成的思维导图字符数", buckets=_SIZE_BUCKETS
+    )
+    REQUEST_SECONDS = Histogram(
+        "text2map_request_seconds", "请求端到端耗时", ["method", "route", "status"], buckets=_LATENCY_BUCKETS
+    )
+    ERRORS = Counter(
+        "text2map_errors_total", "按阶段和类型统计的错误数", ["stage", "type"]
+    )
+    # 多进程模式下汇总所有存活工作进程的值
+    INFLIGHT_GENERATIONS = Gauge(
+        "text2map_inflight_generations", "进行中的 Gemini 调用数", multiprocess_mode="livesum"
+    )
+    CACHE_HIT_RATIO = _ScrapeGauge(
+        "text2map_cache_hit_ratio", "思维导图缓存命中率（进程启动以来）"
+    )
+    RATE_LIMIT_QUEUE_DEPTH = _ScrapeGauge(
+        "text2map_rate_limit_queue_depth", "等待限流器放行的 Gemini 调用数"
+    )
+    RATE_LIMIT_WAIT_SECONDS = _ScrapeGauge(
+        "text2map_rate_limit_avg_wait_seconds", "限流器平均排队时间"
+    )
+    JOB_QUEUE_SIZE = _ScrapeGauge(
+        "text2map_job_queue_size", "等待处理的后台任务数"
+    )
+    _SCRAPE_GAUGES = (CACHE_HIT_RATIO, RATE_LIMIT_QUEUE_DEPTH, RATE_LIMIT_WAIT_SECONDS, JOB_QUEUE_SIZE)
+    for _gauge in _SCRAPE_GAUGES:
+        REGISTRY.register(_gauge)
+    PIPELINE_STAGE_SECONDS = Histogram(
+        "text2map_pipeline_stage_seconds", "生成流水线各阶段耗时", ["stage"], buckets=_LATENCY_BUCKETS
+    )
+else:
+    UPLOAD_READ_SECONDS = PARSE_SECONDS = PROMPT_TOKENS = INPUT_TOKENS_SAVED = GEMINI_SECONDS = _NoopMetric()
+    FIRST_TOKEN_SECONDS = OUTPUT_CHARS = REQUEST_SECONDS = ERRORS = _NoopMetric()
+    INFLIGHT_GENERATIONS = CACHE_HIT_RATIO = RATE_LIMIT_QUEUE_DEPTH = _NoopMetric()
+    RATE_LIMIT_WAIT_SECONDS = JOB_QUEUE_SIZE = PIPELINE_STAGE_SECONDS = _NoopMetric()
+
+
+# 当前请求已记录的阶段耗时 [(阶段, 毫秒, 描述)]，由 ServerTimingMiddleware 为每个请求创建
+_request_timings: ContextVar[Optional[List[Tuple[str, float, Optional[str]]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record_timing(stage: str, seconds: float, description: Optional[str] = None) -> None:
+    """将一个阶段的耗时记入当前请求的 Server-Timing（不在请求上下文中时忽略）"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds * 1000, description))
+
+
+@contextmanager
+def timed(stage: str, histogram=None, description: Optional[str] = None) -> Iterator[None]:
+    """
+    统计代码块耗时，写入直方图（可选）和当前请求的 Server-Timing
+
+    Args:
+        stage: Server-Timing 中的阶段名
+        histogram: 需要记录的直方图（已绑定标签）
+        description: Server-Timing 中的描述
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if histogram is not None:
+            histogram.observe(elapsed)
+        record_timing(stage, elapsed, description)
+
+
+@contextmanager
+def track_gemini_call(mode: str) -> Iterator[None]:
+    """统计一次 Gemini 调用：进行中数量、耗时（直方图与 Server-Timing）及按异常类型的错误数"""
+    INFLIGHT_GENERATIONS.inc()
+    try:
+        with timed("gemini", GEMINI_SECONDS.labels(mode), mode):
+            yield
+    except Exception as e:
+        ERRORS.labels("gemini", type(e).__name__).inc()
+        raise
+    finally:
+        INFLIGHT_GENERATIONS.dec()
+
+
+def format_server_timing(timings: List[Tuple[str, float, Optional[str]]]) -> str:
+    """格式化为 Server-Timing 头，例如 upload;dur=12.3, parse;dur=45.6;desc="pdf" """
+    parts = []
+    for stage, duration_ms, description in timings:
+        part = f"{stage};dur={duration_ms:.1f}"
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI 中间件：为每个请求收集阶段耗时，在响应头中返回 Server-Timing，
+    并记录端到端耗时与错误状态码
+
+    流式响应的响应头先于生成发出，因此只包含生成开始之前的阶段。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float, Optional[str]]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timings.append(("total", (time.perf_counter() - start) * 1000, None))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", format_server_timing(timings).encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route_path, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+            if status_code >= 400:
+                ERRORS.labels("http", str(status_code)).inc()
+
+
+def _cache_hit_ratio() -> float:
+    total = mindmap_cache.hits + mindmap_cache.misses
+    return mindmap_cache.hits / total if total else 0.0
+
+
+# 仪表盘指标在抓取时计算
+CACHE_HIT_RATIO.set_function(_cache_hit_ratio)
+RATE_LIMIT_QUEUE_DEPTH.set_function(gemini_rate_limiter.queue_depth)
+RATE_LIMIT_WAIT_SECONDS.set_function(lambda: gemini_rate_limiter.stats()["avg_wait_ms"] / 1000)
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """
+    生成 Prometheus 文本格式的指标
+
+    Returns:
+        (指标内容, Content-Type)
+
+    Raises:
+        ValueError: 未安装 prometheus-client 时
+    """
+    if generate_latest is None:
+        raise ValueError("prometheus-client库未安装，无法导出指标")
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(), CONTENT_TYPE_LATEST
+
+    # 多进程模式：汇总各工作进程写入共享目录的指标，再加上本进程抓取时计算的仪表盘指标
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for gauge in _SCRAPE_GAUGES:
+        registry.register(gauge)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_stopped() -> None:
+    """工作进程退出时调用，多进程模式下从存活进程的汇总中移除本进程"""
+    if generate_latest is not None and PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,152 @@
+"""
+思维导图树结构模块
+将模型输出的Markdown思维导图解析为紧凑的扁平树：节点按文档顺序编号，
+父节点下标、深度和标签偏移量保存在定长整数数组中，标签文本共用一个字符串
+"""
+
+import re
+from array import array
+from typing import Dict, List, Optional
+
+from .subtitles import parse_timestamp
+
+# 标题（# ~ ######）
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+# 列表项（- * + 或 1. 1)），捕获缩进
+_LIST_PATTERN = re.compile(r'^([ \t]*)(?:[-*+]|\d+[.)])\s+(.*?)\s*$')
+# 代码块围栏
+_FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+
+# 节点层级：标题为1~6，列表项排在所有标题之后，普通段落挂在最近的节点下
+_LIST_RANK = 7
+_TEXT_RANK = 1 << 20
+
+
+class MindmapTree:
+    """
+    扁平数组表示的思维导图树
+
+    第i个节点的父节点为 parent[i]（顶层节点为-1），深度为 depth[i]（顶层为0），
+    标签为 text[start[i]:end[i]]。节点按文档顺序（先序）排列，父节点总在子节点之前。
+    """
+
+    __slots__ = ("text", "parent", "depth", "start", "end")
+
+    def __init__(self, text: str, parent: array, depth: array, start: array, end: array):
+        self.text = text
+        self.parent = parent
+        self.depth = depth
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def label(self, index: int) -> str:
+        """返回第index个节点的标签"""
+        return self.text[self.start[index]:self.end[index]]
+
+    def labels(self) -> List[str]:
+        """按节点顺序返回全部标签"""
+        text = self.text
+        return [text[s:e] for s, e in zip(self.start, self.end)]
+
+    def timestamps(self) -> List[Optional[int]]:
+        """按节点顺序返回标签中的时间戳（秒），没有时间戳的节点为None"""
+        return [parse_timestamp(label) for label in self.labels()]
+
+    def children(self, index: int) -> List[int]:
+        """返回第index个节点的直接子节点下标（-1表示顶层节点）"""
+        return [i for i, p in enumerate(self.parent) if p == index]
+
+    def to_dict(self) -> Dict[str, object]:
+        """
+        序列化为扁平数组，前端可直接按下标重建树，无需再次解析Markdown
+
+        Returns:
+            包含 nodes、parent、depth、labels 的字典；节点标签带有时间戳（字幕生成的导图）时
+            另含 timestamps（各节点的起始秒数）
+        """
+        data = {
+            "nodes": len(self),
+            "parent": self.parent.tolist(),
+            "depth": self.depth.tolist(),
+            "labels": self.labels(),
+        }
+        timestamps = self.timestamps()
+        if any(t is not None for t in timestamps):
+            data["timestamps"] = timestamps
+        return data
+
+
+def parse_mindmap(markdown: str) -> MindmapTree:
+    """
+    将Markdown思维导图解析为扁平树
+
+    标题按级别嵌套；列表项挂在最近的标题下，并按缩进继续嵌套；
+    其余非空行作为最近节点的子节点；代码块内容忽略。
+
+    Args:
+        markdown: 模型生成的Markdown文本
+
+    Returns:
+        MindmapTree 实例
+    """
+    parent = array("i")
+    depth = array("i")
+    start = array("i")
+    end = array("i")
+    labels = []
+    offset = 0
+
+    # 祖先栈：(层级, 节点下标)
+    stack = []
+    # 当前列表块的缩进栈
+    indents = []
+    in_fence = False
+
+    for line in markdown.splitlines():
+        if _FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+            continue
+        if in_fence or not line.strip():
+            continue
+
+        heading = _HEADING_PATTERN.match(line)
+        if heading:
+            rank = len(heading.group(1))
+            label = heading.group(2)
+            indents = []
+        else:
+            item = _LIST_PATTERN.match(line)
+            if item:
+                indent = len(item.group(1).expandtabs(4))
+                while indents and indents[-1] > indent:
+                    indents.pop()
+                if not indents or indents[-1] < indent:
+                    indents.append(indent)
+                rank = _LIST_RANK + len(indents) - 1
+                label = item.group(2)
+            else:
+                rank = _TEXT_RANK
+                label = line.strip()
+
+        while stack and stack[-1][0] >= rank:
+            stack.pop()
+
+        index = len(labels)
+        if stack:
+            parent_index = stack[-1][1]
+            parent.append(parent_index)
+            depth.append(depth[parent_index] + 1)
+        else:
+            parent.append(-1)
+            depth.append(0)
+
+        start.append(offset)
+        offset += len(label)
+        end.append(offset)
+        labels.append(label)
+        stack.append((rank, index))
+
+    return MindmapTree("".join(labels), parent, depth, start, end)
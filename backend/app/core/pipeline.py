@@ -0,0 +1,331 @@
+"""
+生成流水线模块
+文本、文件、后台任务与批量接口共用同一条生成流程：
+ingest（接收输入）→ detect（识别格式）→ parse（解析）→ normalize（压缩并检查token预算）
+→ generate（带缓存生成）→ postprocess（树结构与提取文本存储）。
+每个阶段是可替换的异步函数，阶段完成后依次调用计时钩子（默认写入直方图与 Server-Timing）
+"""
+
+import math
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .ai_processor import (
+    generate_mindmap_incremental_async,
+    generate_mindmap_with_cache_async,
+    prepare_input_async,
+)
+from .compaction import PreparedInput, TokenBudgetExceeded
+from .file_parser import FileParser, ParseResult, detect_path_parser, parse_file_path, parse_path_with
+from .metrics import PIPELINE_STAGE_SECONDS, record_timing
+from .mindmap_tree import parse_mindmap
+from .rate_limiter import GeminiUnavailableError
+from .text_store import parsed_text_store, text_store
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 各阶段的名称与执行顺序
+STAGES = ("ingest", "detect", "parse", "normalize", "generate", "postprocess")
+
+# 文本输入的长度上限（字符）
+MAX_TEXT_LENGTH = 50000
+
+
+class PipelineError(Exception):
+    """输入无效或生成失败，携带对应的HTTP状态码（接口层据此返回错误响应）"""
+
+    def __init__(self, message: str, status_code: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers
+
+
+class PipelineContext:
+    """一次生成在各阶段之间传递的输入、中间结果与响应头"""
+
+    def __init__(
+        self,
+        text: Optional[str] = None,
+        filename: Optional[str] = None,
+        file_path: Optional[str] = None,
+        file_size: int = 0,
+        upload_hash: Optional[str] = None,
+        source: Any = None,
+        incremental: bool = False,
+        output_format: str = "markdown",
+    ):
+        """
+        Args:
+            text: 文本输入（文本接口）
+            filename: 原始文件名（文件接口，扩展名决定解析器）
+            file_path: 已落盘的上传文件路径
+            file_size: 上传文件大小
+            upload_hash: 上传文件的SHA-256十六进制摘要，用于查找已存储的解析结果
+            source: 接入层的原始输入（例如上传的文件对象），由接入层替换的 ingest 阶段处理
+            incremental: 为true时按分节增量生成
+            output_format: markdown 或 tree（postprocess 阶段生成树结构）
+        """
+        self.text = text
+        # 是否为文件输入（parse 阶段之后 text 为提取的文本）
+        self.is_file = text is None
+        self.filename = filename
+        self.file_path = file_path
+        self.file_size = file_size
+        self.upload_hash = upload_hash
+        self.source = source
+        self.incremental = incremental
+        self.output_format = output_format
+
+        # 各阶段的产出
+        self.parser: Optional[FileParser] = None
+        self.parsed: Optional[ParseResult] = None
+        self.parse_cached = False
+        self.prepared: Optional[PreparedInput] = None
+        self.mindmap: Optional[str] = None
+        self.cache_hit = False
+        self.tree: Optional[Dict[str, Any]] = None
+        self.text_hash: Optional[str] = None
+        # 需要写入响应的头（X-Parse-Cache、X-Input-Tokens、X-Cache 等）与各阶段耗时（秒）
+        self.headers: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+        self._cleanups: List[Callable[[], None]] = []
+
+    def add_cleanup(self, func: Callable[[], None]) -> None:
+        """登记流水线结束（或中途失败）时需要执行的清理，例如删除临时文件"""
+        self._cleanups.append(func)
+
+    def cleanup(self) -> None:
+        cleanups, self._cleanups = self._cleanups, []
+        for func in cleanups:
+            try:
+                func()
+            except OSError as e:
+                logger.warning(f"清理流水线临时资源失败: {e}")
+
+
+Stage = Callable[[PipelineContext], Awaitable[None]]
+# 计时钩子：(阶段名, 耗时秒数, 上下文)，可以是普通函数或返回可等待对象
+StageHook = Callable[[str, float, PipelineContext], Optional[Awaitable[None]]]
+
+
+def validate_text(text: Optional[str]) -> None:
+    """
+    校验文本输入
+
+    Raises:
+        PipelineError: 当输入为空或超过长度限制时
+    """
+    if not text or text.isspace():
+        raise PipelineError("输入的文本不能为空", 400)
+    if len(text) > MAX_TEXT_LENGTH:
+        raise PipelineError("文本长度超过50KB限制", 400)
+
+
+async def ingest(ctx: PipelineContext) -> None:
+    """文本输入做校验；文件输入需已落盘，或提供了可查找解析结果的上传文件哈希"""
+    if not ctx.is_file:
+        validate_text(ctx.text)
+        logger.info(f"开始处理文本输入，长度: {len(ctx.text)} 字符")
+        return
+    if ctx.file_path is None and not ctx.upload_hash:
+        raise PipelineError("请上传文件或提供 upload_hash", 400)
+    if not ctx.filename:
+        raise PipelineError("文件名不能为空", 400)
+
+
+async def detect(ctx: PipelineContext) -> None:
+    """只读取文件头选择解析器，不支持的格式在解析和查找存储之前即返回400"""
+    if not ctx.is_file or ctx.file_path is None:
+        return
+    try:
+        ctx.parser = await asyncio.to_thread(detect_path_parser, ctx.filename, ctx.file_path)
+    except ValueError as e:
+        raise PipelineError(str(e), 400)
+
+
+async def parse_in_thread(ctx: PipelineContext) -> ParseResult:
+    """在线程池中解析已落盘的文件（CPU密集，避免阻塞事件循环）"""
+    if ctx.parser is not None:
+        return await asyncio.to_thread(parse_path_with, ctx.parser, ctx.file_path)
+    return await asyncio.to_thread(parse_file_path, ctx.filename, ctx.file_path)
+
+
+def make_parse_stage(parse_func: Callable[[PipelineContext], Awaitable[ParseResult]]) -> Stage:
+    """
+    创建 parse 阶段：相同内容此前解析过时直接使用存储的解析结果，否则调用 parse_func 解析并保存
+
+    Args:
+        parse_func: 解析已落盘文件的异步函数（默认在线程池中，批量接口在进程池中）
+    """
+    async def parse(ctx: PipelineContext) -> None:
+        if not ctx.is_file:
+            return
+
+        stored = None
+        if ctx.upload_hash:
+            stored = await asyncio.to_thread(parsed_text_store.get, ctx.upload_hash, ctx.filename)
+        if stored is not None:
+            logger.info(f"使用已存储的解析结果: {ctx.upload_hash[:12]}")
+            ctx.parsed, ctx.parse_cached = stored.parsed, True
+            ctx.file_size = ctx.file_size or stored.file_size
+        elif ctx.file_path is None:
+            raise PipelineError("没有该文件的解析结果，请上传文件", 404)
+        else:
+            try:
+                ctx.parsed = await parse_func(ctx)
+                logger.info(f"文件解析成功，提取文本长度: {len(ctx.parsed.text)} 字符，编码: {ctx.parsed.encoding}")
+            except ValueError as e:
+                raise PipelineError(str(e), 400)
+            except Exception as e:
+                logger.error(f"文件 {ctx.filename} 解析失败: {e}")
+                raise PipelineError("文件解析失败，请检查文件格式是否正确", 500)
+
+        ctx.headers["X-Parse-Cache"] = "HIT" if ctx.parse_cached else "MISS"
+        if not ctx.parsed.text or ctx.parsed.text.isspace():
+            raise PipelineError("文件内容为空或无法提取有效文本", 400)
+        if not ctx.parse_cached and ctx.upload_hash:
+            await asyncio.to_thread(parsed_text_store.put, ctx.upload_hash, ctx.filename, ctx.parsed, ctx.file_size)
+        ctx.text = ctx.parsed.text
+
+    return parse
+
+
+async def normalize(ctx: PipelineContext) -> None:
+    """压缩输入并检查token预算，写入 X-Input-Tokens 与 X-Tokens-Saved"""
+    try:
+        ctx.prepared = await prepare_input_async(ctx.text)
+    except TokenBudgetExceeded as e:
+        raise PipelineError(str(e), 413)
+    ctx.headers["X-Input-Tokens"] = str(ctx.prepared.tokens)
+    ctx.headers["X-Tokens-Saved"] = str(ctx.prepared.saved_tokens)
+
+
+def unavailable_error(e: GeminiUnavailableError) -> PipelineError:
+    """将配额耗尽/上游不可用转换为 429/503 错误（附带 Retry-After）"""
+    headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+    return PipelineError(str(e), e.status_code, headers)
+
+
+async def generate(ctx: PipelineContext) -> None:
+    """
+    带缓存生成思维导图
+
+    完整生成时 X-Cache 为 HIT / MISS；增量生成时全部分节命中为 HIT，部分命中为 PARTIAL，
+    并在 X-Sections-Reused 中给出 复用分节数/分节总数。
+    """
+    try:
+        if ctx.incremental:
+            result = await generate_mindmap_incremental_async(ctx.prepared.text)
+            ctx.mindmap, ctx.cache_hit = result.mindmap, result.reused == result.sections
+            if ctx.cache_hit:
+                ctx.headers["X-Cache"] = "HIT"
+            else:
+                ctx.headers["X-Cache"] = "PARTIAL" if result.reused else "MISS"
+            ctx.headers["X-Sections-Reused"] = f"{result.reused}/{result.sections}"
+        else:
+            ctx.mindmap, ctx.cache_hit = await generate_mindmap_with_cache_async(ctx.prepared.text)
+            ctx.headers["X-Cache"] = "HIT" if ctx.cache_hit else "MISS"
+    except GeminiUnavailableError as e:
+        raise unavailable_error(e)
+
+    if ctx.mindmap is None:
+        raise PipelineError("AI服务处理失败，请稍后再试", 500)
+
+
+async def postprocess(ctx: PipelineContext) -> None:
+    """按需解析为树结构；文件输入的提取文本存入文本存储，供 GET /texts/{hash} 读取"""
+    if ctx.output_format == "tree":
+        ctx.tree = parse_mindmap(ctx.mindmap).to_dict()
+    if ctx.is_file:
+        ctx.text_hash = await asyncio.to_thread(text_store.put, ctx.text)
+
+
+def record_stage_timing(stage: str, seconds: float, ctx: PipelineContext) -> None:
+    """默认计时钩子：写入阶段耗时直方图与当前请求的 Server-Timing"""
+    PIPELINE_STAGE_SECONDS.labels(stage).observe(seconds)
+    record_timing(f"stage_{stage}", seconds)
+
+
+class Pipeline:
+    """
+    按固定顺序执行各阶段的生成流水线
+
+    阶段可以用 with_stage 替换（返回新的流水线，不影响原流水线），
+    run 可以只执行其中一段，例如流式接口只执行到 normalize，再自行推送生成结果。
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Stage]], hooks: Iterable[StageHook] = ()):
+        """
+        Args:
+            stages: 按 STAGES 顺序排列的 (阶段名, 阶段函数)
+            hooks: 每个阶段完成后调用的计时钩子
+        """
+        names = tuple(name for name, _ in stages)
+        if names != STAGES:
+            raise ValueError(f"流水线阶段必须依次为: {', '.join(STAGES)}")
+        self.stages = list(stages)
+        self.hooks = list(hooks)
+
+    def with_stage(self, name: str, stage: Stage) -> "Pipeline":
+        """返回替换了指定阶段的新流水线"""
+        if name not in STAGES:
+            raise ValueError(f"未知的流水线阶段: {name}")
+        stages = [(stage_name, stage if stage_name == name else func) for stage_name, func in self.stages]
+        return Pipeline(stages, self.hooks)
+
+    async def run(
+        self,
+        ctx: PipelineContext,
+        start: Optional[str] = None,
+        until: Optional[str] = None,
+        hooks: Iterable[StageHook] = (),
+    ) -> PipelineContext:
+        """
+        依次执行从 start 到 until（均包含）的阶段，结束或失败后执行上下文登记的清理
+
+        Args:
+            ctx: 流水线上下文
+            start: 起始阶段，默认从 ingest 开始
+            until: 结束阶段，默认执行到 postprocess
+            hooks: 本次执行额外的钩子（例如更新后台任务进度）
+
+        Returns:
+            执行后的上下文
+
+        Raises:
+            PipelineError: 输入无效或生成失败时
+        """
+        first = STAGES.index(start) if start else 0
+        last = STAGES.index(until) if until else len(STAGES) - 1
+        all_hooks = [*self.hooks, *hooks]
+        try:
+            for name, stage in self.stages[first:last + 1]:
+                began = time.perf_counter()
+                await stage(ctx)
+                elapsed = time.perf_counter() - began
+                ctx.timings[name] = elapsed
+                for hook in all_hooks:
+                    result = hook(name, elapsed, ctx)
+                    if inspect.isawaitable(result):
+                        await result
+        finally:
+            ctx.cleanup()
+        return ctx
+
+
+# 默认流水线（文件在线程池中解析）
+mindmap_pipeline = Pipeline(
+    [
+        ("ingest", ingest),
+        ("detect", detect),
+        ("parse", make_parse_stage(parse_in_thread)),
+        ("normalize", normalize),
+        ("generate", generate),
+        ("postprocess", postprocess),
+    ],
+    hooks=[record_stage_timing],
+)
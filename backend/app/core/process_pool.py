@@ -0,0 +1,45 @@
+"""
+进程池模块
+PDF并行解析与批量解析共用的按需创建、可重建的进程池
+"""
+
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+
+class LazyProcessPool:
+    """
+    按需创建的进程池
+
+    首次使用时才创建，之后在整个进程生命周期内复用，避免每次解析都启动新进程；
+    工作进程使用 spawn 启动：服务进程运行着事件循环、gRPC 等线程，fork 可能复制到被其他线程持有的锁。
+    """
+
+    def __init__(self, max_workers: int, initializer: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            max_workers: 工作进程数
+            initializer: 每个工作进程启动时调用的函数
+        """
+        self.max_workers = max_workers
+        self._initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ProcessPoolExecutor:
+        """获取（必要时创建）进程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self._initializer
+                )
+            return self._executor
+
+    def discard(self) -> None:
+        """丢弃进程池（工作进程异常退出后 BrokenProcessPool 不可再用），下次使用时重建"""
+        with self._lock:
+            self._executor = None
@@ -0,0 +1,398 @@
+"""
+Gemini 调用限流与重试模块
+令牌桶按每分钟请求数（RPM）和每分钟token数（TPM）为出站调用定速，
+排队请求按客户端轮流放行；配额错误触发整体退避，临时性错误在截止时间内带抖动指数退避重试
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from .shared_state import BucketDemand, SharedState, shared_state
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 每分钟请求数 / 每分钟输入token数上限（0 表示不限制），应与项目配额一致
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "1000"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "4000000"))
+
+# 单次生成（含排队与重试）的截止时间（秒）
+GEMINI_REQUEST_DEADLINE = float(os.environ.get("GEMINI_REQUEST_DEADLINE", "180"))
+
+# 重试次数上限 / 退避基准与上限（秒）
+GEMINI_RETRY_MAX_ATTEMPTS = int(os.environ.get("GEMINI_RETRY_MAX_ATTEMPTS", "5"))
+GEMINI_RETRY_BASE_DELAY = float(os.environ.get("GEMINI_RETRY_BASE_DELAY", "1"))
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get("GEMINI_RETRY_MAX_DELAY", "30"))
+
+# 收到配额错误且服务端未给出重试时间时，暂停放行新请求的秒数
+GEMINI_QUOTA_BACKOFF = float(os.environ.get("GEMINI_QUOTA_BACKOFF", "10"))
+
+# 当前请求的客户端标识（API Key 或客户端IP），由路由层设置，用于公平排队
+current_client_id: ContextVar[str] = ContextVar("current_client_id", default="anonymous")
+
+
+class GeminiUnavailableError(Exception):
+    """配额耗尽或上游暂时不可用，重试后仍未成功"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitTimeout(Exception):
+    """排队等待超过截止时间"""
+
+
+class TokenBucket:
+    """令牌桶：按每分钟速率补充，容量为一分钟的配额"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """距离可取出 amount 个令牌还需等待的秒数（超过容量的请求按容量计）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    def __init__(self, tokens: int, future: asyncio.Future):
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class GeminiRateLimiter:
+    """
+    Gemini 出站调用限流器
+
+    异步调用方按客户端标识分别排队，调度协程在各客户端队列之间轮流取出请求，
+    等待令牌桶有余量后放行，单个客户端的突发请求不会饿死其他客户端。
+    传入进程间共享的状态后端时，令牌桶与配额退避由所有工作进程共同使用。
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM, state: Optional[SharedState] = None):
+        # 进程内后端不需要经过共享状态，沿用本进程的令牌桶
+        self._state = state if state is not None and state.shared else None
+        self._request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self._token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._current: Optional[_Waiter] = None
+
+        # 统计信息
+        self.admitted = 0
+        self.waited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.throttled = 0
+        self.retries = 0
+
+    def _delay(self, tokens: int, now: float) -> float:
+        """放行一个请求还需等待的秒数（调用方需持有锁）"""
+        delay = max(0.0, self._paused_until - now)
+        if self._request_bucket is not None:
+            delay = max(delay, self._request_bucket.time_until(1, now))
+        if self._token_bucket is not None:
+            delay = max(delay, self._token_bucket.time_until(tokens, now))
+        return delay
+
+    def _try_admit(self, tokens: int) -> float:
+        """有余量时立即扣减令牌并返回0，否则返回需等待的秒数"""
+        if self._state is not None:
+            try:
+                return self._try_admit_shared(tokens)
+            except Exception as e:
+                # 共享状态不可用时退回本进程的令牌桶，不阻断调用
+                logger.warning(f"共享限流状态不可用，使用进程内令牌桶: {e}")
+        with self._lock:
+            delay = self._delay(tokens, time.monotonic())
+            if delay == 0:
+                if self._request_bucket is not None:
+                    self._request_bucket.consume(1)
+                if self._token_bucket is not None:
+                    self._token_bucket.consume(tokens)
+            return delay
+
+    async def _try_admit_async(self, tokens: int) -> float:
+        """_try_admit 的异步版本：经共享状态放行时在线程池中访问数据库，不阻塞事件循环"""
+        if self._state is None:
+            return self._try_admit(tokens)
+        return await asyncio.to_thread(self._try_admit, tokens)
+
+    def _try_admit_shared(self, tokens: int) -> float:
+        """经共享状态放行：先检查配额退避，再原子地从共享令牌桶中扣减"""
+        paused_until = self._state.get("gemini", "paused_until")
+        if paused_until is not None:
+            delay = float(paused_until) - time.time()
+            if delay > 0:
+                return delay
+
+        demands = []
+        if self._request_bucket is not None:
+            demands.append(BucketDemand("gemini:requests", 1, self._request_bucket.capacity, self._request_bucket.rate))
+        if self._token_bucket is not None:
+            demands.append(BucketDemand("gemini:tokens", tokens, self._token_bucket.capacity, self._token_bucket.rate))
+        return self._state.take_tokens(demands) if demands else 0.0
+
+    def _record_wait(self, waited: float) -> None:
+        self.admitted += 1
+        if waited > 0:
+            self.waited += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    async def acquire(self, tokens: int, client_id: str = "anonymous", deadline: Optional[float] = None) -> None:
+        """
+        等待放行一次调用
+
+        Args:
+            tokens: 本次调用预计消耗的输入token数
+            client_id: 客户端标识，用于公平排队
+            deadline: time.monotonic() 时间点，超过时抛出 RateLimitTimeout
+
+        Raises:
+            RateLimitTimeout: 等待超过截止时间
+        """
+        if not self._queues and self._current is None and await self._try_admit_async(tokens) == 0:
+            self._record_wait(0.0)
+            return
+
+        self._ensure_dispatcher()
+        waiter = _Waiter(tokens, self._loop.create_future())
+        self._queues.setdefault(client_id, deque()).append(waiter)
+        self._wakeup.set()
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            waiter.future.cancel()
+            raise RateLimitTimeout("排队等待超过截止时间")
+        except asyncio.CancelledError:
+            waiter.future.cancel()
+            raise
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环更换（例如测试中多次 asyncio.run）时，旧循环上的排队状态已失效
+            self._loop = loop
+            self._queues.clear()
+            self._wakeup = asyncio.Event()
+            self._dispatcher = None
+            self._current = None
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """在各客户端队列之间轮流取出下一个仍在等待的请求"""
+        while self._queues:
+            client_id, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[client_id] = queue
+            if not waiter.future.done():
+                return waiter
+        return None
+
+    async def _dispatch(self) -> None:
+        while True:
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._current = waiter
+            try:
+                delay = await self._try_admit_async(waiter.tokens)
+                while delay > 0 and not waiter.future.done():
+                    await asyncio.sleep(delay)
+                    delay = await self._try_admit_async(waiter.tokens)
+            finally:
+                self._current = None
+
+            if waiter.future.done():
+                # 等待期间调用方已离开
+                continue
+            self._record_wait(time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """收到配额错误后暂停放行新请求"""
+        backoff = retry_after if retry_after is not None else GEMINI_QUOTA_BACKOFF
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+        if self._state is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._share_pause(backoff)
+            else:
+                # 在事件循环中调用时，写入共享状态放到线程池，不阻塞事件循环
+                loop.run_in_executor(None, self._share_pause, backoff)
+        self.throttled += 1
+        logger.warning(f"Gemini 配额受限，暂停放行新请求 {backoff:.1f} 秒")
+
+    def _share_pause(self, backoff: float) -> None:
+        """将配额退避写入共享状态，其他工作进程同样暂停放行"""
+        try:
+            self._state.set("gemini", "paused_until", str(time.time() + backoff), ttl=backoff)
+        except Exception as e:
+            logger.warning(f"写入共享配额退避状态失败: {e}")
+
+    def queue_depth(self) -> int:
+        """排队中的请求数"""
+        queued = sum(1 for queue in self._queues.values() for waiter in queue if not waiter.future.done())
+        return queued + (1 if self._current is not None else 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """限流统计信息"""
+        return {
+            "queue_depth": self.queue_depth(),
+            "queued_clients": len(self._queues),
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "avg_wait_ms": round(self.total_wait_seconds / self.waited * 1000, 1) if self.waited else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "paused_for_ms": round(max(0.0, self._paused_until - time.monotonic()) * 1000, 1),
+        }
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """
+    判断异常是否可重试
+
+    Returns:
+        "quota"（配额错误）、"transient"（临时性错误）或 None（不可重试）
+    """
+    try:
+        # 异常来自 SDK 时该模块必然已导入，这里不会增加导入开销
+        from google.api_core import exceptions as core_exceptions
+    except ImportError:
+        return None
+    if isinstance(error, core_exceptions.ResourceExhausted):
+        return "quota"
+    if isinstance(error, (
+        core_exceptions.ServiceUnavailable,
+        core_exceptions.InternalServerError,
+        core_exceptions.DeadlineExceeded,
+        core_exceptions.Aborted,
+    )):
+        return "transient"
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """从配额错误的 RetryInfo 详情中读取服务端建议的重试间隔"""
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间（指数退避，全抖动）"""
+    return random.uniform(0, min(GEMINI_RETRY_MAX_DELAY, GEMINI_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def _give_up(kind: str, retry_after: Optional[float]) -> GeminiUnavailableError:
+    if kind == "quota":
+        return GeminiUnavailableError("AI服务请求过于频繁，请稍后再试", 429, retry_after or GEMINI_QUOTA_BACKOFF)
+    return GeminiUnavailableError("AI服务暂时不可用，请稍后再试", 503, retry_after)
+
+
+def _next_retry_delay(limiter: GeminiRateLimiter, error: Exception, attempt: int, deadline: float) -> float:
+    """
+    处理一次失败调用：不可重试的错误原样抛出，可重试的错误返回重试前的等待时间，
+    次数或截止时间用尽时抛出 GeminiUnavailableError
+    """
+    kind = classify_error(error)
+    if kind is None:
+        raise error
+
+    retry_after = retry_after_seconds(error)
+    if kind == "quota":
+        limiter.penalize(retry_after)
+
+    delay = max(backoff_delay(attempt), retry_after or 0.0)
+    if attempt + 1 >= GEMINI_RETRY_MAX_ATTEMPTS or time.monotonic() + delay > deadline:
+        logger.error(f"Gemini 调用失败且重试已用尽: {type(error).__name__}: {error}")
+        raise _give_up(kind, retry_after) from error
+
+    limiter.retries += 1
+    logger.warning(f"Gemini 调用失败（{type(error).__name__}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+    return delay
+
+
+async def call_with_retry(
+    func: Callable[[], Awaitable[T]],
+    tokens: int,
+    limiter: Optional["GeminiRateLimiter"] = None,
+) -> T:
+    """
+    经限流器放行后调用 func，配额与临时性错误在截止时间内重试
+
+    Args:
+        func: 无参数的协程函数，每次重试都会重新调用
+        tokens: 预计消耗的输入token数
+        limiter: 限流器，默认使用全局限流器
+
+    Returns:
+        func 的返回值
+
+    Raises:
+        GeminiUnavailableError: 排队超时或重试用尽
+        Exception: 不可重试的错误原样抛出
+    """
+    limiter = limiter or gemini_rate_limiter
+    deadline = time.monotonic() + GEMINI_REQUEST_DEADLINE
+    client_id = current_client_id.get()
+    attempt = 0
+    while True:
+        try:
+            await limiter.acquire(tokens, client_id, deadline)
+        except RateLimitTimeout:
+            raise _give_up("quota", None)
+
+        try:
+            return await func()
+        except Exception as e:
+            delay = _next_retry_delay(limiter, e, attempt, deadline)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+# 全局限流器
+gemini_rate_limiter = GeminiRateLimiter(state=shared_state)
@@ -0,0 +1,402 @@
+"""
+共享状态模块
+多工作进程部署时，思维导图缓存、Gemini 限流令牌桶和后台任务状态需要在进程之间共享。
+SharedState 提供带过期时间的键值存储和原子的多令牌桶扣减，后端有进程内、
+SQLite（同一台机器上的多个工作进程）和 PostgreSQL（多台机器）三种，由 SHARED_STATE_URL 选择
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from types import ModuleType
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 共享状态后端：未设置或 memory:// 为进程内，sqlite:///路径 为SQLite文件，postgresql://... 为PostgreSQL
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL", "")
+
+# 每写入这么多次清理一次过期条目
+_PURGE_EVERY = 1000
+
+
+def import_sqlalchemy(purpose: str) -> ModuleType:
+    """
+    按需导入 SQLAlchemy（导入耗时较长），只有配置了数据库后端的进程才需要
+
+    Args:
+        purpose: 错误信息中的用途
+
+    Raises:
+        ValueError: SQLAlchemy 未安装时
+    """
+    try:
+        import sqlalchemy
+    except ImportError:
+        raise ValueError(f"SQLAlchemy库未安装，无法使用{purpose}")
+    return sqlalchemy
+
+
+class BucketDemand(NamedTuple):
+    """从一个令牌桶中取出令牌的请求"""
+    name: str
+    amount: float
+    # 桶容量与每秒补充的令牌数
+    capacity: float
+    rate: float
+
+
+def _refilled(tokens: float, updated: float, demand: BucketDemand, now: float) -> float:
+    """按上次更新以来经过的时间补充令牌"""
+    return min(demand.capacity, tokens + max(0.0, now - updated) * demand.rate)
+
+
+def _admission_delay(levels: Sequence[float], demands: Sequence[BucketDemand]) -> float:
+    """各桶当前余量下放行还需等待的秒数（超过容量的请求按容量计）"""
+    delay = 0.0
+    for level, demand in zip(levels, demands):
+        amount = min(demand.amount, demand.capacity)
+        if level < amount:
+            delay = max(delay, (amount - level) / demand.rate)
+    return delay
+
+
+class SharedState(ABC):
+    """共享状态接口"""
+
+    # 是否在进程之间共享（进程内后端为 False，调用方可据此沿用原有的进程内实现）
+    shared = True
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """读取值，不存在或已过期时返回None"""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """写入值，ttl 为存活秒数（None表示不过期）"""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        """删除值，不存在时忽略"""
+
+    @abstractmethod
+    def update(self, namespace: str, key: str, func: Callable[[str], str], ttl: Optional[float] = None) -> Optional[str]:
+        """
+        原子地读改写一个值：在同一事务中读取当前值并写入 func 的返回值，并发更新不会互相覆盖
+
+        Args:
+            func: 由当前值计算新值
+            ttl: 新值的存活秒数（None表示不过期）
+
+        Returns:
+            写入的新值；不存在或已过期时不调用 func，返回None
+        """
+
+    @abstractmethod
+    def take_tokens(self, demands: Sequence[BucketDemand]) -> float:
+        """
+        原子地从多个令牌桶中各取出令牌：全部有余量时一起扣减并返回0，
+        否则不扣减，返回还需等待的秒数。不存在的桶视为满桶
+
+        Args:
+            demands: 各令牌桶的取出请求
+
+        Returns:
+            还需等待的秒数，0表示已放行
+        """
+
+
+class InProcessSharedState(SharedState):
+    """进程内后端（单进程部署与测试使用）"""
+
+    shared = False
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], Tuple[str, Optional[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[(namespace, key)]
+                return None
+            return value
+
+    def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._values[(namespace, key)] = (value, expires_at)
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                now = time.time()
+                expired = [k for k, (_, e) in self._values.items() if e is not None and e <= now]
+                for k in expired:
+                    del self._values[k]
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._values.pop((namespace, key), None)
+
+    def update(self, namespace: str, key: str, func: Callable[[str], str], ttl: Optional[float] = None) -> Optional[str]:
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+                return None
+            value = func(entry[0])
+            self._values[(namespace, key)] = (value, time.time() + ttl if ttl is not None else None)
+            return value
+
+    def take_tokens(self, demands: Sequence[BucketDemand]) -> float:
+        now = time.time()
+        with self._lock:
+            levels = [
+                _refilled(*self._buckets.get(d.name, (d.capacity, now)), d, now)
+                for d in demands
+            ]
+            delay = _admission_delay(levels, demands)
+            if delay == 0:
+                for level, demand in zip(levels, demands):
+                    self._buckets[demand.name] = (level - min(demand.amount, demand.capacity), now)
+            return delay
+
+
+class SQLiteSharedState(SharedState):
+    """
+    SQLite 后端，同一台机器上的多个工作进程共享一个数据库文件
+
+    使用WAL模式；令牌桶扣减在 BEGIN IMMEDIATE 事务中完成，进程之间互斥。
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: 数据库文件路径
+            busy_timeout: 等待其他进程释放写锁的秒数
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS shared_values ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS shared_buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM shared_values WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO shared_values (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, expires_at)
+            )
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM shared_values WHERE expires_at <= ?", (now,))
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM shared_values WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(self, namespace: str, key: str, func: Callable[[str], str], ttl: Optional[float] = None) -> Optional[str]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM shared_values WHERE namespace = ? AND key = ?",
+                    (namespace, key)
+                ).fetchone()
+                value = None
+                if row is not None and (row[1] is None or row[1] > now):
+                    value = func(row[0])
+                    self._db.execute(
+                        "UPDATE shared_values SET value = ?, expires_at = ? WHERE namespace = ? AND key = ?",
+                        (value, now + ttl if ttl is not None else None, namespace, key)
+                    )
+                self._db.execute("COMMIT")
+                return value
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def take_tokens(self, demands: Sequence[BucketDemand]) -> float:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                levels = []
+                for demand in demands:
+                    row = self._db.execute(
+                        "SELECT tokens, updated_at FROM shared_buckets WHERE name = ?", (demand.name,)
+                    ).fetchone()
+                    levels.append(_refilled(*(row or (demand.capacity, now)), demand, now))
+
+                delay = _admission_delay(levels, demands)
+                if delay == 0:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO shared_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                        [(d.name, level - min(d.amount, d.capacity), now) for level, d in zip(levels, demands)]
+                    )
+                self._db.execute("COMMIT")
+                return delay
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+
+class PostgresSharedState(SharedState):
+    """
+    PostgreSQL 后端（基于 SQLAlchemy），多台机器上的工作进程共享
+
+    令牌桶扣减时以 SELECT ... FOR UPDATE 锁定相关的桶，时间取各进程的系统时钟。
+    """
+
+    def __init__(self, url: str):
+        sa = import_sqlalchemy("PostgreSQL共享状态")
+        from sqlalchemy.dialects.postgresql import insert
+
+        self._insert = insert
+        self._engine = sa.create_engine(url, pool_pre_ping=True)
+        metadata = sa.MetaData()
+        self._values = sa.Table(
+            "shared_values", metadata,
+            sa.Column("namespace", sa.String(64), primary_key=True),
+            sa.Column("key", sa.String(255), primary_key=True),
+            sa.Column("value", sa.Text, nullable=False),
+            sa.Column("expires_at", sa.Float),
+        )
+        self._buckets = sa.Table(
+            "shared_buckets", metadata,
+            sa.Column("name", sa.String(255), primary_key=True),
+            sa.Column("tokens", sa.Float, nullable=False),
+            sa.Column("updated_at", sa.Float, nullable=False),
+        )
+        metadata.create_all(self._engine)
+        self._writes = 0
+
+    def _where(self, namespace: str, key: str):
+        return (self._values.c.namespace == namespace) & (self._values.c.key == key)
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                self._values.select().where(self._where(namespace, key))
+            ).mappings().first()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            return None
+        return row["value"]
+
+    def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        statement = self._insert(self._values).values(namespace=namespace, key=key, value=value, expires_at=expires_at)
+        statement = statement.on_conflict_do_update(
+            index_elements=["namespace", "key"],
+            set_={"value": value, "expires_at": expires_at}
+        )
+        with self._engine.begin() as conn:
+            conn.execute(statement)
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                conn.execute(self._values.delete().where(self._values.c.expires_at <= now))
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(self._values.delete().where(self._where(namespace, key)))
+
+    def update(self, namespace: str, key: str, func: Callable[[str], str], ttl: Optional[float] = None) -> Optional[str]:
+        with self._engine.begin() as conn:
+            row = conn.execute(
+                self._values.select().where(self._where(namespace, key)).with_for_update()
+            ).mappings().first()
+            now = time.time()
+            if row is None or (row["expires_at"] is not None and row["expires_at"] <= now):
+                return None
+            value = func(row["value"])
+            conn.execute(
+                self._values.update().where(self._where(namespace, key))
+                .values(value=value, expires_at=now + ttl if ttl is not None else None)
+            )
+            return value
+
+    def take_tokens(self, demands: Sequence[BucketDemand]) -> float:
+        now = time.time()
+        names = sorted(d.name for d in demands)
+        with self._engine.begin() as conn:
+            # 不存在的桶先以满桶插入，使 FOR UPDATE 总能锁到行
+            conn.execute(
+                self._insert(self._buckets)
+                .values([{"name": d.name, "tokens": d.capacity, "updated_at": now} for d in demands])
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            rows = conn.execute(
+                self._buckets.select()
+                .where(self._buckets.c.name.in_(names))
+                .order_by(self._buckets.c.name)
+                .with_for_update()
+            ).mappings().all()
+            current = {row["name"]: (row["tokens"], row["updated_at"]) for row in rows}
+
+            levels: List[float] = [_refilled(*current[d.name], d, now) for d in demands]
+            delay = _admission_delay(levels, demands)
+            if delay == 0:
+                for level, demand in zip(levels, demands):
+                    conn.execute(
+                        self._buckets.update()
+                        .where(self._buckets.c.name == demand.name)
+                        .values(tokens=level - min(demand.amount, demand.capacity), updated_at=now)
+                    )
+            return delay
+
+
+def create_shared_state(url: str) -> SharedState:
+    """
+    根据地址创建共享状态后端
+
+    Args:
+        url: 空字符串或 memory://、sqlite:///路径、postgresql://...
+
+    Raises:
+        ValueError: 不支持的地址
+    """
+    if not url or url == "memory://":
+        return InProcessSharedState()
+    if url.startswith("sqlite:///"):
+        logger.info(f"使用SQLite共享状态: {url[len('sqlite:///'):]}")
+        return SQLiteSharedState(url[len("sqlite:///"):])
+    if url.startswith(("postgresql://", "postgresql+", "postgres://")):
+        logger.info("使用PostgreSQL共享状态")
+        return PostgresSharedState(url.replace("postgres://", "postgresql://", 1))
+    raise ValueError(f"不支持的共享状态地址: {url}")
+
+
+# 全局共享状态
+shared_state = create_shared_state(SHARED_STATE_URL)
@@ -0,0 +1,74 @@
+"""
+请求合并模块
+相同键的并发调用只执行一次，所有调用方共享同一结果（single-flight）
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, TypeVar
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    """一次进行中的调用及其等待者数量"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    异步请求合并
+
+    第一个调用方创建执行任务，之后相同键的调用方等待同一任务：
+    - 任务正常返回或抛出异常时，所有等待者得到相同的结果或异常；
+    - 单个等待者被取消（例如客户端断开连接）不影响其他等待者；
+    - 所有等待者都被取消时，取消执行任务，从而取消上游调用。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    def in_flight(self) -> int:
+        """进行中的调用数"""
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行或加入相同键的调用
+
+        Args:
+            key: 调用的唯一键
+            func: 无参数的协程函数，仅在没有进行中的相同调用时执行
+
+        Returns:
+            func 的返回值
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            logger.info(f"合并进行中的相同请求: {key[:12]}")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                logger.info(f"所有等待者均已离开，取消请求: {key[:12]}")
+                # 任务被取消后仍要运行到清理完成才结束，先移出进行中的调用，之后的调用方重新执行而不是加入已取消的任务
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
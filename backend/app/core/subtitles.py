@@ -0,0 +1,148 @@
+"""
+字幕时间轴模块
+在一次线性遍历中合并自动字幕的滚动重复（每条字幕重复上一条的内容），
+再按时间窗口把字幕分段，段首带有起始时间戳，供模型把时间戳挂到导图节点上
+"""
+
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+# 字幕中的格式标签：HTML样式（<i>、<font>、自动字幕的逐词时间 <00:00:01.234><c>）与ASS样式（{\an8}）
+_MARKUP_PATTERN = re.compile(r'<[^>\n]*>|\{\\[^}\n]*\}')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+# 中日韩字符之间拼接时不加空格
+_CJK_PATTERN = re.compile('[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+# 段首或节点标签中的时间戳：[01:02:03] 或 [02:03]
+TIMESTAMP_PATTERN = re.compile(r'\[(?:(\d{1,2}):)?(\d{1,2}):(\d{2})\]')
+# 与上一条字幕间隔不少于该秒数时视为新的一句话，不做滚动去重
+_ROLLING_MAX_GAP = 1.0
+
+
+class Cue(NamedTuple):
+    """一条字幕或一个时间段（时间单位为秒）"""
+    start: float
+    end: float
+    text: str
+
+
+def format_timestamp(seconds: float) -> str:
+    """将秒数格式化为 HH:MM:SS"""
+    total = int(seconds)
+    hours, rest = divmod(total, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def parse_timestamp(label: str) -> Optional[int]:
+    """
+    提取标签中第一个 [HH:MM:SS] / [MM:SS] 时间戳
+
+    Args:
+        label: 导图节点标签
+
+    Returns:
+        时间戳对应的秒数，没有时间戳时返回None
+    """
+    match = TIMESTAMP_PATTERN.search(label)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _join_text(parts: List[str]) -> str:
+    """拼接文本片段：中日韩字符之间直接相连，其余情况用空格分隔"""
+    pieces = [parts[0]]
+    for previous, part in zip(parts, parts[1:]):
+        if not (_CJK_PATTERN.match(previous[-1]) and _CJK_PATTERN.match(part[0])):
+            pieces.append(' ')
+        pieces.append(part)
+    return ''.join(pieces)
+
+
+def _clean_lines(content: str) -> List[str]:
+    """去掉格式标签并规整空白，返回字幕的非空行"""
+    lines = (_WHITESPACE_PATTERN.sub(' ', line).strip() for line in _MARKUP_PATTERN.sub('', content).splitlines())
+    return [line for line in lines if line]
+
+
+def _line_overlap(previous: List[str], current: List[str]) -> int:
+    """上一条字幕的末尾若干行与当前字幕开头若干行相同的最大行数"""
+    for size in range(min(len(previous), len(current)), 0, -1):
+        if previous[-size:] == current[:size]:
+            return size
+    return 0
+
+
+def merge_rolling_captions(cues: Iterable[Cue]) -> Iterator[Cue]:
+    """
+    合并滚动字幕与重复字幕，只遍历一次、不缓存整个字幕列表
+
+    只有与上一条间隔不到 _ROLLING_MAX_GAP 秒的字幕才视为滚动：
+    - 开头重复上一条末尾行的字幕只保留新增的行；
+    - 与上一条完全相同的字幕并入上一条（延长结束时间）；
+    - 逐字增长的字幕（新内容以上一条内容开头，且在上一条结束时即接着显示）替换上一条。
+    时间上分开的字幕即使内容相同或前缀相同（例如“好的”之后另说一句“好的，我们开始”）也各自保留。
+
+    Args:
+        cues: 按时间顺序排列的字幕
+
+    Yields:
+        去重后的字幕
+    """
+    previous_lines: List[str] = []
+    previous_end = 0.0
+    pending: Optional[Cue] = None
+
+    for cue in cues:
+        lines = _clean_lines(cue.text)
+        if not lines:
+            continue
+        rolling = bool(previous_lines) and cue.start - previous_end < _ROLLING_MAX_GAP
+        new_lines = lines[_line_overlap(previous_lines, lines):] if rolling else lines
+        # 逐字增长的字幕与上一条首尾相接（或重叠）
+        growing = rolling and cue.start <= previous_end
+        previous_lines, previous_end = lines, cue.end
+
+        if not new_lines:
+            if pending is not None:
+                pending = pending._replace(end=max(pending.end, cue.end))
+            continue
+
+        text = _join_text(new_lines)
+        if pending is not None and growing and text.startswith(pending.text):
+            pending = Cue(pending.start, max(pending.end, cue.end), text)
+            continue
+
+        if pending is not None:
+            yield pending
+        pending = Cue(cue.start, cue.end, text)
+
+    if pending is not None:
+        yield pending
+
+
+def segment_cues(cues: Iterable[Cue], window_seconds: float) -> Iterator[Cue]:
+    """
+    按时间窗口把字幕合并为段落
+
+    Args:
+        cues: 按时间顺序排列的字幕
+        window_seconds: 每段覆盖的时长（秒）
+
+    Yields:
+        时间段，start 为段内第一条字幕的开始时间
+    """
+    parts: List[str] = []
+    start = end = 0.0
+    for cue in cues:
+        if parts and cue.start - start >= window_seconds:
+            yield Cue(start, end, _join_text(parts))
+            parts = []
+        if not parts:
+            start = cue.start
+        parts.append(cue.text)
+        end = max(end, cue.end)
+
+    if parts:
+        yield Cue(start, end, _join_text(parts))
@@ -0,0 +1,385 @@
+"""
+提取文本存储模块
+按内容哈希保存文件解析得到的文本，上传响应只返回哈希，客户端需要原文时再按范围读取；
+另按上传文件的哈希持久化解析结果（zstd压缩），相同文件再次上传时跳过解析
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterable, NamedTuple, Optional
+
+from cachetools import LRUCache, TTLCache
+
+from .file_parser import ParseResult, parser_version_tag
+from .shared_state import SharedState, shared_state
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    logging.warning("zstandard not installed, parsed text stored with zlib")
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 解析结果存储：未设置时保存在本地磁盘目录，memory:// 表示进程内存，file:///路径 指定磁盘目录
+PARSED_STORE_URL = os.environ.get("PARSED_STORE_URL", "")
+# 解析结果存储的总大小上限（MB，按压缩后计），超出后淘汰最久未使用的条目
+PARSED_STORE_MAX_MB = float(os.environ.get("PARSED_STORE_MAX_MB", "1024"))
+
+# 计算上传文件哈希时每次读取的字节数
+_HASH_CHUNK_SIZE = 1024 * 1024
+_ZSTD_LEVEL = 3
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def text_hash(data: bytes) -> str:
+    """计算文本（UTF-8字节）的SHA-256十六进制摘要"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_path: str) -> str:
+    """分块计算磁盘文件的SHA-256十六进制摘要"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ExtractedTextStore:
+    """
+    提取文本存储（按总字节数LRU淘汰，带存活时间）
+
+    默认保存在进程内存中；传入进程间共享的状态后端时改为保存在共享状态中，
+    多工作进程部署下任一进程返回的 text_hash 都能在其他进程读取（只按存活时间过期）。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 3600, state: Optional[SharedState] = None):
+        """
+        Args:
+            max_bytes: 存储的文本总字节数上限，超出后按LRU淘汰（只用于进程内存储）
+            ttl_seconds: 条目的存活时间（秒）
+            state: 进程间共享的状态后端；进程内后端仍使用本进程的内存存储
+        """
+        self._texts = TTLCache(maxsize=max_bytes, ttl=ttl_seconds, getsizeof=len)
+        self._lock = threading.Lock()
+        self._ttl = ttl_seconds
+        self._max_bytes = max_bytes
+        self._state = state if state is not None and state.shared else None
+
+    @classmethod
+    def from_env(cls) -> "ExtractedTextStore":
+        """根据环境变量创建存储实例"""
+        return cls(
+            max_bytes=int(float(os.environ.get("TEXT_STORE_MAX_MB", "256")) * 1024 * 1024),
+            ttl_seconds=float(os.environ.get("TEXT_STORE_TTL", "3600")),
+            state=shared_state,
+        )
+
+    def put(self, text: str) -> str:
+        """
+        保存文本
+
+        Args:
+            text: 提取的文本
+
+        Returns:
+            文本的内容哈希，可用于 GET /texts/{hash}
+        """
+        data = text.encode("utf-8")
+        key = text_hash(data)
+        if self._state is not None:
+            if len(data) <= self._max_bytes:
+                try:
+                    self._state.set("texts", key, text, ttl=self._ttl)
+                except Exception as e:
+                    logger.warning(f"写入共享文本存储失败: {e}")
+            return key
+
+        with self._lock:
+            try:
+                self._texts[key] = data
+            except ValueError:
+                # 单个文本超过存储上限，不保存
+                pass
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取文本
+
+        Args:
+            key: 内容哈希
+
+        Returns:
+            文本的UTF-8字节，不存在或已过期时返回None
+        """
+        if self._state is not None:
+            try:
+                text = self._state.get("texts", key)
+            except Exception as e:
+                logger.warning(f"读取共享文本存储失败: {e}")
+                return None
+            return text.encode("utf-8") if text is not None else None
+
+        with self._lock:
+            return self._texts.get(key)
+
+
+class BlobStore(ABC):
+    """按键保存字节串的存储接口，解析结果存储的后端"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """读取条目，不存在时返回None"""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """写入条目，超过容量上限时可以不保存"""
+
+    @abstractmethod
+    def contains(self, key: str) -> bool:
+        """是否存在该条目"""
+
+
+class InMemoryBlobStore(BlobStore):
+    """进程内存储，按总字节数LRU淘汰"""
+
+    def __init__(self, max_bytes: int):
+        self._blobs = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._blobs.get(key)
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            try:
+                self._blobs[key] = data
+            except ValueError:
+                # 单个条目超过存储上限，不保存
+                pass
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._blobs
+
+
+class DiskBlobStore(BlobStore):
+    """
+    本地磁盘存储，同一台机器上的多个工作进程共享
+
+    每个条目一个文件（按键的前两位分目录），先写临时文件再原子替换；
+    读取时更新修改时间，总大小超出上限时按修改时间淘汰最久未使用的条目。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Args:
+            directory: 存储目录，不存在时创建
+            max_bytes: 存储文件的总字节数上限
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(path) for path in self._iter_files())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _iter_files(self) -> Iterable[str]:
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                for file_entry in os.scandir(entry.path):
+                    if file_entry.is_file() and not file_entry.name.endswith('.tmp'):
+                        yield file_entry.path
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # 覆盖已有条目时，总大小只增加新旧文件的差值
+            try:
+                previous = os.path.getsize(path)
+            except FileNotFoundError:
+                previous = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            self._total_bytes += len(data) - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _evict(self) -> None:
+        """重新统计目录（其他进程也可能写入），删除最久未使用的条目直到低于上限的90%"""
+        files = []
+        for path in self._iter_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        logger.info(f"解析结果存储超出上限，已淘汰 {removed} 个条目")
+
+
+def create_blob_store_from_env() -> BlobStore:
+    """根据 PARSED_STORE_URL 创建解析结果存储后端，未设置时使用临时目录下的磁盘存储"""
+    max_bytes = int(PARSED_STORE_MAX_MB * 1024 * 1024)
+    url = PARSED_STORE_URL
+    if url == "memory://":
+        return InMemoryBlobStore(max_bytes)
+    if url.startswith("file://"):
+        directory = url[len("file://"):]
+    elif url:
+        raise ValueError(f"不支持的解析结果存储: {url}")
+    else:
+        directory = os.path.join(tempfile.gettempdir(), "text2map-parsed")
+
+    try:
+        return DiskBlobStore(directory, max_bytes)
+    except OSError as e:
+        logger.error(f"解析结果磁盘存储初始化失败，改用进程内存储: {e}")
+        return InMemoryBlobStore(max_bytes)
+
+
+class StoredParse(NamedTuple):
+    """已存储的解析结果"""
+    parsed: ParseResult
+    # 原始上传文件的大小
+    file_size: int
+
+
+def _compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+    return zlib.compress(data)
+
+
+def _decompress(data: bytes) -> bytes:
+    if data.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("zstandard库未安装，无法读取zstd压缩的解析结果")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class ParsedTextStore:
+    """
+    上传文件的解析结果存储
+
+    键由上传文件的SHA-256、扩展名（决定解析器）和解析器版本标记共同决定，
+    解析器输出变化后旧结果自然失效。值为一行JSON元数据加压缩后的UTF-8文本。
+    """
+
+    def __init__(self, backend: BlobStore, version_tag: str):
+        """
+        Args:
+            backend: 存储后端
+            version_tag: 解析器版本标记
+        """
+        self.backend = backend
+        self.version_tag = version_tag
+
+    def _key(self, upload_hash: str, filename: str) -> str:
+        extension = os.path.splitext(filename)[1].lower()
+        return hashlib.sha256(f"{upload_hash}\0{extension}\0{self.version_tag}".encode('utf-8')).hexdigest()
+
+    def contains(self, upload_hash: str, filename: str) -> bool:
+        """是否已有该上传文件的解析结果"""
+        return self.backend.contains(self._key(upload_hash, filename))
+
+    def get(self, upload_hash: str, filename: str) -> Optional[StoredParse]:
+        """
+        读取解析结果
+
+        Args:
+            upload_hash: 上传文件的SHA-256十六进制摘要
+            filename: 上传时的文件名（扩展名决定解析器）
+
+        Returns:
+            解析结果与原始文件大小，不存在或无法读取时返回None
+        """
+        data = self.backend.get(self._key(upload_hash, filename))
+        if data is None:
+            return None
+        try:
+            header, _, body = data.partition(b'\n')
+            meta = json.loads(header)
+            text = _decompress(body).decode('utf-8')
+        except (ValueError, zlib.error) as e:
+            logger.warning(f"解析结果存储中的条目无法读取: {e}")
+            return None
+        return StoredParse(ParseResult(text, meta.get("encoding")), meta["file_size"])
+
+    def put(self, upload_hash: str, filename: str, parsed: ParseResult, file_size: int) -> None:
+        """
+        保存解析结果，写入失败只记录日志
+
+        Args:
+            upload_hash: 上传文件的SHA-256十六进制摘要
+            filename: 上传时的文件名
+            parsed: 解析结果
+            file_size: 原始文件大小
+        """
+        header = json.dumps({"encoding": parsed.encoding, "file_size": file_size}).encode('utf-8')
+        data = header + b'\n' + _compress(parsed.text.encode('utf-8'))
+        try:
+            self.backend.put(self._key(upload_hash, filename), data)
+        except OSError as e:
+            logger.warning(f"写入解析结果存储失败: {e}")
+
+
+# 全局存储实例
+text_store = ExtractedTextStore.from_env()
+parsed_text_store = ParsedTextStore(create_blob_store_from_env(), parser_version_tag())
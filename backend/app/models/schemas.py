@@ -4,7 +4,7 @@ API数据模型
 """
 
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 
 class TextInput(BaseModel):
@@ -17,12 +17,42 @@ class MindmapResponse(BaseModel):
     mindmap_data: str
 
 
+class MindmapTreeData(BaseModel):
+    """扁平数组表示的思维导图树（节点按先序排列，顶层节点的父节点为-1）"""
+    nodes: int
+    parent: List[int]
+    depth: List[int]
+    labels: List[str]
+    timestamps: Optional[List[Optional[int]]] = None  # 字幕生成的导图中各节点的起始秒数
+
+
+class MindmapTreeResponse(BaseModel):
+    """思维导图树结构响应模型（format=tree）"""
+    tree: MindmapTreeData
+
+
 class FileUploadResponse(BaseModel):
     """文件上传响应模型"""
     mindmap_data: str
-    extracted_text: str
+    text_hash: str  # 提取文本的内容哈希，可通过 GET /texts/{text_hash} 按范围读取
+    text_length: int
+    filename: str
+    file_size: int
+    upload_hash: Optional[str] = None  # 上传文件的SHA-256，可用于 HEAD /uploads/{upload_hash} 预检查后免上传
+    encoding: Optional[str] = None  # 文本类文件检测到的编码
+    extracted_text: Optional[str] = None  # 仅在 include_text=true 时返回
+
+
+class FileUploadTreeResponse(BaseModel):
+    """文件上传的思维导图树结构响应模型（format=tree）"""
+    tree: MindmapTreeData
+    text_hash: str
+    text_length: int
     filename: str
     file_size: int
+    upload_hash: Optional[str] = None
+    encoding: Optional[str] = None
+    extracted_text: Optional[str] = None
 
 
 class SupportedFormatsResponse(BaseModel):
@@ -34,4 +64,23 @@ class SupportedFormatsResponse(BaseModel):
 class ErrorResponse(BaseModel):
     """错误响应模型"""
     detail: str
-    error_type: str = "validation_error" 
\ No newline at end of file
+    error_type: str = "validation_error"
+
+
+class JobCreatedResponse(BaseModel):
+    """后台任务创建响应模型"""
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    """后台任务状态响应模型"""
+    job_id: str
+    status: str
+    stage: str
+    progress: float
+    result: Optional[str] = None
+    error: Optional[str] = None
+    filename: Optional[str] = None
+    created_at: float
+    updated_at: float
@@ -0,0 +1,98 @@
+"""
+编码检测基准测试
+对比逐个编码尝试完整解码的旧实现与“检测一次、解码一次”的新实现
+
+用法: python benchmarks/bench_encoding.py [--size-mb 8] [--repeat 3]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.encoding import decode_text
+
+
+def legacy_decode(file_bytes: bytes) -> str:
+    """旧实现：按 utf-8、gbk、gb2312、utf-16、latin-1 的顺序逐个完整解码"""
+    for encoding in ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']:
+        try:
+            return file_bytes.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return file_bytes.decode('latin-1', errors='ignore')
+
+
+def build_corpora(size_mb: float) -> dict:
+    """生成若干个约 size_mb 大小的测试语料，返回 {名称: (原文, 字节内容)}"""
+    target = int(size_mb * 1024 * 1024)
+    simplified = "知识架构师将复杂的原始文本转换为结构化的思维导图，保留全部关键概念与细节。\n"
+    traditional = "知識架構師將複雜的原始文本轉換為結構化的思維導圖，保留全部關鍵概念與細節。\n"
+    english = "The quick brown fox jumps over the lazy dog while reading a long transcript.\n"
+
+    def repeat_to(unit: str, encoding: str) -> str:
+        return unit * (target // len(unit.encode(encoding)) + 1)
+
+    corpora = {}
+    for name, unit, encoding in [
+        ("gbk_chinese", simplified, "gbk"),
+        ("utf8_chinese", simplified, "utf-8"),
+        ("big5_chinese", traditional, "big5"),
+        ("utf16le_no_bom", simplified, "utf-16-le"),
+    ]:
+        text = repeat_to(unit, encoding)
+        corpora[name] = (text, text.encode(encoding))
+
+    # 以英文为主、结尾才出现中文的GBK文件：旧实现要先完整尝试一遍UTF-8才失败
+    text = repeat_to(english, "ascii") + simplified
+    corpora["gbk_ascii_prefix"] = (text, text.encode("gbk"))
+
+    # 结尾带一个GBK非法字节的文件：旧实现会完整解码失败多次，最终以错误编码“成功”解码
+    text = repeat_to(simplified, "gbk")
+    corpora["gbk_stray_byte"] = (text + "\ufffd", text.encode("gbk") + b"\x80")
+
+    return corpora
+
+
+def time_call(func, data: bytes, repeat: int) -> float:
+    """返回多次调用中的最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 2)
+
+
+def run(size_mb: float = 8, repeat: int = 3) -> list:
+    """运行基准测试并返回结果列表"""
+    results = []
+    for name, (original, data) in build_corpora(size_mb).items():
+        detected_text, encoding = decode_text(data)
+        results.append({
+            "corpus": name,
+            "size_bytes": len(data),
+            "detected_encoding": encoding,
+            "legacy_correct": legacy_decode(data) == original,
+            "detect_once_correct": detected_text == original,
+            "legacy_ms": time_call(legacy_decode, data, repeat),
+            "detect_once_ms": time_call(decode_text, data, repeat),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编码检测基准测试")
+    parser.add_argument("--size-mb", type=float, default=8, help="每份语料的大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.size_mb, args.repeat), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
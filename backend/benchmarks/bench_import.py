@@ -0,0 +1,92 @@
+"""
+导入耗时基准测试
+在全新的子进程中用 python -X importtime 导入应用模块，统计总耗时、耗时最多的依赖，
+以及启动时不应加载的重型依赖（Gemini SDK、解析库等）是否被提前导入
+
+用法: python benchmarks/bench_import.py [--target main] [--repeat 5] [--top 10]
+      [--output result.json] [--baseline previous.json]
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+from report import emit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动时应保持未导入、首次使用或后台预热时才加载的模块
+LAZY_MODULES = ["google.generativeai", "grpc", "docx", "lxml", "PyPDF2", "srt", "sqlalchemy"]
+
+_PROBE = "import sys, {target}; print(','.join(m for m in {lazy!r} if m in sys.modules))"
+
+
+def import_once(target: str) -> dict:
+    """
+    在子进程中导入 target，返回总耗时、各顶层依赖的累计耗时和已导入的重型依赖
+
+    Args:
+        target: 模块名，例如 main 或 app.api.routes
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(target=target, lazy=LAZY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+
+    cumulative: Dict[str, int] = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue
+        # 顶层导入（没有缩进）的累计耗时之和即为总导入耗时
+        if not name.startswith("  "):
+            total_us += int(cumulative_us)
+        cumulative[name.strip()] = max(cumulative.get(name.strip(), 0), int(cumulative_us))
+
+    return {
+        "total_ms": total_us / 1000,
+        "cumulative_us": cumulative,
+        "loaded_lazy_modules": [m for m in completed.stdout.strip().split(",") if m],
+    }
+
+
+def run(targets: List[str], repeat: int = 5, top: int = 10) -> list:
+    """运行基准测试并返回结果列表"""
+    results = []
+    for target in targets:
+        runs = [import_once(target) for _ in range(repeat)]
+        totals = [r["total_ms"] for r in runs]
+        dependencies = {name: us for name, us in runs[-1]["cumulative_us"].items() if name != target}
+        slowest = sorted(dependencies.items(), key=lambda item: item[1], reverse=True)[:top]
+        results.append({
+            "target": target,
+            "best_ms": round(min(totals), 1),
+            "median_ms": round(statistics.median(totals), 1),
+            "slowest_modules_ms": {name: round(us / 1000, 1) for name, us in slowest},
+            "loaded_lazy_modules": runs[-1]["loaded_lazy_modules"],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时基准测试")
+    parser.add_argument("--target", action="append", help="要导入的模块，可重复（默认 main 与 app.api.routes）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块导入的次数，取最短耗时")
+    parser.add_argument("--top", type=int, default=10, help="列出累计耗时最多的模块数")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    args = parser.parse_args()
+
+    results = run(args.target or ["main", "app.api.routes"], args.repeat, args.top)
+    emit("import", results, args.output, args.baseline, key="target", metric="best_ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+文件解析基准测试
+对合成语料逐一调用 parse_*_content，测量吞吐量和Python堆内存峰值
+
+用法: python benchmarks/bench_parsers.py [--size-mb 8] [--pdf-pages 500] [--docx-rows 2000]
+      [--srt-minutes 60] [--repeat 3] [--output result.json] [--baseline previous.json]
+
+注意：内存峰值由 tracemalloc 统计，只包含当前进程的Python分配；
+PDF页数达到 PDF_PARALLEL_PAGE_THRESHOLD 时子进程中的内存不计入。
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.file_parser import (
+    parse_txt_content,
+    parse_md_content,
+    parse_docx_content,
+    parse_pdf_content,
+    parse_srt_content,
+)
+
+from corpora import build_all
+from report import emit
+
+PARSERS = {
+    ".txt": parse_txt_content,
+    ".md": parse_md_content,
+    ".docx": parse_docx_content,
+    ".pdf": parse_pdf_content,
+    ".srt": parse_srt_content,
+}
+
+
+def measure(func, data: bytes, repeat: int) -> dict:
+    """返回最短耗时、吞吐量和内存峰值"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(data)
+        best = min(best, time.perf_counter() - start)
+
+    # 单独跑一次统计内存，避免 tracemalloc 的开销影响计时
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "best_ms": round(best * 1000, 2),
+        "throughput_mb_s": round(len(data) / 1024 / 1024 / best, 2) if best > 0 else None,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+        "output_chars": len(text),
+    }
+
+
+def run(size_mb: float = 8, pdf_pages: int = 500, docx_rows: int = 2000,
+        srt_minutes: int = 60, repeat: int = 3) -> list:
+    """运行基准测试并返回结果列表"""
+    results = []
+    for name, (filename, data) in build_all(size_mb, pdf_pages, docx_rows, srt_minutes).items():
+        func = PARSERS[os.path.splitext(filename)[1]]
+        result = {"corpus": name, "parser": func.__name__, "size_bytes": len(data)}
+        result.update(measure(func, data, repeat))
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件解析基准测试")
+    parser.add_argument("--size-mb", type=float, default=8, help="TXT/MD 语料大小（MB）")
+    parser.add_argument("--pdf-pages", type=int, default=500, help="PDF页数")
+    parser.add_argument("--docx-rows", type=int, default=2000, help="DOCX表格行数")
+    parser.add_argument("--srt-minutes", type=int, default=60, help="SRT字幕时长（分钟）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    args = parser.parse_args()
+
+    results = run(args.size_mb, args.pdf_pages, args.docx_rows, args.srt_minutes, args.repeat)
+    emit("parsers", results, args.output, args.baseline, key="corpus", metric="best_ms")
+
+
+if __name__ == "__main__":
+    main()
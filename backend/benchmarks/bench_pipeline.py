@@ -0,0 +1,189 @@
+"""
+端到端基准测试
+启动本地 Gemini 模拟服务和后端服务，以指定并发驱动 /generate 与 /generate-from-file，
+统计吞吐量、延迟分位数、状态码分布和 Server-Timing 各阶段平均耗时
+
+用法: python benchmarks/bench_pipeline.py [--target main|router] [--concurrency 16] [--requests 200]
+      [--latency-ms 800] [--file-kb 256] [--same-text] [--output result.json] [--baseline previous.json]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import httpx
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 添加项目根目录到Python路径
+sys.path.append(BACKEND_DIR)
+
+from fake_gemini import FakeGeminiServer
+from corpora import SIMPLIFIED
+from report import emit
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _configure_environment(endpoint: str) -> None:
+    """在导入后端模块之前设置环境变量，使 Gemini 客户端指向模拟服务"""
+    os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+    os.environ["GEMINI_API_ENDPOINT"] = endpoint
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ.setdefault("GEMINI_HEALTHCHECK_INTERVAL", "0")
+    # 默认不在客户端限流，测量的是服务本身的上限
+    os.environ.setdefault("GEMINI_RPM", "0")
+    os.environ.setdefault("GEMINI_TPM", "0")
+
+
+def _load_app(target: str):
+    if target == "main":
+        import main
+        return main.app
+
+    from fastapi import FastAPI
+    from app.api.routes import router
+    from app.core.metrics import ServerTimingMiddleware
+
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+    app.include_router(router)
+    return app
+
+
+class BackendServer:
+    """在后台线程中运行后端服务"""
+
+    def __init__(self, app, port: int):
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self) -> "BackendServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def _parse_server_timing(header: str) -> Dict[str, float]:
+    timings: Dict[str, float] = defaultdict(float)
+    for part in filter(None, (p.strip() for p in header.split(","))):
+        fields = part.split(";")
+        for field in fields[1:]:
+            if field.startswith("dur="):
+                timings[fields[0]] += float(field[4:])
+    return timings
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+async def drive(base_url: str, endpoint: str, requests: int, concurrency: int,
+                file_kb: int, same_text: bool) -> dict:
+    """以固定并发发送请求并汇总结果"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    stage_totals: Dict[str, float] = defaultdict(float)
+    unit = SIMPLIFIED.encode("utf-8")
+    file_body = unit * (file_kb * 1024 // len(unit) + 1)
+
+    async def one(client: httpx.AsyncClient, index: int) -> None:
+        # 默认每个请求内容不同，避免命中缓存和请求合并
+        suffix = "" if same_text else f"\n请求编号 {index}"
+        async with semaphore:
+            start = time.perf_counter()
+            if endpoint == "/generate":
+                response = await client.post(endpoint, json={"text": SIMPLIFIED * 20 + suffix})
+            else:
+                files = {"file": ("bench.txt", file_body + suffix.encode("utf-8"), "text/plain")}
+                response = await client.post(endpoint, files=files)
+            latencies.append((time.perf_counter() - start) * 1000)
+        statuses[response.status_code] += 1
+        for stage, duration in _parse_server_timing(response.headers.get("server-timing", "")).items():
+            stage_totals[stage] += duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "server_timing_avg_ms": {stage: round(total / requests, 1) for stage, total in sorted(stage_totals.items())},
+    }
+
+
+def run(target: str = "main", concurrency: int = 16, requests: int = 200, latency_ms: float = 800,
+        file_kb: int = 256, same_text: bool = False) -> list:
+    """运行基准测试并返回结果列表"""
+    fake = FakeGeminiServer(_free_port(), latency_ms=latency_ms).start()
+    _configure_environment(fake.endpoint)
+    backend = BackendServer(_load_app(target), _free_port()).start()
+
+    results = []
+    try:
+        for endpoint in ("/generate", "/generate-from-file"):
+            calls_before = fake.calls
+            result = asyncio.run(drive(
+                f"http://127.0.0.1:{backend.port}", endpoint, requests, concurrency, file_kb, same_text
+            ))
+            result["target"] = target
+            result["upstream_calls"] = fake.calls - calls_before
+            results.append(result)
+    finally:
+        backend.stop()
+        fake.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试")
+    parser.add_argument("--target", choices=["main", "router"], default="main",
+                        help="main: main.py 中的应用；router: app/api/routes.py 中的路由")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=200, help="每个接口的请求总数")
+    parser.add_argument("--latency-ms", type=float, default=800, help="模拟 Gemini 的响应延迟")
+    parser.add_argument("--file-kb", type=int, default=256, help="上传文件大小（KB）")
+    parser.add_argument("--same-text", action="store_true", help="所有请求使用相同内容（测试缓存与请求合并）")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    args = parser.parse_args()
+
+    # 客户端请求日志会淹没报告输出
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = run(args.target, args.concurrency, args.requests, args.latency_ms, args.file_kb, args.same_text)
+    emit("pipeline", results, args.output, args.baseline, key="endpoint", metric="p50_ms")
+
+
+if __name__ == "__main__":
+    main()
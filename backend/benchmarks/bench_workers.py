@@ -0,0 +1,160 @@
+"""
+多工作进程扩展性基准测试
+分别以 1、2、4 … 个工作进程启动 serve.py（SQLite共享状态），以固定并发上传PDF请求 /generate-from-file，
+统计解析吞吐量及相对单进程的加速比与扩展效率。关闭解析结果存储，每个请求都重新解析；
+模拟 Gemini 延迟很小，吞吐量主要取决于解析这一CPU密集阶段
+
+用法: python benchmarks/bench_workers.py [--workers 1,2,4] [--concurrency 16] [--requests 64]
+      [--pdf-pages 40] [--output result.json] [--baseline previous.json]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import List
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 添加项目根目录到Python路径
+sys.path.append(BACKEND_DIR)
+
+from fake_gemini import FakeGeminiServer
+from corpora import make_pdf
+from report import emit
+from bench_pipeline import _configure_environment, _free_port, _percentile
+
+
+def start_server(workers: int, port: int, state_path: str) -> subprocess.Popen:
+    """以子进程启动 serve.py 并等待所有工作进程就绪"""
+    env = dict(os.environ)
+    env.update({
+        "SHARED_STATE_URL": f"sqlite:///{state_path}",
+        # 不保存解析结果，测量的是每次都重新解析的吞吐量
+        "PARSED_STORE_URL": "memory://",
+        "PARSED_STORE_MAX_MB": "0",
+        # 关闭PDF页级并行，每个请求只在接收它的工作进程中解析，扩展只来自工作进程数
+        "PDF_PARALLEL_PAGE_THRESHOLD": "0",
+    })
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "serve.py"),
+         "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+    deadline = time.monotonic() + 60
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+        while time.monotonic() < deadline:
+            try:
+                if client.get("/").status_code == 200:
+                    # 端口由多个工作进程共享，再等一会儿让其余进程也完成启动
+                    time.sleep(1.0 + 0.5 * workers)
+                    return process
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{workers} 个工作进程的后端服务未能启动")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def drive(base_url: str, pdf: bytes, requests: int, concurrency: int) -> dict:
+    """以固定并发上传PDF并汇总结果"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one(client: httpx.AsyncClient) -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/generate-from-file", files={"file": ("bench.pdf", pdf, "application/pdf")})
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            failures += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        # 预热：各工作进程首次解析时才导入PDF库
+        await asyncio.gather(*(one(client) for _ in range(concurrency)))
+        latencies.clear()
+        failures = 0
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+    }
+
+
+def run(worker_counts: List[int], concurrency: int = 16, requests: int = 64, pdf_pages: int = 40) -> list:
+    """依次以各工作进程数运行基准测试并返回结果列表"""
+    fake = FakeGeminiServer(_free_port(), latency_ms=5, ttft_ms=1).start()
+    _configure_environment(fake.endpoint)
+    os.environ["STARTUP_PRELOAD"] = "0"
+    pdf = make_pdf(pdf_pages)
+
+    results = []
+    try:
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory() as directory:
+                port = _free_port()
+                process = start_server(workers, port, os.path.join(directory, "state.db"))
+                try:
+                    result = asyncio.run(drive(f"http://127.0.0.1:{port}", pdf, requests, concurrency))
+                finally:
+                    stop_server(process)
+            result["workers"] = workers
+            results.append(result)
+    finally:
+        fake.stop()
+
+    base = results[0]["throughput_rps"] / results[0]["workers"]
+    for result in results:
+        speedup = result["throughput_rps"] / results[0]["throughput_rps"]
+        result["speedup"] = round(speedup, 2)
+        result["scaling_efficiency"] = round(result["throughput_rps"] / (base * result["workers"]), 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多工作进程扩展性基准测试")
+    parser.add_argument("--workers", default="1,2,4", help="逗号分隔的工作进程数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=64, help="每种进程数下的请求总数")
+    parser.add_argument("--pdf-pages", type=int, default=40, help="上传PDF的页数")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    args = parser.parse_args()
+
+    # 客户端请求日志会淹没报告输出
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    worker_counts = [int(value) for value in args.workers.split(",")]
+    results = run(worker_counts, args.concurrency, args.requests, args.pdf_pages)
+    emit("workers", results, args.output, args.baseline, key="workers", metric="throughput_rps")
+    print(f"CPU核数: {os.cpu_count()}（工作进程数超过核数后吞吐量不再增长）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
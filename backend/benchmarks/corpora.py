@@ -0,0 +1,194 @@
+"""
+基准测试语料生成
+生成多MB的多编码TXT、数百页PDF、大表格DOCX和一小时长度的SRT，全部在内存中构造，不写入当前目录
+"""
+
+import io
+from datetime import timedelta
+from typing import Dict, Tuple
+
+SIMPLIFIED = "知识架构师将复杂的原始文本转换为结构化的思维导图，保留全部关键概念与细节。\n"
+TRADITIONAL = "知識架構師將複雜的原始文本轉換為結構化的思維導圖，保留全部關鍵概念與細節。\n"
+ENGLISH = "The quick brown fox jumps over the lazy dog while reading a long transcript.\n"
+
+
+def _repeat_to(unit: str, encoding: str, size_bytes: int) -> str:
+    return unit * (size_bytes // len(unit.encode(encoding)) + 1)
+
+
+def make_txt_corpora(size_mb: float) -> Dict[str, Tuple[str, bytes]]:
+    """多种编码的TXT语料，返回 {名称: (文件名, 字节内容)}"""
+    size_bytes = int(size_mb * 1024 * 1024)
+    corpora = {}
+    for name, unit, encoding in [
+        ("txt_utf8", SIMPLIFIED, "utf-8"),
+        ("txt_gbk", SIMPLIFIED, "gbk"),
+        ("txt_big5", TRADITIONAL, "big5"),
+        ("txt_utf16", SIMPLIFIED, "utf-16"),
+        ("txt_ascii", ENGLISH, "ascii"),
+    ]:
+        corpora[name] = ("corpus.txt", _repeat_to(unit, encoding, size_bytes).encode(encoding))
+    return corpora
+
+
+def make_markdown(size_mb: float) -> bytes:
+    """按章节组织的Markdown语料"""
+    size_bytes = int(size_mb * 1024 * 1024)
+    body = SIMPLIFIED * 20
+    parts = []
+    total = 0
+    index = 0
+    while total < size_bytes:
+        index += 1
+        chunk = f"## 第{index}节\n\n{body}\n".encode("utf-8")
+        parts.append(chunk)
+        total += len(chunk)
+    return b"# " + "测试文档".encode("utf-8") + b"\n\n" + b"".join(parts)
+
+
+def make_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """生成包含文本内容的多页PDF（只使用标准字体，不依赖第三方写入库）"""
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")
+    kids = []
+    for page in range(pages):
+        lines = " ".join(
+            f"(Page {page + 1} line {line} lorem ipsum dolor sit amet consectetur) '"
+            for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 50 780 Td 12 TL {lines} ET".encode("ascii")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), pages
+    )
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+    return bytes(out)
+
+
+def _fill_table(table) -> None:
+    """按行列号填充单元格；直接访问 w:tc 元素，row.cells 每次都会重新计算整张表的网格"""
+    from docx.table import _Cell
+
+    for row_index, tr in enumerate(table._tbl.tr_lst):
+        for col_index, tc in enumerate(tr.tc_lst):
+            _Cell(tc, table).text = f"R{row_index}C{col_index} 数据项"
+
+
+def make_docx(paragraphs: int, table_rows: int, table_cols: int = 6) -> bytes:
+    """生成包含大量段落和一个大表格的DOCX"""
+    from docx import Document
+
+    document = Document()
+    document.add_heading("测试文档", level=1)
+    for index in range(paragraphs):
+        document.add_paragraph(f"第{index + 1}段：" + SIMPLIFIED.strip())
+
+    table = document.add_table(rows=table_rows, cols=table_cols)
+    _fill_table(table)
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_merged_docx(table_rows: int, table_cols: int = 6) -> bytes:
+    """
+    生成带合并单元格的大表格DOCX：首列每两行纵向合并，第2、3列横向合并
+
+    直接写入 vMerge/gridSpan，python-docx 的 merge() 在大表格上构造太慢
+    """
+    from docx import Document
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    document = Document()
+    document.add_paragraph("合并单元格表格")
+    table = document.add_table(rows=table_rows, cols=table_cols)
+    _fill_table(table)
+
+    for row_index, tr in enumerate(table._tbl.tr_lst):
+        cells = tr.tc_lst
+        # 纵向合并：延续单元格为空，内容只在起始单元格中
+        v_merge = OxmlElement("w:vMerge")
+        if row_index % 2 == 0:
+            v_merge.set(qn("w:val"), "restart")
+        else:
+            cells[0].remove(cells[0].p_lst[0])
+            cells[0].append(OxmlElement("w:p"))
+        cells[0].get_or_add_tcPr().append(v_merge)
+        if table_cols >= 3:
+            grid_span = OxmlElement("w:gridSpan")
+            grid_span.set(qn("w:val"), "2")
+            cells[1].get_or_add_tcPr().append(grid_span)
+            tr.remove(cells[2])
+    document.add_paragraph("表格之后的段落")
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_srt(duration_minutes: int = 60, caption_seconds: float = 2.5) -> bytes:
+    """生成指定时长的SRT字幕"""
+    lines = []
+    count = int(duration_minutes * 60 / caption_seconds)
+    for index in range(count):
+        start = timedelta(seconds=index * caption_seconds)
+        end = timedelta(seconds=(index + 1) * caption_seconds - 0.1)
+        lines.append(f"{index + 1}\n{_srt_time(start)} --> {_srt_time(end)}\n第{index + 1}句字幕：{SIMPLIFIED.strip()}\n")
+    return "\n".join(lines).encode("utf-8")
+
+
+def make_rolling_srt(duration_minutes: int = 60, caption_seconds: float = 2.5) -> bytes:
+    """生成自动字幕式的滚动SRT：每条字幕先重复上一条的最后一行，再给出新的一行"""
+    lines = []
+    previous = ""
+    count = int(duration_minutes * 60 / caption_seconds)
+    for index in range(count):
+        start = timedelta(seconds=index * caption_seconds)
+        end = timedelta(seconds=(index + 1) * caption_seconds - 0.1)
+        line = f"第{index + 1}句字幕：{SIMPLIFIED.strip()[:40]}"
+        text = f"{previous}\n{line}" if previous else line
+        lines.append(f"{index + 1}\n{_srt_time(start)} --> {_srt_time(end)}\n{text}\n")
+        previous = line
+    return "\n".join(lines).encode("utf-8")
+
+
+def _srt_time(value: timedelta) -> str:
+    total_ms = int(value.total_seconds() * 1000)
+    hours, rest = divmod(total_ms, 3600 * 1000)
+    minutes, rest = divmod(rest, 60 * 1000)
+    seconds, millis = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+
+
+def build_all(size_mb: float = 8, pdf_pages: int = 500, docx_rows: int = 2000, srt_minutes: int = 60) -> Dict[str, Tuple[str, bytes]]:
+    """生成全部语料，返回 {名称: (文件名, 字节内容)}"""
+    corpora = make_txt_corpora(size_mb)
+    corpora["md_sections"] = ("corpus.md", make_markdown(size_mb))
+    corpora["pdf_pages"] = ("corpus.pdf", make_pdf(pdf_pages))
+    corpora["docx_table"] = ("corpus.docx", make_docx(paragraphs=docx_rows // 2, table_rows=docx_rows))
+    corpora["srt_hour"] = ("corpus.srt", make_srt(srt_minutes))
+    corpora["srt_rolling_hour"] = ("corpus_rolling.srt", make_rolling_srt(srt_minutes))
+    return corpora
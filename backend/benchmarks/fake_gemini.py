@@ -0,0 +1,145 @@
+"""
+本地 Gemini 模拟服务
+实现 REST 版 generateContent / streamGenerateContent / countTokens，按可配置的延迟返回固定的思维导图，
+配合 GEMINI_API_ENDPOINT=http://127.0.0.1:<端口> 与 GEMINI_TRANSPORT=rest 使用
+
+用法: python benchmarks/fake_gemini.py [--port 8765] [--latency-ms 800] [--ttft-ms 200] [--chunks 8]
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import threading
+from typing import AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_MINDMAP = """# 模拟思维导图
+## 第一部分
+- 要点一
+- 要点二
+## 第二部分
+- 要点三
+"""
+
+
+def _response_body(text: str, prompt_chars: int) -> dict:
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_chars // 4,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": (prompt_chars + len(text)) // 4,
+        },
+    }
+
+
+def _prompt_chars(payload: dict) -> int:
+    return sum(
+        len(part.get("text", ""))
+        for content in payload.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def create_app(latency_ms: float = 800, ttft_ms: float = 200, chunks: int = 8) -> FastAPI:
+    """
+    创建模拟服务
+
+    Args:
+        latency_ms: 非流式调用的响应延迟，以及流式调用的总耗时
+        ttft_ms: 流式调用首个片段的延迟
+        chunks: 流式调用拆分的片段数
+    """
+    app = FastAPI(title="Fake Gemini")
+    app.state.calls = 0
+
+    @app.post("/v1beta/models/{model_and_method}")
+    async def generate(model_and_method: str, request: Request):
+        payload = await request.json()
+        app.state.calls += 1
+        prompt_chars = _prompt_chars(payload)
+
+        if model_and_method.endswith(":countTokens"):
+            return JSONResponse({"totalTokens": prompt_chars // 4})
+
+        if model_and_method.endswith(":generateContent"):
+            await asyncio.sleep(latency_ms / 1000)
+            return JSONResponse(_response_body(FAKE_MINDMAP, prompt_chars))
+
+        if model_and_method.endswith(":streamGenerateContent"):
+            return StreamingResponse(
+                _stream(prompt_chars, ttft_ms, latency_ms, chunks),
+                media_type="application/json",
+            )
+
+        return JSONResponse({"error": {"code": 404, "message": "unknown method"}}, status_code=404)
+
+    return app
+
+
+async def _stream(prompt_chars: int, ttft_ms: float, latency_ms: float, chunks: int) -> AsyncIterator[bytes]:
+    """按 REST 流式接口的格式输出 JSON 数组，每个元素为一个片段"""
+    step = max(1, len(FAKE_MINDMAP) // chunks)
+    pieces = [FAKE_MINDMAP[i:i + step] for i in range(0, len(FAKE_MINDMAP), step)]
+    interval = max(0.0, latency_ms - ttft_ms) / 1000 / max(1, len(pieces) - 1)
+
+    await asyncio.sleep(ttft_ms / 1000)
+    yield b"["
+    for index, piece in enumerate(pieces):
+        if index:
+            await asyncio.sleep(interval)
+            yield b","
+        yield json.dumps(_response_body(piece, prompt_chars), ensure_ascii=False).encode("utf-8")
+    yield b"]"
+
+
+class FakeGeminiServer:
+    """在后台线程中运行的模拟服务，供基准测试脚本启动和关闭"""
+
+    def __init__(self, port: int, latency_ms: float = 800, ttft_ms: float = 200, chunks: int = 8):
+        self.app = create_app(latency_ms, ttft_ms, chunks)
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def calls(self) -> int:
+        """收到的调用次数"""
+        return self.app.state.calls
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Gemini 模拟服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800, help="非流式调用延迟 / 流式调用总耗时")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="流式调用首个片段延迟")
+    parser.add_argument("--chunks", type=int, default=8, help="流式调用片段数")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency_ms, args.ttft_ms, args.chunks), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+基准测试报告
+统一的JSON输出格式：运行环境、提交号与结果列表；可与之前保存的报告比较
+"""
+
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+def environment_info() -> Dict[str, object]:
+    """记录运行环境，便于比较不同提交的结果"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results: List[dict], baseline_path: str, key: str, metric: str) -> List[dict]:
+    """
+    与基线报告比较，返回每项结果的指标变化
+
+    Args:
+        results: 本次结果列表
+        baseline_path: 之前保存的报告路径
+        key: 用于匹配结果项的字段（例如 corpus）
+        metric: 比较的指标字段（例如 best_ms）
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {item[key]: item for item in json.load(f)["results"]}
+
+    changes = []
+    for item in results:
+        previous = baseline.get(item[key])
+        if previous is None or not previous.get(metric) or item.get(metric) is None:
+            continue
+        changes.append({
+            key: item[key],
+            "metric": metric,
+            "baseline": previous[metric],
+            "current": item[metric],
+            "change_pct": round((item[metric] - previous[metric]) / previous[metric] * 100, 1),
+        })
+    return changes
+
+
+def emit(name: str, results: List[dict], output: Optional[str] = None,
+         baseline: Optional[str] = None, key: str = "", metric: str = "") -> dict:
+    """输出报告到标准输出，并可写入文件、附带与基线的比较"""
+    report = {"benchmark": name, "environment": environment_info(), "results": results}
+    if baseline:
+        report["comparison"] = compare(results, baseline, key, metric)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    sys.stdout.write(text + "\n")
+    return report
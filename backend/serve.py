@@ -0,0 +1,104 @@
+"""
+Text2Map Backend - 生产环境多进程启动入口
+以 uvicorn 进程管理器启动多个工作进程（默认与CPU核数相同），启用 uvloop 与 httptools；
+多进程部署时缓存、限流令牌桶、任务状态与提取文本通过 SHARED_STATE_URL 指定的共享状态在进程之间共享，
+Prometheus 指标通过 PROMETHEUS_MULTIPROC_DIR 目录汇总
+
+用法: python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+"""
+
+import os
+import glob
+import logging
+import argparse
+import tempfile
+from typing import Optional
+
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    """工作进程数：WEB_CONCURRENCY，未设置时与CPU核数相同"""
+    return int(os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+def configure_environment(workers: int) -> None:
+    """
+    在启动工作进程之前设置默认环境变量（工作进程继承）
+
+    多进程时未指定 SHARED_STATE_URL 则使用临时目录下的SQLite共享状态；
+    指标写入 PROMETHEUS_MULTIPROC_DIR（未指定时新建临时目录，已指定时清除上次运行留下的文件），
+    /metrics 汇总所有工作进程；各工作进程的解析进程池按核数平分，避免进程数成倍超过核数。
+    """
+    if workers <= 1:
+        return
+
+    if not os.environ.get("SHARED_STATE_URL"):
+        path = os.path.join(tempfile.gettempdir(), "text2map-shared-state.db")
+        os.environ["SHARED_STATE_URL"] = f"sqlite:///{path}"
+        logger.info(f"未设置 SHARED_STATE_URL，{workers} 个工作进程使用SQLite共享状态: {path}")
+
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.unlink(path)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="text2map-metrics-")
+
+    per_worker = str(max(1, (os.cpu_count() or 1) // workers))
+    os.environ.setdefault("PDF_PARALLEL_WORKERS", per_worker)
+    os.environ.setdefault("BATCH_PARSE_WORKERS", per_worker)
+
+
+def check_environment(workers: int) -> Optional[str]:
+    """
+    检查多进程部署的存储配置：任务状态与提取文本保存在进程内时，
+    一个工作进程返回的任务ID或 text_hash 在其他进程查不到
+
+    Returns:
+        配置无效时的错误信息，否则为None
+    """
+    if workers <= 1:
+        return None
+    shared_url = os.environ.get("SHARED_STATE_URL", "")
+    if shared_url in ("", "memory://"):
+        return (f"{workers} 个工作进程不能使用进程内共享状态（SHARED_STATE_URL={shared_url or '未设置'}），"
+                "任务状态与提取文本无法在进程之间共享；请设置 sqlite:///路径 或 postgresql://...")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以多个工作进程启动后端服务")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="工作进程数（默认CPU核数）")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"), help="监听地址")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")), help="监听端口")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"), help="uvicorn 日志级别")
+    args = parser.parse_args()
+
+    configure_environment(args.workers)
+    error = check_environment(args.workers)
+    if error:
+        parser.error(error)
+    logger.info(f"启动后端服务: {args.host}:{args.port}，工作进程数: {args.workers}")
+    uvicorn.run(
+        "main:app",
+        app_dir=BACKEND_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
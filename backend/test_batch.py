@@ -0,0 +1,149 @@
+"""
+批量生成测试脚本
+用于验证ZIP展开与批量接口的 NDJSON 输出
+"""
+
+import io
+import os
+import sys
+import json
+import zipfile
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.batch import router
+from app.core import batch
+from app.core.batch import expand_archive, remove_files
+
+
+def _write_zip(entries: dict) -> str:
+    tmp_file = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
+    with zipfile.ZipFile(tmp_file, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    tmp_file.close()
+    return tmp_file.name
+
+
+def test_expand_archive():
+    """测试展开ZIP时跳过目录与隐藏文件，并在解压前检查文件数限制"""
+    print("=== 测试ZIP展开 ===")
+
+    archive_path = _write_zip({
+        "week1/lecture.srt": "1\n00:00:01,000 --> 00:00:02,000\n字幕\n",
+        "week1/notes.txt": "笔记",
+        "__MACOSX/week1/._notes.txt": b"\x00",
+        "week1/.DS_Store": b"\x00",
+    })
+    try:
+        items = expand_archive(archive_path)
+        try:
+            assert [(item.index, item.filename) for item in items] == [(0, "week1/lecture.srt"), (1, "week1/notes.txt")]
+            with open(items[1].path, encoding="utf-8") as f:
+                assert f.read() == "笔记"
+        finally:
+            remove_files(item.path for item in items)
+
+        original_limit = batch.BATCH_MAX_FILES
+        batch.BATCH_MAX_FILES = 1
+        try:
+            expand_archive(archive_path)
+            assert False, "文件数超过限制时应该抛出异常"
+        except ValueError as e:
+            print(f"✅ 正确抛出异常: {e}")
+        finally:
+            batch.BATCH_MAX_FILES = original_limit
+    finally:
+        os.unlink(archive_path)
+    print("✅ ZIP展开测试通过")
+    print()
+
+
+def test_batch_endpoint_reports_each_file():
+    """测试批量接口逐行返回每个文件的结果，单个文件失败不影响批次"""
+    print("=== 测试批量接口 ===")
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("scan.pdf", b"\x89PNG\r\n\x1a\n\x00\x00")
+    files = [
+        ("files", ("empty.txt", b"   ")),
+        ("files", ("data.xyz", b"unknown")),
+        ("files", ("course.zip", archive.getvalue())),
+    ]
+
+    response = client.post("/generate/batch", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {line["filename"]: line for line in lines if line["event"] == "file"}
+    assert sorted(result["index"] for result in results.values()) == [0, 1, 2]
+    assert all(result["status"] == "error" and result["status_code"] == 400 for result in results.values())
+    assert "不支持的文件格式" in results["data.xyz"]["error"]
+    assert "PDF" in results["scan.pdf"]["error"]
+    assert lines[-1] == {"event": "done", "files": 3, "succeeded": 0, "failed": 3}
+
+    response = client.post("/generate/batch", files=[("files", ("broken.zip", b"not a zip"))])
+    assert response.status_code == 400
+    print("✅ 批量接口测试通过")
+    print()
+
+
+def test_batch_continues_after_unexpected_error():
+    """测试解析器抛出非预期异常时，该文件返回错误行，其余文件照常处理"""
+    print("=== 测试批量接口未知错误 ===")
+
+    original = batch.batch_pipeline
+    parse = dict(original.stages)["parse"]
+
+    async def raising_parse(ctx):
+        if ctx.filename == "crash.txt":
+            raise RuntimeError("解析器崩溃")
+        await parse(ctx)
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    batch.batch_pipeline = original.with_stage("parse", raising_parse)
+    try:
+        files = [("files", ("crash.txt", b"a")), ("files", ("other.txt", b"   "))]
+        response = client.post("/generate/batch", files=files)
+    finally:
+        batch.batch_pipeline = original
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {line["filename"]: line for line in lines if line["event"] == "file"}
+    assert results["crash.txt"]["status"] == "error" and results["crash.txt"]["status_code"] == 500
+    assert results["other.txt"]["status_code"] == 400
+    assert lines[-1] == {"event": "done", "files": 2, "succeeded": 0, "failed": 2}
+    print("✅ 批量接口未知错误测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始批量生成测试")
+    print("=" * 50)
+
+    test_expand_archive()
+    test_batch_endpoint_reports_each_file()
+    test_batch_continues_after_unexpected_error()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
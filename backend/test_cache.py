@@ -0,0 +1,82 @@
+"""
+思维导图缓存测试脚本
+用于验证缓存键规范化、LRU/TTL淘汰以及磁盘层持久化
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.cache import MindmapCache, build_cache_key
+
+
+def test_cache_key_normalization():
+    """测试换行符与行尾空白不影响缓存键"""
+    print("=== 测试缓存键规范化 ===")
+
+    key_a = build_cache_key("标题\r\n内容  \r\n", "v1", "model")
+    key_b = build_cache_key("标题\n内容\n", "v1", "model")
+    key_c = build_cache_key("标题\n内容\n", "v2", "model")
+
+    assert key_a == key_b
+    assert key_a != key_c
+    print("✅ 缓存键规范化测试通过")
+    print()
+
+
+def test_memory_lru_and_ttl():
+    """测试内存层的LRU与TTL淘汰"""
+    print("=== 测试内存层淘汰 ===")
+
+    cache = MindmapCache(max_size=2, ttl_seconds=0.2)
+    cache.set("a", "# A")
+    cache.set("b", "# B")
+    cache.get("a")
+    cache.set("c", "# C")
+
+    assert cache.get("a") == "# A"
+    assert cache.get("b") is None
+
+    time.sleep(0.3)
+    assert cache.get("a") is None
+    print("✅ 内存层淘汰测试通过")
+    print()
+
+
+def test_disk_persistence():
+    """测试磁盘层在重建实例后仍然可用"""
+    print("=== 测试磁盘层持久化 ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "cache.db")
+
+        cache = MindmapCache(disk_path=db_path)
+        cache.set("key", "# 思维导图")
+
+        restarted = MindmapCache(disk_path=db_path)
+        assert restarted.get("key") == "# 思维导图"
+        assert restarted.hits == 1
+
+        expired = MindmapCache(disk_path=db_path, disk_ttl_seconds=1e-6)
+        assert expired.get("key") is None
+    print("✅ 磁盘层持久化测试通过")
+    print()
+
+
+def main():
+    """运行所有测试"""
+    print("开始缓存测试...\n")
+
+    test_cache_key_normalization()
+    test_memory_lru_and_ttl()
+    test_disk_persistence()
+
+    print("所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
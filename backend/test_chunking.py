@@ -0,0 +1,101 @@
+"""
+文本分块测试脚本
+用于验证按结构边界切分长文本的功能
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.chunking import estimate_tokens, split_into_chunks, split_into_groups, split_into_sections
+
+
+def test_short_text_single_chunk():
+    """测试未超出预算的文本不切分"""
+    print("=== 测试短文本 ===")
+
+    chunks = split_into_chunks("# 标题\n\n一段简短的内容。", 1000)
+    assert chunks == ["# 标题\n\n一段简短的内容。"]
+    print("✅ 短文本测试通过")
+    print()
+
+
+def test_split_on_headings():
+    """测试优先在标题处切分，且每块不超出预算"""
+    print("=== 测试按标题切分 ===")
+
+    sections = [f"# 第{i}章\n" + "这是正文内容。" * 20 for i in range(5)]
+    text = "\n".join(sections)
+    chunks = split_into_chunks(text, 200)
+
+    assert chunks == sections
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    print(f"切分为 {len(chunks)} 块")
+    print("✅ 按标题切分测试通过")
+    print()
+
+
+def test_hard_split_without_boundaries():
+    """测试没有结构边界时按预算硬切且不丢失内容"""
+    print("=== 测试硬切分 ===")
+
+    text = "a" * 5000
+    chunks = split_into_chunks(text, 100)
+
+    assert "".join(chunks) == text
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    print("✅ 硬切分测试通过")
+    print()
+
+
+def test_split_into_groups():
+    """测试子导图分组"""
+    print("=== 测试分组 ===")
+
+    groups = split_into_groups(["a" * 40, "b" * 40, "c" * 40], 20)
+    assert groups == [["a" * 40, "b" * 40], ["c" * 40]]
+    print("✅ 分组测试通过")
+    print()
+
+
+def test_sections_stable_under_edits():
+    """测试分节边界由内容决定，局部修改只改变所在的分节"""
+    print("=== 测试稳定分节 ===")
+
+    paragraphs = [f"第{i}段：" + "这是正文内容。" * (10 + i % 7 * 10) for i in range(200)]
+    before = split_into_sections("\n\n".join(paragraphs), 500, 2000)
+    paragraphs[100] += "新增的一句话。"
+    after = split_into_sections("\n\n".join(paragraphs), 500, 2000)
+
+    assert len(before) > 10
+    assert all(estimate_tokens(section) <= 2000 for section in before)
+    assert len(set(after) - set(before)) == 1
+
+    # 没有空行的文本（例如SRT字幕）按行分节
+    lines = [f"第{i}条字幕" for i in range(3000)]
+    before = split_into_sections("\n".join(lines), 500, 2000)
+    lines.insert(1500, "插入的字幕")
+    after = split_into_sections("\n".join(lines), 500, 2000)
+    assert len(set(after) - set(before)) == 1
+    print(f"切分为 {len(before)} 节")
+    print("✅ 稳定分节测试通过")
+    print()
+
+
+def main():
+    """运行所有测试"""
+    print("开始文本分块测试...\n")
+
+    test_short_text_single_chunk()
+    test_split_on_headings()
+    test_hard_split_without_boundaries()
+    test_split_into_groups()
+    test_sections_stable_under_edits()
+
+    print("所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
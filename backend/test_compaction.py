@@ -0,0 +1,147 @@
+"""
+输入预处理测试脚本
+用于验证空白压缩、页眉页脚与重复字幕行的去除，以及token预算检查
+"""
+
+import os
+import sys
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core import ai_processor, compaction
+from app.core.chunking import estimate_tokens
+from app.core.compaction import TokenBudgetExceeded, check_token_budget, compact_input, compact_text
+
+
+def test_whitespace_and_repeated_lines():
+    """测试合并空白、保留列表缩进，并去掉滚动字幕产生的连续重复行"""
+    print("=== 测试空白与重复行压缩 ===")
+
+    text = "标题​\r\n\r\n\r\n\r\n- 要点   一\n    - 子要点\t\t二   \n今天我们讲\n今天我们讲\n今天我们讲\n机器学习"
+    assert compact_text(text) == "标题\n\n- 要点 一\n    - 子要点 二\n今天我们讲\n机器学习"
+    print("✅ 空白与重复行压缩测试通过")
+    print()
+
+
+def test_page_boilerplate():
+    """测试去掉每页重复的页眉页脚（页码不同也视为同一行），正文中的同名行保留"""
+    print("=== 测试页眉页脚去除 ===")
+
+    topics = ["线性回归", "逻辑回归", "决策树", "支持向量机", "神经网络"]
+    pages = [f"机器学习讲义\n{topic}的基本思想。\n常见的应用场景。\n{topic}的推导过程。\n- {n} -" for n, topic in enumerate(topics, 1)]
+    compacted = compact_text("\n\n".join(pages))
+    assert "- 3 -" not in compacted
+    assert "机器学习讲义" not in compacted
+    assert compacted.count("常见的应用场景。") == 5
+    assert compacted.startswith("线性回归的基本思想。")
+
+    # 文本块太少时不判定样板
+    two_pages = "\n\n".join(pages[:2])
+    assert compact_text(two_pages) == two_pages
+    print("✅ 页眉页脚去除测试通过")
+    print()
+
+
+def test_token_budget():
+    """测试压缩节省的token数统计与预算检查"""
+    print("=== 测试token预算 ===")
+
+    prepared = compact_input("字幕内容\n" * 100)
+    assert prepared.text == "字幕内容"
+    assert prepared.tokens == 4
+    assert prepared.saved_tokens > 0
+    print(f"节省token数: {prepared.saved_tokens}")
+
+    original_budget = compaction.INPUT_TOKEN_BUDGET
+    compaction.INPUT_TOKEN_BUDGET = 10
+    try:
+        check_token_budget(10)
+        check_token_budget(11)
+        assert False, "超过预算时应该抛出异常"
+    except TokenBudgetExceeded as e:
+        assert (e.tokens, e.budget) == (11, 10)
+        print(f"✅ 正确抛出异常: {e}")
+    finally:
+        compaction.INPUT_TOKEN_BUDGET = original_budget
+    print("✅ token预算测试通过")
+    print()
+
+
+def test_budget_covers_all_chunks():
+    """测试长文档分块生成，预算按全部分块的总量检查，分块数超过上限时同样拒绝"""
+    print("=== 测试分块生成的token预算 ===")
+
+    prompts = []
+
+    async def fake_call(prompt):
+        prompts.append(prompt)
+        return f"# 子导图{len(prompts)}"
+
+    original = (compaction.INPUT_TOKEN_BUDGET, ai_processor.CHUNK_MAX_TOKENS, ai_processor.CHUNK_MAX_COUNT, ai_processor._call_gemini_async)
+    compaction.INPUT_TOKEN_BUDGET, ai_processor.CHUNK_MAX_TOKENS = 100000, 200
+    ai_processor._call_gemini_async = fake_call
+    try:
+        text = "\n\n".join(f"# 第{i}章\n" + f"第{i}章的正文内容。" * 20 for i in range(10))
+        prepared = asyncio.run(ai_processor.prepare_input_async(text))
+        assert prepared.tokens > ai_processor.CHUNK_MAX_TOKENS
+        mindmap = asyncio.run(ai_processor.generate_mindmap_chunked_async(prepared.text))
+        # 各分块一次调用，最后合并一次
+        assert mindmap is not None and len(prompts) > 2
+        chunk_prompts = prompts[:-1]
+        assert all(estimate_tokens(p) - estimate_tokens(ai_processor.PROMPT_TEMPLATE) <= 300 for p in chunk_prompts)
+        print(f"{prepared.tokens} token的文档分 {len(chunk_prompts)} 块生成")
+
+        # 每个分块都不超过预算，但全部分块的总量超过预算
+        compaction.INPUT_TOKEN_BUDGET = prepared.tokens
+        try:
+            asyncio.run(ai_processor.prepare_input_async(text))
+            assert False, "分块总量超过预算时应该抛出异常"
+        except TokenBudgetExceeded as e:
+            assert e.tokens > e.budget == prepared.tokens
+
+        compaction.INPUT_TOKEN_BUDGET, ai_processor.CHUNK_MAX_COUNT = 0, len(chunk_prompts) - 1
+        try:
+            asyncio.run(ai_processor.prepare_input_async(text))
+            assert False, "分块数超过上限时应该抛出异常"
+        except TokenBudgetExceeded:
+            pass
+    finally:
+        compaction.INPUT_TOKEN_BUDGET, ai_processor.CHUNK_MAX_TOKENS, ai_processor.CHUNK_MAX_COUNT, ai_processor._call_gemini_async = original
+    print("✅ 分块生成的token预算测试通过")
+    print()
+
+
+def test_large_document_rejected_by_default():
+    """测试默认配置下超过请求预算的长文档被拒绝"""
+    print("=== 测试默认预算拒绝长文档 ===")
+
+    text = "\n".join(f"第{i}段：这是一段用于测试预算的课程讲义内容。" for i in range(15000))
+    try:
+        asyncio.run(ai_processor.prepare_input_async(text))
+        assert False, "超过默认预算时应该抛出异常"
+    except TokenBudgetExceeded as e:
+        assert e.budget == compaction.INPUT_TOKEN_BUDGET and e.tokens > e.budget
+        print(f"✅ 正确抛出异常: {e}")
+    print("✅ 默认预算拒绝长文档测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始输入预处理测试")
+    print("=" * 50)
+
+    test_whitespace_and_repeated_lines()
+    test_page_boilerplate()
+    test_token_budget()
+    test_budget_covers_all_chunks()
+    test_large_document_rejected_by_default()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+响应压缩测试脚本
+用于验证 Accept-Encoding 协商与压缩中间件
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from app.api.compression import CompressionMiddleware, available_encodings, negotiate_encoding
+
+
+def test_negotiate_encoding():
+    """测试按q值和服务端偏好选择编码"""
+    print("=== 测试编码协商 ===")
+
+    preferred = available_encodings()[0]
+    assert negotiate_encoding("gzip, deflate, br, zstd") == preferred
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5, zstd;q=0.5") == "gzip"
+    assert negotiate_encoding("*") == preferred
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+    print("✅ 编码协商测试通过")
+    print()
+
+
+def test_middleware_compresses_large_text():
+    """测试较大的文本响应被压缩，小响应与不支持压缩的客户端保持原样"""
+    print("=== 测试压缩中间件 ===")
+
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse("思维导图" * 1000)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip;q=1.0, br;q=0.1, zstd;q=0.1"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(("思维导图" * 1000).encode("utf-8"))
+    assert response.text == "思维导图" * 1000
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "思维导图" * 1000
+    print("✅ 压缩中间件测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始响应压缩测试")
+    print("=" * 50)
+
+    test_negotiate_encoding()
+    test_middleware_compresses_large_text()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,25 @@
 用于验证各种文件格式的解析功能
 """
 
+import io
 import os
 import sys
+import codecs
+import tempfile
 from pathlib import Path
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.core.file_parser import parse_file_content, get_supported_formats
+from app.core.file_parser import (
+    parse_file,
+    parse_file_content,
+    get_supported_formats,
+    iter_file_blocks,
+    resolve_parser,
+    DocxParser,
+    SrtParser,
+)
 
 
 def test_supported_formats():
@@ -31,7 +42,7 @@ def test_txt_parsing():
 用于测试文件解析功能。
 """
     
-    test_file_path = "test.txt"
+    test_file_path = os.path.join(tempfile.gettempdir(), "text2map_test.txt")
     with open(test_file_path, "w", encoding="utf-8") as f:
         f.write(test_content)
     
@@ -70,7 +81,7 @@ def test_md_parsing():
 **粗体文本** 和 *斜体文本*。
 """
     
-    test_file_path = "test.md"
+    test_file_path = os.path.join(tempfile.gettempdir(), "text2map_test.md")
     with open(test_file_path, "w", encoding="utf-8") as f:
         f.write(test_content)
     
@@ -108,7 +119,7 @@ def test_srt_parsing():
 这是第三行字幕内容
 """
     
-    test_file_path = "test.srt"
+    test_file_path = os.path.join(tempfile.gettempdir(), "text2map_test.srt")
     with open(test_file_path, "w", encoding="utf-8") as f:
         f.write(test_content)
     
@@ -128,6 +139,75 @@ def test_srt_parsing():
     print()
 
 
+def test_srt_rolling_captions():
+    """测试合并自动字幕的滚动重复，并按时间窗口分段"""
+    print("=== 测试滚动字幕去重与分段 ===")
+    
+    cues = [
+        ("00:00:01,000", "00:00:03,000", "<c>we are going</c>"),
+        ("00:00:03,000", "00:00:05,000", "we are going\nto talk about"),
+        ("00:00:05,000", "00:00:07,000", "to talk about\nmachine learning"),
+        ("00:00:07,000", "00:00:08,000", "machine learning"),
+        ("00:01:10,000", "00:01:11,000", "第二部分"),
+        ("00:01:11,000", "00:01:12,000", "第二部分的内容"),
+        ("00:01:12,000", "00:01:14,000", "下一句"),
+    ]
+    srt_content = "\n".join(f"{i}\n{start} --> {end}\n{text}\n" for i, (start, end, text) in enumerate(cues, 1))
+    
+    result = parse_file("rolling.srt", srt_content.encode("utf-8"))
+    assert result.text == "[00:00:01] we are going to talk about machine learning\n\n[00:01:10] 第二部分的内容下一句"
+    
+    # 不分段时逐条输出去重后的字幕
+    assert SrtParser(segment_seconds=0).parse(srt_content.encode("utf-8")).text == (
+        "we are going\nto talk about\nmachine learning\n第二部分的内容\n下一句"
+    )
+    print("✅ 滚动字幕去重与分段测试通过")
+    print()
+
+
+def test_srt_separate_cues_kept():
+    """测试时间上分开的字幕即使重复或前缀相同也不合并"""
+    print("=== 测试独立字幕不合并 ===")
+    
+    cues = [
+        ("00:00:01,000", "00:00:02,000", "好的"),
+        ("00:00:02,500", "00:00:04,000", "好的，我们开始"),
+        ("00:00:10,000", "00:00:11,000", "好的"),
+        ("00:00:20,000", "00:00:21,000", "好的"),
+    ]
+    srt_content = "\n".join(f"{i}\n{start} --> {end}\n{text}\n" for i, (start, end, text) in enumerate(cues, 1))
+    
+    assert SrtParser(segment_seconds=0).parse(srt_content.encode("utf-8")).text == "好的\n好的，我们开始\n好的\n好的"
+    print("✅ 独立字幕不合并测试通过")
+    print()
+
+
+def test_encoding_detection():
+    """测试非UTF-8文本文件的编码检测"""
+    print("=== 测试编码检测 ===")
+    
+    content = "这是一个GBK编码的测试文件。\n用于测试编码检测功能。"
+    cases = [
+        ("test_gbk.txt", content.encode("gbk"), "gb18030"),
+        ("test_utf16.md", content.encode("utf-16"), "utf-16"),
+        ("test_bom.txt", codecs.BOM_UTF8 + content.encode("utf-8"), "utf-8-sig"),
+    ]
+    
+    for filename, file_bytes, expected_encoding in cases:
+        result = parse_file(filename, file_bytes)
+        assert result.text == content, f"{filename} 解析结果不一致"
+        assert result.encoding == expected_encoding, f"{filename} 编码为 {result.encoding}"
+        print(f"{filename}: {result.encoding}")
+    
+    srt_content = "1\n00:00:01,000 --> 00:00:04,000\n第一行字幕\n\n2\n00:00:05,000 --> 00:00:08,000\n第二行字幕\n"
+    result = parse_file("test_gbk.srt", srt_content.encode("gbk"))
+    assert result.text == "[00:00:01] 第一行字幕第二行字幕"
+    assert result.encoding == "gb18030"
+    
+    print("✅ 编码检测测试通过")
+    print()
+
+
 def test_unsupported_format():
     """测试不支持的文件格式"""
     print("=== 测试不支持的文件格式 ===")
@@ -144,6 +224,75 @@ def test_unsupported_format():
     print()
 
 
+def test_streaming_blocks():
+    """测试解析器逐块输出文本，拼接结果与完整解析一致"""
+    print("=== 测试逐块输出 ===")
+    
+    srt_content = "1\n00:00:01,000 --> 00:00:04,000\n第一行字幕\n\n2\n00:01:05,000 --> 00:01:08,000\n第二行字幕\n"
+    stream = iter_file_blocks("test.srt", srt_content.encode("utf-8"))
+    assert next(stream.blocks) == "[00:00:01] 第一行字幕"
+    assert list(stream.blocks) == ["[00:01:05] 第二行字幕"]
+    
+    txt_content = "第一段\n\n第二段\n\n\n第三段\n".encode("utf-8")
+    stream = iter_file_blocks("test.txt", txt_content)
+    assert stream.join() == parse_file("test.txt", txt_content).text
+    print("✅ 逐块输出测试通过")
+    print()
+
+
+def test_content_sniffing():
+    """测试按文件头识别扩展名不符的文件"""
+    print("=== 测试内容嗅探 ===")
+    
+    assert resolve_parser("report.txt", b"%PDF-1.7\n").name == "pdf"
+    assert resolve_parser("notes.docx", b"PK\x03\x04\x14\x00").name == "docx"
+    assert resolve_parser("notes.pdf", "其实是文本".encode("utf-8")).name == "txt"
+    assert resolve_parser("notes.md", b"# title").name == "md"
+    
+    for filename, head in (("image.pdf", b"\x89PNG\r\n\x1a\n\x00\x00"), ("data.xyz", b"text")):
+        try:
+            resolve_parser(filename, head)
+            assert False, f"{filename} 应该无法解析"
+        except ValueError as e:
+            print(f"{filename}: {e}")
+    print("✅ 内容嗅探测试通过")
+    print()
+
+
+def test_docx_document_order():
+    """测试DOCX流式解析按文档顺序输出表格，合并单元格只输出一次"""
+    print("=== 测试DOCX流式解析 ===")
+    
+    from docx import Document
+    
+    document = Document()
+    document.add_paragraph("表格之前")
+    table = document.add_table(rows=2, cols=3)
+    for row_index, row in enumerate(table.rows):
+        for col_index, cell in enumerate(row.cells):
+            cell.text = f"R{row_index}C{col_index}"
+    table.cell(0, 0).merge(table.cell(1, 0))
+    table.cell(0, 1).merge(table.cell(0, 2))
+    document.add_paragraph("表格之后")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    
+    stream = DocxParser(fast_path=True).open_bytes(buffer.getvalue())
+    assert list(stream.blocks) == [
+        "表格之前", "R0C0\nR1C0", "R0C1\nR0C2", "R1C1", "R1C2", "表格之后"
+    ]
+    
+    # 没有合并单元格时与 python-docx 的结果相同
+    document = Document()
+    document.add_paragraph("段落")
+    document.add_table(rows=1, cols=2).rows[0].cells[1].text = "单元格"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    assert DocxParser(fast_path=True).parse(buffer.getvalue()) == DocxParser(fast_path=False).parse(buffer.getvalue())
+    print("✅ DOCX流式解析测试通过")
+    print()
+
+
 def main():
     """运行所有测试"""
     print("开始文件解析器测试...\n")
@@ -152,7 +301,13 @@ def main():
     test_txt_parsing()
     test_md_parsing()
     test_srt_parsing()
+    test_srt_rolling_captions()
+    test_srt_separate_cues_kept()
+    test_encoding_detection()
     test_unsupported_format()
+    test_streaming_blocks()
+    test_content_sniffing()
+    test_docx_document_order()
     
     print("所有测试完成！")
 
@@ -0,0 +1,72 @@
+"""
+后台任务测试脚本
+用于验证进程退出后遗留的未完成任务在启动或查询时被标记为失败
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core import jobs
+from app.core.jobs import JOB_FAILED, JOB_PENDING, JOB_RUNNING, JobManager, SQLAlchemyJobStore, SharedStateJobStore
+from app.core.shared_state import SQLiteSharedState
+
+
+def _job(job_id: str, status: str, age: float) -> dict:
+    updated_at = time.time() - age
+    return {
+        "id": job_id, "status": status, "stage": "queued", "progress": 0.0, "result": None,
+        "error": None, "filename": None, "created_at": updated_at, "updated_at": updated_at,
+    }
+
+
+def test_orphaned_jobs_marked_failed():
+    """测试重启后遗留的等待中/进行中任务被标记为失败，其他进程仍在刷新的任务不受影响"""
+    print("=== 测试遗留任务 ===")
+
+    stale = jobs.JOB_ORPHAN_SECONDS + 60
+
+    async def run(store):
+        manager = JobManager(store, workers=1)
+        await manager.start()
+        result = {job_id: (await manager.get(job_id))["status"] for job_id in ("orphan", "queued", "live")}
+        for task in manager._worker_tasks:
+            task.cancel()
+        return result
+
+    expected = {"orphan": JOB_FAILED, "queued": JOB_FAILED, "live": JOB_RUNNING}
+    with tempfile.TemporaryDirectory() as directory:
+        # 数据库存储可以枚举任务，启动时统一标记；共享状态存储不能枚举，查询时逐个判断
+        stores = [
+            SQLAlchemyJobStore(f"sqlite:///{os.path.join(directory, 'jobs.db')}"),
+            SharedStateJobStore(SQLiteSharedState(os.path.join(directory, "state.db"))),
+        ]
+        for store in stores:
+            store.create(_job("orphan", JOB_RUNNING, stale))
+            store.create(_job("queued", JOB_PENDING, stale))
+            store.create(_job("live", JOB_RUNNING, 1))
+            assert asyncio.run(run(store)) == expected
+            assert store.get("orphan")["status"] == JOB_FAILED and store.get("orphan")["error"]
+            print(f"{type(store).__name__}: 遗留任务已标记为失败")
+    print("✅ 遗留任务测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始后台任务测试")
+    print("=" * 50)
+
+    test_orphaned_jobs_marked_failed()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+指标测试脚本
+用于验证多进程部署时 /metrics 汇总所有工作进程的指标
+"""
+
+import os
+import sys
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 在子进程（模拟一个工作进程）中记录一次错误，最后一个进程输出汇总的指标
+_WORKER_SCRIPT = """
+import sys
+from app.core.metrics import ERRORS, metrics_payload
+ERRORS.labels("http", "500").inc()
+if sys.argv[1] == "scrape":
+    print(metrics_payload()[0].decode())
+"""
+
+
+def _run_worker(metrics_dir: str, mode: str) -> str:
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+    result = subprocess.run(
+        [sys.executable, "-c", _WORKER_SCRIPT, mode],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout
+
+
+def test_metrics_aggregate_across_workers():
+    """测试设置 PROMETHEUS_MULTIPROC_DIR 时，任一工作进程应答的 /metrics 包含所有进程的计数"""
+    print("=== 测试多进程指标汇总 ===")
+
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        _run_worker(metrics_dir, "record")
+        _run_worker(metrics_dir, "record")
+        payload = _run_worker(metrics_dir, "scrape")
+
+    assert 'text2map_errors_total{stage="http",type="500"} 3.0' in payload, payload
+    assert "text2map_rate_limit_queue_depth 0.0" in payload
+    print("✅ 多进程指标汇总测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始指标测试")
+    print("=" * 50)
+
+    test_metrics_aggregate_across_workers()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+思维导图树结构测试脚本
+用于验证Markdown思维导图解析为扁平树的功能
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.mindmap_tree import parse_mindmap
+
+
+def test_headings_and_nested_lists():
+    """测试标题按级别嵌套，列表项按缩进挂在最近的标题下"""
+    print("=== 测试标题与嵌套列表 ===")
+
+    markdown = "# 根\n## 第一部分\n- 要点一\n  - 细节\n- 要点二\n## 第二部分\n1. 步骤\n"
+    tree = parse_mindmap(markdown)
+
+    assert tree.labels() == ["根", "第一部分", "要点一", "细节", "要点二", "第二部分", "步骤"]
+    assert list(tree.parent) == [-1, 0, 1, 2, 1, 0, 5]
+    assert list(tree.depth) == [0, 1, 2, 3, 2, 1, 2]
+    assert tree.children(0) == [1, 5]
+    print("✅ 标题与嵌套列表测试通过")
+    print()
+
+
+def test_flat_serialization():
+    """测试序列化为扁平数组，并忽略代码块和空行"""
+    print("=== 测试扁平序列化 ===")
+
+    markdown = "# 标题 C#\n\n```\n# 代码\n```\n- 条目\n补充说明\n"
+    data = parse_mindmap(markdown).to_dict()
+
+    assert data == {
+        "nodes": 3,
+        "parent": [-1, 0, 1],
+        "depth": [0, 1, 2],
+        "labels": ["标题 C#", "条目", "补充说明"],
+    }
+    assert parse_mindmap("").to_dict()["nodes"] == 0
+
+    # 字幕生成的导图带有时间戳时输出各节点的起始秒数
+    data = parse_mindmap("# 讲座\n## 引言 [00:00:05]\n- 要点 [01:02:03]\n").to_dict()
+    assert data["timestamps"] == [None, 5, 3723]
+    print("✅ 扁平序列化测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始思维导图树结构测试")
+    print("=" * 50)
+
+    test_headings_and_nested_lists()
+    test_flat_serialization()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
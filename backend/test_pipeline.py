@@ -0,0 +1,81 @@
+"""
+生成流水线测试脚本
+用于验证文件输入依次经过各阶段、阶段可替换、计时钩子与分段执行，以及错误转换为状态码
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.pipeline import STAGES, PipelineContext, PipelineError, mindmap_pipeline
+
+
+async def _fake_generate(ctx: PipelineContext) -> None:
+    ctx.mindmap = "# 导图\n## " + ctx.prepared.text.splitlines()[0]
+    ctx.headers["X-Cache"] = "MISS"
+
+
+def test_file_pipeline():
+    """测试替换 generate 阶段后，文件输入经过全部阶段，钩子按顺序收到各阶段耗时并执行清理"""
+    print("=== 测试文件流水线 ===")
+
+    pipeline = mindmap_pipeline.with_stage("generate", _fake_generate)
+    with tempfile.NamedTemporaryFile(suffix=".txt", delete=False) as f:
+        f.write("机器学习\n监督学习与无监督学习。".encode("utf-8"))
+    calls = []
+    ctx = PipelineContext(filename="notes.txt", file_path=f.name, output_format="tree")
+    ctx.add_cleanup(lambda: os.unlink(f.name))
+
+    asyncio.run(pipeline.run(ctx, hooks=[lambda stage, seconds, _: calls.append(stage)]))
+    assert tuple(calls) == STAGES
+    assert ctx.parsed.encoding == "utf-8"
+    assert ctx.tree["labels"] == ["导图", "机器学习"]
+    assert ctx.headers["X-Parse-Cache"] == "MISS" and ctx.headers["X-Cache"] == "MISS"
+    assert ctx.text_hash is not None and not os.path.exists(f.name)
+    print(f"阶段耗时: { {stage: round(seconds * 1000, 2) for stage, seconds in ctx.timings.items()} }")
+
+    # 只执行到 normalize（流式接口），不调用生成
+    partial = asyncio.run(mindmap_pipeline.run(PipelineContext(text="机器学习"), until="normalize"))
+    assert partial.prepared.text == "机器学习" and partial.mindmap is None
+    print("✅ 文件流水线测试通过")
+    print()
+
+
+def test_pipeline_errors():
+    """测试输入错误转换为对应的状态码"""
+    print("=== 测试流水线错误 ===")
+
+    cases = [
+        (PipelineContext(text="   "), 400),
+        (PipelineContext(filename="a.txt"), 400),
+        (PipelineContext(filename="a.txt", upload_hash="0" * 64), 404),
+    ]
+    for ctx, status_code in cases:
+        try:
+            asyncio.run(mindmap_pipeline.run(ctx))
+            assert False, "应该抛出异常"
+        except PipelineError as e:
+            assert e.status_code == status_code, (e.status_code, str(e))
+            print(f"✅ {status_code}: {e}")
+    print("✅ 流水线错误测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始生成流水线测试")
+    print("=" * 50)
+
+    test_file_pipeline()
+    test_pipeline_errors()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
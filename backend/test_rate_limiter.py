@@ -0,0 +1,171 @@
+"""
+Gemini 限流与重试测试脚本
+用于验证令牌桶定速、按客户端公平排队以及错误重试行为
+"""
+
+import os
+import sys
+import uuid
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as core_exceptions
+
+from app.api import routes
+from app.core import rate_limiter
+from app.core.gemini_client import gemini_client
+from app.core.rate_limiter import GeminiRateLimiter, GeminiUnavailableError, call_with_retry
+
+
+def test_token_bucket_paces_requests():
+    """测试令牌耗尽后按速率放行"""
+    print("=== 测试令牌桶 ===")
+
+    limiter = GeminiRateLimiter(rpm=0, tpm=6000)  # 每秒补充100个token
+
+    async def run():
+        await limiter.acquire(6000)
+        start = asyncio.get_running_loop().time()
+        await limiter.acquire(20)
+        return asyncio.get_running_loop().time() - start
+
+    waited = asyncio.run(run())
+    assert 0.1 <= waited < 1.0
+    assert limiter.stats()["waited"] == 1
+    print(f"等待 {waited * 1000:.0f} ms")
+    print("✅ 令牌桶测试通过")
+    print()
+
+
+def test_fair_queueing_between_clients():
+    """测试突发请求较多的客户端不会饿死其他客户端"""
+    print("=== 测试公平排队 ===")
+
+    limiter = GeminiRateLimiter(rpm=1200, tpm=0)
+    limiter._request_bucket.tokens = 0
+    order = []
+
+    async def request(client_id):
+        await limiter.acquire(1, client_id)
+        order.append(client_id)
+
+    async def run():
+        tasks = [asyncio.create_task(request("heavy")) for _ in range(6)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request("light")) for _ in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order.index("light") <= 2
+    assert order[-1] == "heavy"
+    print(f"放行顺序: {order}")
+    print("✅ 公平排队测试通过")
+    print()
+
+
+class _FakeResponse:
+    text = "# 导图"
+
+
+class _FakeModel:
+    async def generate_content_async(self, prompt, **kwargs):
+        return _FakeResponse()
+
+
+def test_client_id_bound_per_request():
+    """测试经路由发起的请求按 X-API-Key 区分客户端，限流器收到各自的客户端标识"""
+    print("=== 测试请求的客户端标识 ===")
+
+    limiter = rate_limiter.gemini_rate_limiter
+    original_acquire, original_model = limiter.acquire, gemini_client.acquire
+    seen = []
+
+    async def acquire(tokens, client_id="anonymous", deadline=None):
+        seen.append(client_id)
+
+    limiter.acquire = acquire
+    gemini_client.acquire = lambda: _FakeModel()
+    try:
+        app = FastAPI()
+        app.include_router(routes.router)
+        client = TestClient(app)
+        for key in ("alice", "bob"):
+            # 每次使用不同的文本，避免命中缓存而不调用模型
+            text = f"{key}的课堂笔记 {uuid.uuid4().hex}"
+            response = client.post("/generate", json={"text": text}, headers={"X-API-Key": key})
+            assert response.status_code == 200, response.text
+    finally:
+        limiter.acquire, gemini_client.acquire = original_acquire, original_model
+    assert seen == ["alice", "bob"], seen
+    print(f"限流器收到的客户端标识: {seen}")
+    print("✅ 请求的客户端标识测试通过")
+    print()
+
+
+def test_retry_and_give_up():
+    """测试临时性错误重试成功，配额错误重试用尽后返回429，其他错误不重试"""
+    print("=== 测试重试 ===")
+
+    saved = rate_limiter.GEMINI_RETRY_BASE_DELAY, rate_limiter.GEMINI_QUOTA_BACKOFF
+    rate_limiter.GEMINI_RETRY_BASE_DELAY = 0.01
+    rate_limiter.GEMINI_QUOTA_BACKOFF = 0.01
+    try:
+        _check_retry_and_give_up()
+    finally:
+        rate_limiter.GEMINI_RETRY_BASE_DELAY, rate_limiter.GEMINI_QUOTA_BACKOFF = saved
+    print("✅ 重试测试通过")
+    print()
+
+
+def _check_retry_and_give_up():
+    limiter = GeminiRateLimiter(rpm=0, tpm=0)
+
+    def flaky(errors):
+        calls = []
+
+        async def send():
+            calls.append(1)
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+        return send, calls
+
+    send, calls = flaky([core_exceptions.ServiceUnavailable("down")])
+    assert asyncio.run(call_with_retry(send, 10, limiter)) == "ok"
+    assert len(calls) == 2
+
+    send, calls = flaky([core_exceptions.ResourceExhausted("quota")] * 10)
+    try:
+        asyncio.run(call_with_retry(send, 10, limiter))
+        assert False, "应当抛出 GeminiUnavailableError"
+    except GeminiUnavailableError as e:
+        assert e.status_code == 429
+    assert len(calls) == rate_limiter.GEMINI_RETRY_MAX_ATTEMPTS
+
+    send, calls = flaky([core_exceptions.InvalidArgument("bad")])
+    try:
+        asyncio.run(call_with_retry(send, 10, limiter))
+        assert False, "应当抛出 InvalidArgument"
+    except core_exceptions.InvalidArgument:
+        pass
+    assert len(calls) == 1
+
+
+def main():
+    """运行所有测试"""
+    print("开始限流与重试测试...\n")
+
+    test_token_bucket_paces_requests()
+    test_fair_queueing_between_clients()
+    test_client_id_bound_per_request()
+    test_retry_and_give_up()
+
+    print("所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+共享状态测试脚本
+用于验证SQLite共享状态在多个连接（模拟多个工作进程）之间的令牌桶与键值存取，
+以及限流器、思维导图缓存和任务存储经共享状态协同工作
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.cache import MindmapCache
+from app.core.jobs import SharedStateJobStore
+from app.core.rate_limiter import GeminiRateLimiter
+from app.core.text_store import ExtractedTextStore
+from app.core.shared_state import BucketDemand, InProcessSharedState, SQLiteSharedState, create_shared_state
+
+
+def test_sqlite_token_buckets():
+    """测试两个连接共用令牌桶：任一桶不足时整体不扣减，键值过期后读不到"""
+    print("=== 测试SQLite共享令牌桶 ===")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.db")
+        first, second = SQLiteSharedState(path), SQLiteSharedState(path)
+        requests = BucketDemand("requests", 1, capacity=2, rate=0.001)
+        tokens = BucketDemand("tokens", 400, capacity=1000, rate=0.001)
+
+        assert first.take_tokens([requests, tokens]) == 0
+        assert second.take_tokens([requests, tokens]) == 0
+        # 请求桶已空，token桶还剩200：整体拒绝，token桶不被扣减
+        assert second.take_tokens([requests, tokens]) > 0
+        assert first.take_tokens([tokens._replace(amount=200)]) == 0
+        assert first.take_tokens([tokens._replace(amount=1)]) > 0
+
+        first.set("mindmap", "key", "值", ttl=0.05)
+        assert second.get("mindmap", "key") == "值"
+        time.sleep(0.1)
+        assert second.get("mindmap", "key") is None
+
+    memory = create_shared_state("memory://")
+    assert isinstance(memory, InProcessSharedState) and not memory.shared
+    assert memory.take_tokens([requests, requests._replace(name="other")]) == 0
+    print("✅ SQLite共享令牌桶测试通过")
+    print()
+
+
+def test_components_share_state():
+    """测试两个“工作进程”的限流器共用配额，缓存、任务状态与提取文本互相可见"""
+    print("=== 测试组件共享状态 ===")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.db")
+        first, second = SQLiteSharedState(path), SQLiteSharedState(path)
+
+        limiter_a = GeminiRateLimiter(rpm=0, tpm=6000, state=first)
+        limiter_b = GeminiRateLimiter(rpm=0, tpm=6000, state=second)
+        assert limiter_a._try_admit(6000) == 0
+        delay = limiter_b._try_admit(3000)
+        assert 25 < delay <= 30, delay
+        print(f"另一进程的限流器需等待: {delay:.1f}s")
+
+        limiter_a.penalize(5)
+        assert limiter_b._try_admit(1) > 4
+
+        cache_a = MindmapCache(state=first)
+        cache_b = MindmapCache(state=second)
+        cache_a.set("key", "# 导图")
+        assert cache_b.get("key") == "# 导图"
+
+        store_a, store_b = SharedStateJobStore(first), SharedStateJobStore(second)
+        store_a.create({"id": "job1", "status": "pending", "updated_at": 0.0})
+        store_a.update("job1", status="succeeded")
+        assert store_b.get("job1")["status"] == "succeeded"
+        assert store_b.get("missing") is None
+
+        text_hash = ExtractedTextStore(state=first).put("提取的文本")
+        assert ExtractedTextStore(state=second).get(text_hash) == "提取的文本".encode("utf-8")
+
+        # 两个进程并发更新同一任务的不同字段，互不覆盖
+        threads = [
+            threading.Thread(target=lambda: [store_a.update("job1", progress=i / 100) for i in range(50)]),
+            threading.Thread(target=lambda: [store_b.update("job1", **{f"f{i}": i}) for i in range(50)]),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        job = store_a.get("job1")
+        assert job["progress"] == 0.49 and all(job[f"f{i}"] == i for i in range(50))
+    print("✅ 组件共享状态测试通过")
+    print()
+
+
+class _SlowState(InProcessSharedState):
+    """每次访问都阻塞一段时间的共享状态，模拟数据库锁竞争"""
+
+    shared = True
+
+    def get(self, namespace, key):
+        time.sleep(0.2)
+        return super().get(namespace, key)
+
+    def set(self, namespace, key, value, ttl=None):
+        time.sleep(0.2)
+        super().set(namespace, key, value, ttl)
+
+    def take_tokens(self, demands):
+        time.sleep(0.2)
+        return super().take_tokens(demands)
+
+
+def test_shared_state_off_event_loop():
+    """测试限流器与缓存访问共享状态时不阻塞事件循环"""
+    print("=== 测试共享状态不阻塞事件循环 ===")
+
+    state = _SlowState()
+    limiter = GeminiRateLimiter(rpm=60, tpm=0, state=state)
+    cache = MindmapCache(state=state)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await limiter.acquire(1)
+        await cache.set_async("key", "# 导图")
+        cache._memory.clear()
+        assert await cache.get_async("key") == "# 导图"
+        task.cancel()
+        return ticks
+
+    ticks = asyncio.run(run())
+    # 三次阻塞访问共约0.8秒，期间事件循环应持续运行
+    assert ticks > 30, ticks
+    print(f"共享状态访问期间事件循环运行了 {ticks} 次")
+    print("✅ 共享状态不阻塞事件循环测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始共享状态测试")
+    print("=" * 50)
+
+    test_sqlite_token_buckets()
+    test_components_share_state()
+    test_shared_state_off_event_loop()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
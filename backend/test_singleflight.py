@@ -0,0 +1,146 @@
+"""
+请求合并测试脚本
+用于验证相同键的并发调用共享一次执行、异常传播与取消行为
+"""
+
+import os
+import sys
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_result():
+    """测试并发的相同调用只执行一次，不同键互不影响"""
+    print("=== 测试并发合并 ===")
+
+    calls = []
+
+    async def run():
+        flight = SingleFlight()
+
+        async def generate(key):
+            calls.append(key)
+            await asyncio.sleep(0.05)
+            return f"result-{key}"
+
+        results = await asyncio.gather(
+            *(flight.do("a", lambda: generate("a")) for _ in range(10)),
+            flight.do("b", lambda: generate("b")),
+        )
+        assert flight.in_flight() == 0
+        return results
+
+    results = asyncio.run(run())
+    assert results == ["result-a"] * 10 + ["result-b"]
+    assert sorted(calls) == ["a", "b"]
+    print("✅ 并发合并测试通过")
+    print()
+
+
+def test_error_propagates_to_all_waiters():
+    """测试执行失败时所有等待者得到同一异常，之后的调用重新执行"""
+    print("=== 测试异常传播 ===")
+
+    async def run():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        async def succeed():
+            return "ok"
+
+        assert await flight.do("k", succeed) == "ok"
+
+    asyncio.run(run())
+    print("✅ 异常传播测试通过")
+    print()
+
+
+def test_cancel_when_all_waiters_leave():
+    """测试部分等待者取消不影响其他等待者，全部取消时取消上游调用"""
+    print("=== 测试取消 ===")
+
+    async def run():
+        flight = SingleFlight()
+        upstream_cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream_cancelled.set()
+                raise
+
+        first = asyncio.create_task(flight.do("k", slow))
+        second = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not upstream_cancelled.is_set()
+        assert not second.done()
+
+        second.cancel()
+        await asyncio.wait_for(upstream_cancelled.wait(), 1)
+
+    asyncio.run(run())
+    print("✅ 取消测试通过")
+    print()
+
+
+def test_rejoin_after_cancel():
+    """测试全部等待者取消后，上游任务结束之前到来的新调用重新执行，不会收到取消异常"""
+    print("=== 测试取消后重新加入 ===")
+
+    async def run():
+        flight = SingleFlight()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                # 上游取消时的清理也需要时间
+                await asyncio.sleep(0.05)
+                raise
+
+        async def fresh():
+            return "fresh"
+
+        first = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        try:
+            await first
+        except asyncio.CancelledError:
+            pass
+
+        assert await flight.do("k", fresh) == "fresh"
+
+    asyncio.run(run())
+    print("✅ 取消后重新加入测试通过")
+    print()
+
+
+def main():
+    """运行所有测试"""
+    print("开始请求合并测试...\n")
+
+    test_concurrent_calls_share_result()
+    test_error_propagates_to_all_waiters()
+    test_cancel_when_all_waiters_leave()
+    test_rejoin_after_cancel()
+
+    print("所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+启动开销测试脚本
+在全新的子进程中导入应用，验证重型依赖不会在启动时被导入，并输出导入耗时
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from bench_import import import_once
+from app.core.file_parser import PARSER_REGISTRY, get_supported_formats, preload_parsers
+
+
+def test_heavy_modules_are_lazy():
+    """测试导入 main 与 API 路由时不加载 Gemini SDK、解析库和 SQLAlchemy"""
+    print("=== 测试延迟导入 ===")
+
+    for target in ("main", "app.api.routes"):
+        result = import_once(target)
+        print(f"{target} 导入耗时: {result['total_ms']:.0f} ms")
+        assert result["loaded_lazy_modules"] == [], result["loaded_lazy_modules"]
+    print("✅ 延迟导入测试通过")
+    print()
+
+
+def test_supported_formats_without_import():
+    """测试不导入解析库也能准确列出支持的格式，预热后可解析同样的格式"""
+    print("=== 测试支持格式 ===")
+
+    formats = get_supported_formats()
+    assert set(formats) <= set(PARSER_REGISTRY)
+    assert {".txt", ".md"} <= set(formats)
+    assert preload_parsers() == formats
+    print(f"支持的格式: {formats}")
+    print("✅ 支持格式测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始启动开销测试")
+    print("=" * 50)
+
+    test_heavy_modules_are_lazy()
+    test_supported_formats_without_import()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()
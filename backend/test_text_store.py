@@ -0,0 +1,101 @@
+"""
+解析结果存储测试脚本
+用于验证按上传文件哈希保存的解析结果、磁盘淘汰，以及免上传的预检查接口
+"""
+
+import os
+import sys
+import hashlib
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import routes
+from app.core import pipeline
+from app.core.file_parser import ParseResult
+from app.core.text_store import DiskBlobStore, InMemoryBlobStore, ParsedTextStore
+
+
+def test_parsed_text_store():
+    """测试解析结果按哈希、扩展名和解析器版本存取，磁盘超出上限时淘汰最久未使用的条目"""
+    print("=== 测试解析结果存储 ===")
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = DiskBlobStore(directory, max_bytes=4096)
+        store = ParsedTextStore(backend, "v1")
+        upload_hash = hashlib.sha256(b"lecture").hexdigest()
+
+        store.put(upload_hash, "lecture.srt", ParseResult("字幕" * 100, "gb18030"), 1234)
+        stored = store.get(upload_hash, "LECTURE.SRT")
+        assert stored.parsed == ParseResult("字幕" * 100, "gb18030")
+        assert stored.file_size == 1234
+
+        # 扩展名或解析器版本不同时不命中
+        assert store.get(upload_hash, "lecture.txt") is None
+        assert ParsedTextStore(backend, "v2").get(upload_hash, "lecture.srt") is None
+
+        # 不可压缩的大条目写满后淘汰最早的条目
+        for index in range(10):
+            store.put(hashlib.sha256(str(index).encode()).hexdigest(), "a.txt", ParseResult(os.urandom(400).hex(), None), 1)
+        assert not store.contains(upload_hash, "lecture.srt")
+        assert store.contains(hashlib.sha256(b"9").hexdigest(), "a.txt")
+        assert sum(os.path.getsize(path) for path in backend._iter_files()) <= 4096
+
+    # 反复覆盖同一个键时，总大小按替换后的文件计，不会累加到超出上限而提前淘汰其他条目
+    with tempfile.TemporaryDirectory() as directory:
+        backend = DiskBlobStore(directory, max_bytes=4096)
+        backend.put("aa" * 32, b"x" * 1000)
+        for _ in range(5):
+            backend.put("bb" * 32, b"y" * 1000)
+        assert backend.contains("aa" * 32)
+        assert backend._total_bytes == 2000
+    print("✅ 解析结果存储测试通过")
+    print()
+
+
+def test_upload_precheck():
+    """测试 HEAD /uploads/{hash} 预检查，以及只提交哈希时未知文件返回404"""
+    print("=== 测试免上传预检查 ===")
+
+    original_store = routes.parsed_text_store
+    store = ParsedTextStore(InMemoryBlobStore(1024 * 1024), "v1")
+    routes.parsed_text_store = pipeline.parsed_text_store = store
+    try:
+        app = FastAPI()
+        app.include_router(routes.router)
+        client = TestClient(app)
+
+        upload_hash = hashlib.sha256(b"notes").hexdigest()
+        assert client.head(f"/uploads/{upload_hash}", params={"filename": "notes.txt"}).status_code == 404
+        store.put(upload_hash, "notes.txt", ParseResult("笔记", "utf-8"), 5)
+        assert client.head(f"/uploads/{upload_hash}", params={"filename": "notes.txt"}).status_code == 200
+        assert client.head("/uploads/not-a-hash", params={"filename": "notes.txt"}).status_code == 400
+
+        unknown = hashlib.sha256(b"other").hexdigest()
+        response = client.post("/generate-from-file", data={"upload_hash": unknown, "filename": "other.txt"})
+        assert response.status_code == 404, response.text
+        print(f"✅ 未知哈希: {response.json()['detail']}")
+    finally:
+        routes.parsed_text_store = pipeline.parsed_text_store = original_store
+    print("✅ 免上传预检查测试通过")
+    print()
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始解析结果存储测试")
+    print("=" * 50)
+
+    test_parsed_text_store()
+    test_upload_precheck()
+
+    print("=" * 50)
+    print("🎉 测试完成！")
+
+
+if __name__ == "__main__":
+    main()